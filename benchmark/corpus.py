@@ -0,0 +1,346 @@
+"""
+合成笔记语料：按块数随机生成段落、标题、图片、代码块、表格、列表，
+再分别渲染为 XML、Json 和 17 年以前的 HTML 笔记，三种格式内容一致，便于比较转换速度
+"""
+import hashlib
+import json
+import random
+import xml.etree.ElementTree as ET
+from html import escape
+
+XML_NAMESPACE = "http://note.youdao.com"
+FORMATS = ("xml", "json", "html")
+
+WORDS = (
+    "有道云笔记",
+    "导出",
+    "同步",
+    "目录",
+    "图片",
+    "表格",
+    "代码",
+    "标题",
+    "列表",
+    "链接",
+    "MarkDown",
+    "Python",
+    "requests",
+    "cookies",
+    "config.json",
+    "API",
+    "note",
+    "HTTP",
+    "本地",
+    "上传",
+    "下载",
+    "转换",
+    "格式",
+    "内容",
+    "文件",
+    "更新",
+    "时间",
+    "脚本",
+)
+LANGUAGES = ("python", "java", "javascript", "shell", "json", "")
+CODE_LINES = (
+    "def {0}(path):",
+    "    with open(path, 'rb') as f:",
+    "        data_{0} = f.read()",
+    "    if not data_{0}:",
+    "        return None",
+    "    return json.loads(data_{0})  # {1}",
+    "for item in items_{0}:",
+    "    logging.info('%s %s', item, {1!r})",
+)
+# 块类型及权重，接近普通笔记中各类块的比例
+BLOCK_WEIGHTS = (
+    ("para", 45),
+    ("list-item", 20),
+    ("heading", 10),
+    ("code", 9),
+    ("image", 9),
+    ("table", 7),
+)
+UNORDERED_LIST_ID = "uNoR-1640522620425"
+ORDERED_LIST_ID = "oRdR-1640522620426"
+
+
+def _sentence(rand: random.Random, min_words=3, max_words=12) -> str:
+    return " ".join(
+        rand.choice(WORDS) for _ in range(rand.randint(min_words, max_words))
+    )
+
+
+def _url(rand: random.Random, n: int) -> str:
+    md5 = hashlib.md5(str(rand.random()).encode()).hexdigest()
+    return "https://note.youdao.com/yws/res/{}/WEBRESOURCE{}".format(n, md5)
+
+
+def _make_block(rand: random.Random, kind: str, index: int) -> dict:
+    if kind == "para":
+        # 段落由若干段文本组成，style 为 None、b（粗体）、i（斜体）或 li（链接）
+        runs = []
+        for _ in range(rand.randint(1, 6)):
+            style = rand.choice((None, None, None, "b", "i", "li"))
+            runs.append(
+                {
+                    "text": _sentence(rand, 1, 8),
+                    "style": style,
+                    "url": "https://example.com/{}".format(index)
+                    if style == "li"
+                    else "",
+                }
+            )
+        return {"kind": kind, "runs": runs}
+    if kind == "heading":
+        return {
+            "kind": kind,
+            "level": rand.randint(1, 4),
+            "text": _sentence(rand, 1, 4),
+        }
+    if kind == "list-item":
+        return {"kind": kind, "ordered": rand.random() < 0.3, "text": _sentence(rand)}
+    if kind == "code":
+        start = rand.randrange(len(CODE_LINES))
+        lines = [
+            CODE_LINES[(start + i) % len(CODE_LINES)].format(
+                "f{}".format(index), rand.choice(WORDS)
+            )
+            for i in range(rand.randint(3, 30))
+        ]
+        return {"kind": kind, "language": rand.choice(LANGUAGES), "lines": lines}
+    if kind == "image":
+        return {"kind": kind, "url": _url(rand, index), "text": _sentence(rand, 0, 3)}
+    # 表格
+    column_count = rand.randint(2, 5)
+    rows = [
+        [
+            _sentence(rand, 1, 3) if rand.random() < 0.9 else ""
+            for _ in range(column_count)
+        ]
+        for _ in range(rand.randint(2, 8))
+    ]
+    return {"kind": kind, "rows": rows}
+
+
+def make_blocks(block_count: int, seed=0) -> list:
+    """
+    随机生成指定数量的块，相同 seed 生成的块相同
+    :param block_count: 块数
+    :param seed: 随机数种子
+    :return: 块列表，每个块为包含 kind 的字典
+    """
+    rand = random.Random(seed)
+    kinds = [kind for kind, _ in BLOCK_WEIGHTS]
+    weights = [weight for _, weight in BLOCK_WEIGHTS]
+    return [
+        _make_block(rand, kind, index)
+        for index, kind in enumerate(rand.choices(kinds, weights, k=block_count))
+    ]
+
+
+def _co_id(index: int) -> str:
+    return "{:04x}-{}".format(index % 0xFFFF, 1640522620433 + index)
+
+
+def render_xml(blocks: list) -> bytes:
+    """渲染为 XML 笔记，结构与有道云笔记一致"""
+
+    def sub(parent, tag, text=None, attrib=None):
+        element = ET.SubElement(parent, "{%s}%s" % (XML_NAMESPACE, tag), attrib or {})
+        element.text = text
+        return element
+
+    def sub_common(parent, index, text):
+        sub(parent, "coId", _co_id(index))
+        sub(parent, "text", text)
+
+    ET.register_namespace("", XML_NAMESPACE)
+    note_element = ET.Element(
+        "{%s}note" % XML_NAMESPACE,
+        {"file-version": "0", "schema-version": "1.0.3"},
+    )
+    head_element = sub(note_element, "head")
+    sub(head_element, "list", attrib={"id": UNORDERED_LIST_ID, "type": "unordered"})
+    sub(head_element, "list", attrib={"id": ORDERED_LIST_ID, "type": "ordered"})
+    body_element = sub(note_element, "body")
+    for index, block in enumerate(blocks):
+        kind = block["kind"]
+        if kind == "para":
+            element = sub(body_element, "para")
+            sub_common(element, index, "".join(run["text"] for run in block["runs"]))
+            inline_styles = sub(element, "inline-styles")
+            offset = 0
+            for run in block["runs"]:
+                style = {"b": "bold", "i": "italic", "li": "href"}.get(run["style"])
+                if style:
+                    style_element = sub(inline_styles, style)
+                    sub(style_element, "from", str(offset))
+                    sub(style_element, "to", str(offset + len(run["text"])))
+                    sub(style_element, "value", run["url"] or "true")
+                offset += len(run["text"])
+        elif kind == "heading":
+            element = sub(
+                body_element, "heading", attrib={"level": str(block["level"])}
+            )
+            sub_common(element, index, block["text"])
+            sub(element, "inline-styles")
+        elif kind == "list-item":
+            list_id = ORDERED_LIST_ID if block["ordered"] else UNORDERED_LIST_ID
+            element = sub(
+                body_element, "list-item", attrib={"level": "1", "list-id": list_id}
+            )
+            sub_common(element, index, block["text"])
+            sub(element, "inline-styles")
+        elif kind == "code":
+            element = sub(body_element, "code")
+            sub_common(element, index, "\n".join(block["lines"]) + "\n")
+            sub(element, "inline-styles")
+            sub(element, "language", block["language"])
+            sub(element, "theme", "default")
+        elif kind == "image":
+            element = sub(body_element, "image")
+            sub(element, "coId", _co_id(index))
+            sub(element, "source", block["url"])
+            sub(element, "text", block["text"])
+        else:
+            element = sub(body_element, "table")
+            sub(element, "coId", _co_id(index))
+            column_count = len(block["rows"][0])
+            content = {
+                "cells": [{"value": text} for row in block["rows"] for text in row],
+                "heights": [40] * len(block["rows"]),
+                "widths": [220] * column_count,
+            }
+            sub(element, "content", json.dumps(content, ensure_ascii=False))
+        sub(element, "styles")
+    return ET.tostring(note_element, encoding="utf-8", xml_declaration=True)
+
+
+def render_json(blocks: list) -> bytes:
+    """渲染为 Json 笔记，3 为 id，4 为信息，5 为内容，6 为类型，7 为文本段，8 为文本，9 为属性"""
+
+    def text_content(index, text, attrs=None):
+        seven_content = {"8": text}
+        if attrs:
+            seven_content["9"] = attrs
+        return {"2": "2", "3": _co_id(index), "7": [seven_content]}
+
+    contents = []
+    for index, block in enumerate(blocks):
+        kind = block["kind"]
+        content = {"3": _co_id(index), "4": {"version": 1}}
+        if kind == "para":
+            five_contents = []
+            for run in block["runs"]:
+                if run["style"] == "li":
+                    five_contents.append(
+                        {
+                            "4": {"hf": run["url"]},
+                            "5": [text_content(index, run["text"])],
+                            "6": "li",
+                        }
+                    )
+                else:
+                    attrs = [{"2": run["style"]}] if run["style"] else None
+                    five_contents.append(text_content(index, run["text"], attrs))
+            content["5"] = five_contents
+        elif kind == "heading":
+            content["4"]["l"] = "h{}".format(block["level"])
+            content["5"] = [text_content(index, block["text"])]
+            content["6"] = "h"
+        elif kind == "list-item":
+            content["4"].update(
+                {
+                    "li": ORDERED_LIST_ID if block["ordered"] else UNORDERED_LIST_ID,
+                    "ll": 1,
+                    "lt": "ordered" if block["ordered"] else "unordered",
+                }
+            )
+            content["5"] = [text_content(index, block["text"])]
+            content["6"] = "l"
+        elif kind == "code":
+            content["4"].update({"la": block["language"], "th": "default"})
+            content["5"] = [
+                {"3": _co_id(index), "5": [text_content(index, line)], "6": "cl"}
+                for line in block["lines"]
+            ]
+            content["6"] = "cd"
+        elif kind == "image":
+            content["4"]["u"] = block["url"]
+            content["6"] = "im"
+        else:
+            content["5"] = [
+                {
+                    "5": [
+                        {
+                            "5": [{"5": [text_content(index, text) if text else {}]}],
+                            "6": "tc",
+                        }
+                        for text in row
+                    ],
+                    "6": "tr",
+                }
+                for row in block["rows"]
+            ]
+            content["6"] = "t"
+        contents.append(content)
+    json_data = {"2": "1", "3": _co_id(len(blocks)), "4": {"version": 1}, "5": contents}
+    return json.dumps(json_data, ensure_ascii=False).encode("utf-8")
+
+
+def render_html(blocks: list) -> bytes:
+    """渲染为 17 年以前的 HTML 笔记，与旧笔记一样含有 <br>，不是合法的 XML"""
+    parts = []
+    for block in blocks:
+        kind = block["kind"]
+        if kind == "para":
+            runs = []
+            for run in block["runs"]:
+                text = escape(run["text"])
+                if run["style"] == "b":
+                    text = "<b>{}</b>".format(text)
+                elif run["style"] == "i":
+                    text = "<i>{}</i>".format(text)
+                elif run["style"] == "li":
+                    text = '<a href="{}">{}</a>'.format(run["url"], text)
+                runs.append(text)
+            parts.append("<div>{}<br></div>".format("".join(runs)))
+        elif kind == "heading":
+            parts.append(
+                "<h{0}>{1}</h{0}>".format(block["level"], escape(block["text"]))
+            )
+        elif kind == "list-item":
+            tag = "ol" if block["ordered"] else "ul"
+            parts.append("<{0}><li>{1}</li></{0}>".format(tag, escape(block["text"])))
+        elif kind == "code":
+            parts.append("<pre>{}</pre>".format(escape("\n".join(block["lines"]))))
+        elif kind == "image":
+            parts.append(
+                '<div><img src="{}" alt="{}"><br></div>'.format(
+                    block["url"], escape(block["text"])
+                )
+            )
+        else:
+            rows = "".join(
+                "<tr>{}</tr>".format(
+                    "".join("<td>{}</td>".format(escape(text)) for text in row)
+                )
+                for row in block["rows"]
+            )
+            parts.append("<table>{}</table>".format(rows))
+    return "".join(parts).encode("utf-8")
+
+
+RENDERERS = {"xml": render_xml, "json": render_json, "html": render_html}
+
+
+def make_corpus_note(note_format: str, block_count: int, seed=0) -> bytes:
+    """
+    生成指定格式、指定块数的合成笔记
+    :param note_format: xml、json 或 html
+    :param block_count: 块数
+    :param seed: 随机数种子，相同参数生成的笔记相同
+    :return: 笔记字节码
+    """
+    return RENDERERS[note_format](make_blocks(block_count, seed))
@@ -0,0 +1,73 @@
+"""
+markdown 格式清理基准：逐条 re.sub 全文替换 vs 逐行扫描一次
+python benchmark/covert_clean_format.py [块数] [重复次数]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.notes import make_json_note
+from core.covert import YoudaoNoteConvert
+
+
+def legacy_clean_markdown_format(content: str) -> str:
+    """改为逐行扫描前的实现，7 次全文 re.sub"""
+
+    def clean_heading_bold(match):
+        return f"{match.group(1)} {match.group(2).replace('**', '')}"
+
+    content = re.sub(
+        r"^(#{1,6})\s+(.+)$", clean_heading_bold, content, flags=re.MULTILINE
+    )
+    content = re.sub(r"\*\*([^*]+):\s*\*\*\s*\[", r"**\1:** [", content)
+    content = re.sub(r"\*\*\*\*", "**", content)
+    content = re.sub(r"\*\*([^*\n]+)\*\*([^*\s\n]+?)\*\*", r"**\1\2**", content)
+    content = re.sub(r"([^\n`#\-*])\n\n(## [^#])", r"\1<br><br>\n\n\2", content)
+    content = re.sub(r"([^\n`#\-*])\n\n(### [^#])", r"\1<br>\n\n\2", content)
+    content = re.sub(r"([^\n`#\-*])\n\n(#### [^#])", r"\1<br>\n\n\2", content)
+    return content
+
+
+def make_cases(block_count):
+    """Json 笔记转换后、清理前的内容；块之间分别以 \\r\\n\\r\\n 和 \\n\\n 分隔"""
+    content = YoudaoNoteConvert._json_to_markdown_content(
+        make_json_note(block_count).decode("utf-8")
+    )
+    return [
+        ("{} 个块（\\r\\n 换行）".format(block_count), content),
+        ("{} 个块（\\n 换行）".format(block_count), content.replace("\r\n", "\n")),
+    ]
+
+
+def main():
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print("取 {} 次中最快的一次".format(number))
+    for name, content in make_cases(block_count):
+        # 测试笔记中没有跨行的粗体，代码块中也没有需要清理的内容，结果应一致
+        expected = legacy_clean_markdown_format(content)
+        assert YoudaoNoteConvert._clean_markdown_format(content) == expected
+        before = min(
+            timeit.repeat(
+                lambda: legacy_clean_markdown_format(content), number=1, repeat=number
+            )
+        )
+        after = min(
+            timeit.repeat(
+                lambda: YoudaoNoteConvert._clean_markdown_format(content),
+                number=1,
+                repeat=number,
+            )
+        )
+        print(
+            "{}：re.sub {:.1f} ms，逐行扫描 {:.1f} ms，提升 {:.1%}".format(
+                name, before * 1000, after * 1000, 1 - after / before
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+笔记块分发基准：逐块拼接方法名、getattr 查找转换函数 vs 预先生成的转换函数表
+python benchmark/covert_dispatch.py [块数] [重复次数]
+"""
+import json
+import os
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.notes import make_json_note, make_xml_note
+from core.covert import JsonConvert, XmlElementConvert, YoudaoNoteConvert
+
+
+def legacy_xml_to_markdown(content: bytes) -> str:
+    """改为查表前的 XML 转换流程，每个元素都拼接方法名并 getattr"""
+    note_element = ET.fromstring(content)
+    list_item = {}
+    for child in note_element[0]:
+        if "list" in child.tag:
+            list_item[child.attrib["id"]] = child.attrib["type"]
+    new_content_list = []
+    for element in list(note_element[1]):
+        text = XmlElementConvert.get_text_by_key(list(element))
+        name = element.tag.replace("{http://note.youdao.com}", "").replace("-", "_")
+        convert_func = getattr(XmlElementConvert, "convert_{}_func".format(name), None)
+        if not convert_func:
+            new_content_list.append(text)
+            continue
+        new_content_list.append(
+            convert_func(text=text, element=element, list_item=list_item)
+        )
+    return "\r\n\r\n".join(new_content_list)
+
+
+def table_xml_to_markdown(content: bytes) -> str:
+    """查表的 XML 转换流程，与 legacy_xml_to_markdown 一样整篇解析，只比较转换函数的查找方式"""
+    return YoudaoNoteConvert._xml_tree_to_markdown(ET.fromstring(content))
+
+
+def legacy_json_to_markdown_content(content: str) -> str:
+    """改为查表前的 Json 转换流程，每个块都新建 JsonConvert 并 getattr"""
+    new_content_list = []
+    for block in json.loads(content)["5"]:
+        type = block.get("6")
+        if type:
+            convert_func = getattr(JsonConvert(), "convert_{}_func".format(type), None)
+            if not convert_func:
+                line_content = JsonConvert().convert_text_func(block)
+            else:
+                line_content = convert_func(block)
+        else:
+            line_content = JsonConvert().convert_text_func(block)
+        if line_content:
+            new_content_list.append(line_content)
+    return "\r\n\r\n".join(new_content_list)
+
+
+def bench(name, func, content, number):
+    seconds = min(timeit.repeat(lambda: func(content), number=1, repeat=number))
+    print("{:<40} {:>8.1f} ms".format(name, seconds * 1000))
+    return seconds
+
+
+def main():
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    xml_content = make_xml_note(block_count)
+    assert legacy_xml_to_markdown(xml_content) == table_xml_to_markdown(xml_content)
+    json_content = make_json_note(block_count).decode("utf-8")
+    assert legacy_json_to_markdown_content(
+        json_content
+    ) == YoudaoNoteConvert._json_to_markdown_content(json_content)
+
+    print("{} 个块，取 {} 次中最快的一次".format(block_count, number))
+    before = bench("xml getattr", legacy_xml_to_markdown, xml_content, number)
+    after = bench("xml 转换函数表", table_xml_to_markdown, xml_content, number)
+    print("xml 提升 {:.1%}".format(1 - after / before))
+    before = bench(
+        "json getattr", legacy_json_to_markdown_content, json_content, number
+    )
+    after = bench(
+        "json 转换函数表",
+        YoudaoNoteConvert._json_to_markdown_content,
+        json_content,
+        number,
+    )
+    print("json 提升 {:.1%}".format(1 - after / before))
+
+
+if __name__ == "__main__":
+    main()
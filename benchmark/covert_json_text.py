@@ -0,0 +1,112 @@
+"""
+Json 文本拼接基准：逐段 += 拼接 vs 放入列表后一次 join
+python benchmark/covert_json_text.py [规模] [重复次数]
+"""
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.notes import json_code_block, json_table_block, json_text_block
+from core.covert import JsonConvert
+
+
+class LegacyJsonConvert(JsonConvert):
+    """改为列表拼接前的转换函数，用于对比"""
+
+    def _get_common_text(self, content):
+        all_text = ""
+        five_contents = content.get("5")
+        if five_contents:
+            seven_contents = five_contents[0].get("7")
+            if not seven_contents:
+                return all_text
+            for seven_content in seven_contents:
+                text = seven_content.get("8")
+                text_attrs = seven_content.get("9")
+                if text and text_attrs:
+                    text = self._convert_text_attribute(text, text_attrs)
+                all_text += text
+        return all_text
+
+    def convert_text_func(self, content):
+        all_text = ""
+        for one_five_content in content.get("5") or []:
+            seven_contents = one_five_content.get("7")
+            text = ""
+            if seven_contents and not one_five_content.get("5"):
+                for seven_content in seven_contents:
+                    raw = seven_content.get("8")
+                    text_attrs = seven_content.get("9")
+                    if raw and text_attrs:
+                        raw = self._convert_text_attribute(raw, text_attrs)
+                    text += raw
+            if text:
+                all_text += text
+        return all_text
+
+    def convert_cd_func(self, content):
+        code_block = ""
+        for code in content.get("5"):
+            code_block += self._get_common_text(code) + "\n"
+        return "```{}\r\n{}```".format(content.get("4").get("la"), code_block)
+
+    def convert_t_func(self, content):
+        table_lines = ""
+        for index, tc in enumerate(content["5"]):
+            table_content_list = tc["5"]
+            if index == 1:
+                table_line = "| -- " * len(table_content_list) + "|\n| "
+            else:
+                table_line = "| "
+            for table_content in table_content_list:
+                table_text_list = table_content.get("5")[0].get("5")[0].get("7")
+                table_text = table_text_list[0]["8"] if table_text_list else " "
+                table_line = table_line + table_text + " | "
+            table_lines = table_lines + table_line + "\r\n"
+        return table_lines
+
+
+def make_cases(scale):
+    """大表格、长代码块、由大量带属性文本段组成的长段落"""
+    rows = [
+        ["单元格 {}-{}".format(row, col) if (row + col) % 7 else "" for col in range(20)]
+        for row in range(scale // 10)
+    ]
+    code = [
+        "    value_{0} = compute({0}, key='{0}')".format(i) for i in range(scale * 5)
+    ]
+    runs = [
+        {"8": "文本 {} ".format(i), "9": [{"2": "b"}] if i % 3 == 0 else []}
+        for i in range(scale * 2)
+    ]
+    paragraph = json_text_block("")
+    paragraph["5"][0]["7"] = runs
+    return [
+        ("表格 {} 行 x 20 列".format(len(rows)), "convert_t_func", json_table_block(rows)),
+        ("代码块 {} 行".format(len(code)), "convert_cd_func", json_code_block(code)),
+        ("段落 {} 段文本".format(len(runs)), "convert_text_func", paragraph),
+    ]
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    legacy, converter = LegacyJsonConvert(), JsonConvert()
+    print("取 {} 次中最快的一次".format(number))
+    for name, func_name, block in make_cases(scale):
+        legacy_func = getattr(legacy, func_name)
+        func = getattr(converter, func_name)
+        assert legacy_func(block) == func(block)
+        before = min(timeit.repeat(lambda: legacy_func(block), number=1, repeat=number))
+        after = min(timeit.repeat(lambda: func(block), number=1, repeat=number))
+        print(
+            "{}：+= {:.1f} ms，join {:.1f} ms，提升 {:.1%}".format(
+                name, before * 1000, after * 1000, 1 - after / before
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+笔记转换基准套件：用合成语料分别测试 XML、Json、HTML 笔记在不同规模下的转换吞吐量和峰值内存，
+可保存结果作为基线，之后与基线比较，吞吐量下降或峰值内存上升超过容差时以非 0 状态退出
+python benchmark/covert_suite.py [--sizes 100 1000 5000] [--formats xml json html] [--save base.json]
+python benchmark/covert_suite.py --baseline base.json [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.corpus import FORMATS, make_corpus_note
+from core.covert import covert_note_to_markdown
+
+
+def bench_case(note_format: str, block_count: int, seed=0, repeat=3) -> dict:
+    """
+    转换同一篇合成笔记 repeat 次取最快一次计算吞吐量，再单独转换一次统计峰值内存
+    :return: 结果字典
+    """
+    content = make_corpus_note(note_format, block_count, seed)
+    # HTML 笔记和有道云笔记一样按 xml 类型传入，解析失败后回退为 HTML 转换
+    note_type = "json" if note_format == "json" else "xml"
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        covert_note_to_markdown(content, note_type)
+        seconds = min(seconds, time.perf_counter() - start)
+    # tracemalloc 会拖慢执行，不与计时放在同一次
+    tracemalloc.start()
+    covert_note_to_markdown(content, note_type)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "format": note_format,
+        "blocks": block_count,
+        "seed": seed,
+        "bytes": len(content),
+        "seconds": seconds,
+        "bytes_per_second": len(content) / seconds,
+        "blocks_per_second": block_count / seconds,
+        "peak_memory": peak,
+    }
+
+
+def compare(results, baseline, tolerance) -> list:
+    """
+    与基线比较，返回退化说明列表
+    :param tolerance: 容差，0.2 表示吞吐量下降或峰值内存上升超过 20% 视为退化
+    """
+    baseline_dict = {
+        (result["format"], result["blocks"], result["seed"]): result
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        base = baseline_dict.get((result["format"], result["blocks"], result["seed"]))
+        if not base:
+            continue
+        name = "{} {} 块".format(result["format"], result["blocks"])
+        ratio = result["blocks_per_second"] / base["blocks_per_second"]
+        if ratio < 1 - tolerance:
+            regressions.append("{}：吞吐量为基线的 {:.1%}".format(name, ratio))
+        ratio = result["peak_memory"] / max(base["peak_memory"], 1)
+        if ratio > 1 + tolerance:
+            regressions.append("{}：峰值内存为基线的 {:.1%}".format(name, ratio))
+    return regressions
+
+
+def print_result(result):
+    print(
+        "{:<5} {:>6} 块 {:>8.2f} MB {:>9.1f} ms {:>8.2f} MB/秒 {:>9.0f} 块/秒  峰值内存 {:>7.2f} MB".format(
+            result["format"],
+            result["blocks"],
+            result["bytes"] / 2**20,
+            result["seconds"] * 1000,
+            result["bytes_per_second"] / 2**20,
+            result["blocks_per_second"],
+            result["peak_memory"] / 2**20,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="笔记转换基准套件")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[100, 1000, 5000], help="每篇笔记的块数"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数，取最快一次")
+    parser.add_argument("--save", help="将结果保存为 json，作为之后比较的基线")
+    parser.add_argument("--baseline", help="与之比较的基线 json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容差，默认 0.2")
+    args = parser.parse_args()
+
+    results = []
+    for note_format in args.formats:
+        for block_count in args.sizes:
+            result = bench_case(note_format, block_count, args.seed, args.repeat)
+            print_result(result)
+            results.append(result)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("退化 " + regression)
+        if regressions:
+            sys.exit(1)
+        print("与基线相比没有超过 {:.0%} 的退化".format(args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
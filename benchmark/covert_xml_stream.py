@@ -0,0 +1,76 @@
+"""
+XML 笔记转换峰值内存基准：整篇 ET.parse 后转换 vs iterparse 边解析边转换
+python benchmark/covert_xml_stream.py [块数]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.notes import make_xml_note
+from core.covert import XmlElementConvert, YoudaoNoteConvert
+
+
+def legacy_covert_xml(file_path) -> int:
+    """改为增量转换前的流程：先构建整棵元素树，再逐个转换 body 下的元素"""
+    note_element = ET.parse(file_path).getroot()
+    list_item = {}
+    for child in note_element[0]:
+        if "list" in child.tag:
+            list_item[child.attrib["id"]] = child.attrib["type"]
+    handlers = XmlElementConvert().get_handlers()
+    size = 0
+    for element in list(note_element[1]):
+        text = XmlElementConvert.get_text_by_key(list(element))
+        name = element.tag.replace("{http://note.youdao.com}", "").replace("-", "_")
+        convert_func = handlers.get(name)
+        if convert_func:
+            text = convert_func(text=text, element=element, list_item=list_item)
+        size += len(text)
+    return size
+
+
+def stream_covert_xml(file_path) -> int:
+    return sum(
+        len(block) for block in YoudaoNoteConvert.iter_xml_to_markdown(file_path)
+    )
+
+
+def bench(name, func, file_path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(file_path)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(
+        "{:<12} {:>8.1f} ms  峰值内存 {:>8.1f} MB".format(
+            name, seconds * 1000, peak / 2**20
+        )
+    )
+    return size
+
+
+def main():
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "large.note")
+        with open(file_path, "wb") as f:
+            f.write(make_xml_note(block_count))
+        print(
+            "{} 个块，笔记大小 {:.1f} MB".format(
+                block_count, os.path.getsize(file_path) / 2**20
+            )
+        )
+        # 两种方式只统计输出大小，不保留输出，避免输出本身影响峰值内存
+        legacy_size = bench("ET.parse", legacy_covert_xml, file_path)
+        stream_size = bench("iterparse", stream_covert_xml, file_path)
+        assert legacy_size == stream_size
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+有道云笔记 API 本地替身，不用访问 note.youdao.com 即可测试 pull.py 的吞吐量
+实现 getByPath、listPageByParentId、sync?method=download 和图片链接；
+目录树大小、笔记大小、图片数量、响应延迟和 429 比例均可配置，GET /__stats 返回各接口的请求数和字节数
+python benchmark/fake_server.py --port 8000 [--depth 2 --dirs 3 --notes 10 ...]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.notes import make_json_note, make_markdown_note, make_xml_note
+
+YOUDAO_HOST = "https://note.youdao.com"
+ROOT_DIR_ID = "dir-root"
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+NOTE_MAKERS = {
+    "xml": (".note", make_xml_note),
+    "json": (".note", make_json_note),
+    "md": (".md", make_markdown_note),
+}
+
+
+class FakeNoteTree(object):
+    """
+    按配置生成的目录树，启动时生成所有笔记内容，处理请求时只查表
+    每个目录下有 dirs_per_dir 个子目录（最多 depth 层）和 notes_per_dir 篇笔记，笔记格式依次轮换
+    """
+
+    def __init__(
+        self,
+        depth=2,
+        dirs_per_dir=3,
+        notes_per_dir=10,
+        note_blocks=50,
+        images_per_note=2,
+        image_size=20 * 1024,
+        shared_images=0,
+        note_formats=("xml", "json", "md"),
+    ):
+        """
+        初始化
+        :param depth: 目录层数，0 为只有根目录
+        :param dirs_per_dir: 每个目录下的子目录数
+        :param notes_per_dir: 每个目录下的笔记数
+        :param note_blocks: 每篇笔记的块数
+        :param images_per_note: 每篇笔记的图片数
+        :param image_size: 每张图片的字节数
+        :param shared_images: 大于 0 时所有笔记从这么多张图片中取图，用于测试跨笔记去重
+        :param note_formats: 笔记格式，xml、json、md
+        """
+        self.image_size = image_size
+        self.entries = {}  # {目录 ID: [entry, ...]}
+        self.notes = {}  # {笔记 ID: 内容}
+        self._images = {}  # {图片编号: 内容}
+        self._images_lock = threading.Lock()
+        modify_time = int(time.time()) - 3600
+        image_count = 0
+        note_count = 0
+        dirs = [(ROOT_DIR_ID, 0)]
+        while dirs:
+            dir_id, level = dirs.pop()
+            entries = self.entries[dir_id] = []
+            if level < depth:
+                for i in range(dirs_per_dir):
+                    sub_dir_id = "{}-{}".format(dir_id, i)
+                    name = "目录 {}".format(i)
+                    entries.append(self._entry(sub_dir_id, name, True, modify_time))
+                    dirs.append((sub_dir_id, level + 1))
+            for i in range(notes_per_dir):
+                note_format = note_formats[note_count % len(note_formats)]
+                suffix, make_note = NOTE_MAKERS[note_format]
+                image_urls = []
+                for _ in range(images_per_note):
+                    number = (
+                        image_count % shared_images if shared_images else image_count
+                    )
+                    image_urls.append(self.image_url(number))
+                    image_count += 1
+                note_id = "note-{}".format(note_count)
+                self.notes[note_id] = make_note(note_blocks, image_urls)
+                entries.append(
+                    self._entry(
+                        note_id, "笔记 {}{}".format(i, suffix), False, modify_time
+                    )
+                )
+                note_count += 1
+
+    @staticmethod
+    def _entry(file_id, name, is_dir, modify_time) -> dict:
+        return {
+            "fileEntry": {
+                "id": file_id,
+                "name": name,
+                "dir": is_dir,
+                "modifyTimeForSort": modify_time,
+                "createTimeForSort": modify_time,
+                "version": 1,
+            }
+        }
+
+    @staticmethod
+    def image_url(number) -> str:
+        name = hashlib.md5(str(number).encode()).hexdigest().upper()
+        return "{}/yws/res/{}/WEBRESOURCE{}".format(YOUDAO_HOST, number, name)
+
+    def get_image(self, number) -> bytes:
+        """图片内容首次请求时生成，PNG 文件头加随机字节"""
+        with self._images_lock:
+            if number not in self._images:
+                size = max(0, self.image_size - len(PNG_HEADER))
+                self._images[number] = PNG_HEADER + os.urandom(size)
+            return self._images[number]
+
+    def list_page(self, dir_id, page_size, last_id=None) -> list:
+        """
+        分页获取目录下的 entries，同 listPageByParentId
+        :param dir_id:
+        :param page_size:
+        :param last_id: 上一页最后一条的 ID
+        :return: entries，目录不存在时为 None
+        """
+        entries = self.entries.get(dir_id)
+        if entries is None:
+            return None
+        start = 0
+        if last_id:
+            ids = [entry["fileEntry"]["id"] for entry in entries]
+            start = ids.index(last_id) + 1 if last_id in ids else len(entries)
+        return entries[start : start + page_size]
+
+
+class FakeYoudaoHandler(BaseHTTPRequestHandler):
+    # 长连接，与真实服务一致，避免每个请求都重新建立连接
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 响应头、响应体分两次写入，关闭 Nagle 算法，避免与客户端延迟确认叠加产生 40ms 延迟
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8")) if length else {}
+
+        if url.path == "/__stats":
+            self._send(200, json.dumps(server.get_stats()).encode("utf-8"))
+            return
+        endpoint = self._get_endpoint(url.path, query)
+        if server.latency:
+            time.sleep(server.latency)
+        if endpoint and server.should_throttle():
+            server.count(endpoint, 0, throttled=True)
+            self._send(429, b"", {"Retry-After": str(server.retry_after)})
+            return
+
+        status, body, headers = 404, b"", {}
+        tree = server.tree
+        if endpoint == "getByPath":
+            root_entry = {"id": ROOT_DIR_ID, "name": "ROOT", "dir": True}
+            status, body = 200, self._json({"fileEntry": root_entry})
+        elif endpoint == "listPageByParentId":
+            dir_id = url.path.rsplit("/", 1)[1]
+            last_id = query.get("lastId", [None])[0]
+            entries = tree.list_page(dir_id, int(query["len"][0]), last_id)
+            if entries is not None:
+                count = len(tree.entries[dir_id])
+                status, body = 200, self._json({"count": count, "entries": entries})
+        elif endpoint == "download":
+            content = tree.notes.get(form.get("fileId", [None])[0])
+            if content is not None:
+                status, body = 200, content
+        elif endpoint == "res":
+            content = tree.get_image(int(url.path.split("/")[3]))
+            etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+            headers = {"ETag": etag, "Content-Type": "image/png"}
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            else:
+                status, body = 200, content
+        if endpoint:
+            server.count(endpoint, len(body))
+        self._send(status, body, headers)
+
+    @staticmethod
+    def _get_endpoint(path, query):
+        method = query.get("method", [None])[0]
+        if path == "/yws/api/personal/file" and method == "getByPath":
+            return "getByPath"
+        if (
+            path.startswith("/yws/api/personal/file/")
+            and method == "listPageByParentId"
+        ):
+            return "listPageByParentId"
+        if path == "/yws/api/personal/sync" and method == "download":
+            return "download"
+        if path.startswith("/yws/res/"):
+            return "res"
+        return None
+
+    @staticmethod
+    def _json(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class FakeYoudaoServer(ThreadingHTTPServer):
+    """
+    有道云笔记 API 本地替身，每个请求一个线程
+    """
+
+    daemon_threads = True
+
+    def __init__(self, tree, port=0, latency=0.0, throttle_rate=0.0, retry_after=0):
+        """
+        初始化
+        :param tree: FakeNoteTree
+        :param port: 端口，0 为随机端口
+        :param latency: 每个请求的响应延迟（秒）
+        :param throttle_rate: 返回 429 的请求比例，0~1
+        :param retry_after: 429 响应的 Retry-After 秒数
+        """
+        super().__init__(("127.0.0.1", port), FakeYoudaoHandler)
+        self.tree = tree
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(0)
+        self._stats = {}  # {接口: {"requests", "bytes", "throttled"}}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def should_throttle(self) -> bool:
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.throttle_rate
+
+    def count(self, endpoint, size, throttled=False):
+        with self._lock:
+            stats = self._stats.setdefault(
+                endpoint, {"requests": 0, "bytes": 0, "throttled": 0}
+            )
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["throttled"] += int(throttled)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+
+
+class LocalRedirectAdapter(requests.adapters.BaseAdapter):
+    """
+    将发往 https://note.youdao.com 的请求转发到本地替身，笔记中的图片链接不用修改
+    实际发送仍由 session 原有的 adapter 完成，连接池配置不变
+    """
+
+    def __init__(self, base_url, adapter):
+        super().__init__()
+        self.base_url = base_url
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.url[len(YOUDAO_HOST) :]
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+
+def redirect_session(session, base_url):
+    """
+    session 中发往有道云笔记的请求改为发往 base_url
+    :param session: requests.Session
+    :param base_url: 本地替身地址，如 http://127.0.0.1:8000
+    :return:
+    """
+    adapter = LocalRedirectAdapter(base_url, session.get_adapter(base_url))
+    session.mount(YOUDAO_HOST + "/", adapter)
+
+
+def add_arguments(parser):
+    """目录树与服务端行为参数，pull_throughput.py 共用"""
+    parser.add_argument("--depth", type=int, default=2, help="目录层数")
+    parser.add_argument("--dirs", type=int, default=3, help="每个目录下的子目录数")
+    parser.add_argument("--notes", type=int, default=10, help="每个目录下的笔记数")
+    parser.add_argument("--blocks", type=int, default=50, help="每篇笔记的块数")
+    parser.add_argument("--images", type=int, default=2, help="每篇笔记的图片数")
+    parser.add_argument("--image-size", type=int, default=20 * 1024, help="每张图片的字节数")
+    parser.add_argument(
+        "--shared-images", type=int, default=0, help="所有笔记共用的图片数，0 为不共用"
+    )
+    parser.add_argument("--formats", default="xml,json,md", help="笔记格式，逗号分隔")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的响应延迟（秒）")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument(
+        "--retry-after", type=int, default=0, help="429 响应的 Retry-After 秒数"
+    )
+
+
+def create_server(args, port=0) -> FakeYoudaoServer:
+    tree = FakeNoteTree(
+        depth=args.depth,
+        dirs_per_dir=args.dirs,
+        notes_per_dir=args.notes,
+        note_blocks=args.blocks,
+        images_per_note=args.images,
+        image_size=args.image_size,
+        shared_images=args.shared_images,
+        note_formats=tuple(args.formats.split(",")),
+    )
+    return FakeYoudaoServer(
+        tree,
+        port=port,
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="有道云笔记 API 本地替身")
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = create_server(args, args.port)
+    print(
+        "{} 个目录，{} 篇笔记，监听 {}".format(
+            len(server.tree.entries), len(server.tree.notes), server.base_url
+        )
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import copy
+import json
+import os
+import xml.etree.ElementTree as ET
+
+TEST_DIR = os.path.join(os.path.dirname(__file__), "..", "test")
+XML_NAMESPACE = "http://note.youdao.com"
+
+
+def make_json_note(block_count: int, image_urls=()) -> bytes:
+    """
+    重复 test/test.json 中的块，生成指定块数的 Json 笔记
+    :param block_count: 块数
+    :param image_urls: 笔记末尾追加的图片链接
+    :return: Json 字节码
+    """
+    with open(os.path.join(TEST_DIR, "test.json"), "r", encoding="utf-8") as f:
+        json_data = json.load(f)
+    blocks = json_data["5"]
+    json_data["5"] = [blocks[i % len(blocks)] for i in range(block_count)]
+    json_data["5"] += [{"6": "im", "4": {"u": url}} for url in image_urls]
+    return json.dumps(json_data, ensure_ascii=False).encode("utf-8")
+
+
+def make_xml_note(block_count: int, image_urls=()) -> bytes:
+    """
+    重复 test/test.note 中 body 下的元素，生成指定块数的 XML 笔记
+    :param block_count: 块数
+    :param image_urls: 笔记末尾追加的图片链接
+    :return: XML 字节码
+    """
+    ET.register_namespace("", XML_NAMESPACE)
+    note_element = ET.parse(os.path.join(TEST_DIR, "test.note")).getroot()
+    body_element = note_element[1]
+    elements = list(body_element)
+    for element in elements:
+        body_element.remove(element)
+    for i in range(block_count):
+        body_element.append(copy.deepcopy(elements[i % len(elements)]))
+    for url in image_urls:
+        image_element = ET.SubElement(body_element, "{%s}image" % XML_NAMESPACE)
+        ET.SubElement(image_element, "{%s}source" % XML_NAMESPACE).text = url
+        ET.SubElement(image_element, "{%s}text" % XML_NAMESPACE)
+    # 与有道云笔记一致，以 <?xml 开头
+    return ET.tostring(note_element, encoding="utf-8", xml_declaration=True)
+
+
+def make_markdown_note(block_count: int, image_urls=()) -> bytes:
+    """
+    生成指定段落数的 MarkDown 笔记
+    :param block_count: 段落数
+    :param image_urls: 笔记末尾追加的图片链接
+    :return: MarkDown 字节码
+    """
+    lines = ["# 标题"]
+    lines += ["段落 {}，**粗体** 和 `代码`。".format(i) for i in range(block_count)]
+    lines += ["![]({})".format(url) for url in image_urls]
+    return "\n\n".join(lines).encode("utf-8")
+
+
+def json_text_block(text: str, attrs=None) -> dict:
+    """Json 普通文本块，attrs 为文本属性，如 [{"2": "b"}]"""
+    seven_content = {"8": text}
+    if attrs:
+        seven_content["9"] = attrs
+    return {"5": [{"7": [seven_content]}]}
+
+
+def json_code_block(lines, language="python") -> dict:
+    """Json 代码块，每行一个子块"""
+    return {
+        "6": "cd",
+        "4": {"la": language},
+        "5": [json_text_block(line) for line in lines],
+    }
+
+
+def json_table_block(rows) -> dict:
+    """Json 表格块，rows 为二维文本列表，空字符串为空单元格"""
+
+    def cell(text):
+        return {"5": [{"5": [{"7": [{"8": text}] if text else []}]}]}
+
+    return {"6": "t", "5": [{"5": [cell(text) for text in row]} for row in rows]}
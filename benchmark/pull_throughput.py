@@ -0,0 +1,195 @@
+"""
+pull.py 吞吐量基准：在子进程中启动有道云笔记 API 本地替身，完整运行 YoudaoNotePull，
+统计每秒笔记数、每秒字节数、各接口请求数和 pull 各阶段耗时
+python benchmark/pull_throughput.py [--max-workers 4 --crawl-workers 4 --latency 0.02 --runs 2 ...]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark.fake_server import add_arguments, create_server, redirect_session
+from pull import YoudaoNotePull
+
+CONFIG_KEYS = (
+    "crawl_workers",
+    "max_workers",
+    "image_workers",
+    "convert_workers",
+    "skip_unchanged_dirs",
+    "max_retries",
+    "requests_per_second",
+)
+
+
+class BenchmarkPull(YoudaoNotePull):
+    """请求发往本地替身的 YoudaoNotePull"""
+
+    def __init__(self, base_url, cookies_path):
+        super().__init__()
+        self.base_url = base_url
+        self.cookies_path = cookies_path
+
+    def _create_api(self, config_dict):
+        youdaonote_api = super()._create_api(config_dict)
+        youdaonote_api.cookies_path = self.cookies_path
+        redirect_session(youdaonote_api.session, self.base_url)
+        return youdaonote_api
+
+
+def serve(args, url_queue):
+    server = create_server(args)
+    url_queue.put(server.base_url)
+    server.serve_forever()
+
+
+def write_files(work_dir, args) -> tuple:
+    """生成 config.json、cookies.json"""
+    config = {
+        "local_dir": os.path.join(work_dir, "youdaonote").replace("\\", "/"),
+        "ydnote_dir": "",
+        "smms_secret_token": "",
+        "is_relative_path": True,
+    }
+    for key in CONFIG_KEYS:
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    cookies_path = os.path.join(work_dir, "cookies.json")
+    with open(cookies_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"cookies": [["YNOTE_CSTK", "benchmark", ".note.youdao.com", "/"]]}, f
+        )
+    return config_path, cookies_path
+
+
+def diff_stats(before, after) -> dict:
+    stats = {}
+    for endpoint, counts in after.items():
+        previous = before.get(endpoint, {})
+        stats[endpoint] = {
+            key: value - previous.get(key, 0) for key, value in counts.items()
+        }
+    return stats
+
+
+def run_pull(base_url, config_path, cookies_path, progress_interval=0) -> dict:
+    stats_url = base_url + "/__stats"
+    before = requests.get(stats_url).json()
+    start = time.perf_counter()
+    youdaonote_pull = BenchmarkPull(base_url, cookies_path)
+    dir_id, error_msg = youdaonote_pull.get_ydnote_dir_id(config_path)
+    if error_msg:
+        raise RuntimeError(error_msg)
+    youdaonote_pull.pull(dir_id, progress_interval=progress_interval)
+    seconds = time.perf_counter() - start
+    youdaonote_pull.youdaonote_api.session.close()
+    endpoints = diff_stats(before, requests.get(stats_url).json())
+    download = endpoints.get("download", {})
+    notes = download.get("requests", 0) - download.get("throttled", 0)
+    total_bytes = sum(counts["bytes"] for counts in endpoints.values())
+    return {
+        "seconds": round(seconds, 3),
+        "notes": notes,
+        "notes_per_second": round(notes / seconds, 1),
+        "bytes": total_bytes,
+        "bytes_per_second": round(total_bytes / seconds),
+        "requests": sum(counts["requests"] for counts in endpoints.values()),
+        "endpoints": endpoints,
+        "metrics": youdaonote_pull.metrics.summary(),
+    }
+
+
+def print_result(index, result):
+    print(
+        "第 {} 次：{:.2f} 秒，下载 {} 篇笔记（{:.1f} 篇/秒），{:.2f} MB（{:.2f} MB/秒），共 {} 个请求".format(
+            index,
+            result["seconds"],
+            result["notes"],
+            result["notes_per_second"],
+            result["bytes"] / 2**20,
+            result["bytes_per_second"] / 2**20,
+            result["requests"],
+        )
+    )
+    for endpoint, counts in sorted(result["endpoints"].items()):
+        print(
+            "  {:<20} 请求 {:>6}  429 {:>5}  {:>10.2f} KB".format(
+                endpoint,
+                counts["requests"],
+                counts["throttled"],
+                counts["bytes"] / 1024,
+            )
+        )
+    # 阶段耗时为各线程累计耗时，并发时可能大于总耗时
+    for name, stage in sorted(result["metrics"]["stages"].items()):
+        print(
+            "  {:<20} 次数 {:>6}  累计 {:>8.3f} 秒  {:>10.2f} KB".format(
+                name, stage["count"], stage["seconds"], stage["bytes"] / 1024
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pull.py 吞吐量基准")
+    add_arguments(parser)
+    parser.add_argument("--crawl-workers", dest="crawl_workers", type=int)
+    parser.add_argument("--max-workers", dest="max_workers", type=int)
+    parser.add_argument("--image-workers", dest="image_workers", type=int)
+    parser.add_argument("--convert-workers", dest="convert_workers", type=int)
+    parser.add_argument("--max-retries", dest="max_retries", type=int)
+    parser.add_argument("--requests-per-second", dest="requests_per_second", type=float)
+    parser.add_argument(
+        "--skip-unchanged-dirs",
+        dest="skip_unchanged_dirs",
+        action="store_true",
+        default=None,
+    )
+    parser.add_argument(
+        "--progress", type=float, default=0, help="输出进度的间隔秒数，输出进度时先遍历完目录树再下载"
+    )
+    parser.add_argument("--runs", type=int, default=1, help="在同一目录中连续运行的次数，第 2 次起为增量同步")
+    parser.add_argument("--json", action="store_true", help="以 json 输出结果")
+    parser.add_argument("--verbose", action="store_true", help="输出 pull.py 的日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    url_queue = multiprocessing.Queue()
+    # 替身在子进程中运行，不与 pull 争用 GIL
+    server_process = multiprocessing.Process(
+        target=serve, args=(args, url_queue), daemon=True
+    )
+    server_process.start()
+    try:
+        base_url = url_queue.get(timeout=60)
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_path, cookies_path = write_files(work_dir, args)
+            results = [
+                run_pull(base_url, config_path, cookies_path, args.progress)
+                for _ in range(args.runs)
+            ]
+    finally:
+        server_process.terminate()
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for index, result in enumerate(results, 1):
+        print_result(index, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import json
+import logging
 import os
+import time
 
 import requests
 
 from core.common import get_script_directory
+from core.metrics import PullMetrics
+from core.retry import THROTTLED_STATUS_CODES, RetryPolicy
 
 
 class YoudaoNoteApi(object):
@@ -14,9 +18,10 @@ class YoudaoNoteApi(object):
 
     ROOT_ID_URL = "https://note.youdao.com/yws/api/personal/file?method=getByPath&keyfrom=web&cstk={cstk}"
     DIR_MES_URL = (
-        "https://note.youdao.com/yws/api/personal/file/{dir_id}?all=true&f=true&len=1000&sort=1"
+        "https://note.youdao.com/yws/api/personal/file/{dir_id}?all=true&f=true&len={page_size}&sort=1"
         "&isReverse=false&method=listPageByParentId&keyfrom=web&cstk={cstk}"
     )
+    DIR_PAGE_SIZE = 1000  # 目录信息每页最大条数
     FILE_URL = (
         "https://note.youdao.com/yws/api/personal/sync?method=download&_system=macos&_systemVersion=&"
         "_screenWidth=1280&_screenHeight=800&_appName=ynote&_appuser=0123456789abcdeffedcba9876543210&"
@@ -24,12 +29,28 @@ class YoudaoNoteApi(object):
         "_cityCode=110000&_cityName=&sev=j1&keyfrom=web&cstk={cstk}"
     )
 
-    def __init__(self, cookies_path=None):
+    def __init__(
+        self,
+        cookies_path=None,
+        pool_size=10,
+        retry_policy=None,
+        rate_limiter=None,
+        metrics=None,
+    ):
         """
         初始化
         :param cookies_path:
+        :param pool_size: 连接池大小，并发请求时需不小于并发线程数
+        :param retry_policy: 重试策略，默认网络错误、限流时最多重试 3 次
+        :param rate_limiter: 令牌桶限流，为空时不限流
+        :param metrics: 请求数、字节数统计
         """
         self.session = requests.session()  # 使用 session 维持有道云笔记的登陆状态
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.session.headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/100.0.4896.88 Safari/537.36",
@@ -46,6 +67,9 @@ class YoudaoNoteApi(object):
             else os.path.join(get_script_directory(), "cookies.json")
         )
         self.cstk = None
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics if metrics else PullMetrics()
 
     def login_by_cookies(self) -> str:
         """
@@ -81,23 +105,80 @@ class YoudaoNoteApi(object):
             raise Exception("转换「{}」为字典时出现错误".format(self.cookies_path))
         return cookies
 
-    def http_post(self, url, data=None, files=None):
+    def _request(self, method, url, **kwargs):
+        """
+        发送请求，网络错误或被限流时按重试策略重试
+        :param method:
+        :param url:
+        :return: response，重试次数用完后返回最后一次的 response 或抛出最后一次的异常
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as err:
+                self.metrics.add_request(url)
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                reason = format(err)
+            else:
+                self.metrics.add_request(
+                    url, response.status_code, self._get_response_size(response, kwargs)
+                )
+                if response.status_code in THROTTLED_STATUS_CODES and self.rate_limiter:
+                    self.rate_limiter.on_throttled()
+                if not self.retry_policy.should_retry(attempt, response.status_code):
+                    if response.status_code < 400 and self.rate_limiter:
+                        self.rate_limiter.on_success()
+                    return response
+                # 流式请求需释放连接后再重试
+                response.close()
+                delay = self.retry_policy.get_delay(
+                    attempt, response.headers.get("Retry-After")
+                )
+                reason = "状态码 {}".format(response.status_code)
+            attempt += 1
+            logging.info(
+                "请求「{}」失败（{}），{:.1f} 秒后第 {} 次重试".format(
+                    url.split("?")[0], reason, delay, attempt
+                )
+            )
+            time.sleep(delay)
+
+    @staticmethod
+    def _get_response_size(response, kwargs) -> int:
+        """响应字节数，流式请求尚未读取内容，取 Content-Length"""
+        if kwargs.get("stream"):
+            return int(response.headers.get("Content-Length") or 0)
+        content = response.content
+        return len(content) if isinstance(content, bytes) else 0
+
+    def http_post(self, url, data=None, files=None, stream=False):
         """
         封装 post 请求
         :param url:
         :param data:
         :param files:
+        :param stream: 是否流式读取，为 True 时需通过 iter_content 读取并关闭 response
         :return: response
         """
-        return self.session.post(url, data=data, files=files)
+        return self._request("POST", url, data=data, files=files, stream=stream)
 
-    def http_get(self, url):
+    def http_get(self, url, stream=False, headers=None):
         """
         封装 get 请求
         :param url:
+        :param stream: 同 http_post
+        :param headers: 额外的请求头，如条件请求的 If-None-Match
         :return: response
         """
-        return self.session.get(url)
+        return self._request("GET", url, stream=stream, headers=headers)
 
     def get_root_dir_info_id(self) -> dict:
         """
@@ -110,9 +191,11 @@ class YoudaoNoteApi(object):
         data = {"path": "/", "entire": "true", "purge": "false", "cstk": self.cstk}
         return self.http_post(self.ROOT_ID_URL.format(cstk=self.cstk), data=data).json()
 
-    def get_dir_info_by_id(self, dir_id) -> dict:
+    def get_dir_info_by_id(self, dir_id, last_id=None) -> dict:
         """
-        根据目录 ID 获取目录下所有文件信息
+        根据目录 ID 获取目录下文件信息，每次最多 DIR_PAGE_SIZE 条
+        :param dir_id:
+        :param last_id: 上一页最后一条的 ID，为空时获取第一页
         :return: {
             'count': 3,
             'entries': [
@@ -122,13 +205,71 @@ class YoudaoNoteApi(object):
             ]
         }
         """
-        url = self.DIR_MES_URL.format(dir_id=dir_id, cstk=self.cstk)
+        url = self.get_dir_info_url(dir_id, last_id)
         return self.http_get(url).json()
 
-    def get_file_by_id(self, file_id):
+    def get_dir_info_url(self, dir_id, last_id=None) -> str:
+        """
+        获取目录信息分页 URL
+        :param dir_id:
+        :param last_id: 上一页最后一条的 ID
+        :return: url
+        """
+        return self.format_dir_info_url(
+            self.DIR_MES_URL, dir_id, self.DIR_PAGE_SIZE, self.cstk, last_id
+        )
+
+    @staticmethod
+    def format_dir_info_url(url_template, dir_id, page_size, cstk, last_id=None) -> str:
+        """
+        拼接目录信息分页 URL，同步、异步 API 共用
+        :param url_template: DIR_MES_URL
+        :param dir_id:
+        :param page_size: 每页条数
+        :param cstk:
+        :param last_id: 上一页最后一条的 ID
+        :return: url
+        """
+        url = url_template.format(dir_id=dir_id, page_size=page_size, cstk=cstk)
+        if last_id:
+            url += "&lastId={}".format(last_id)
+        return url
+
+    @staticmethod
+    def get_page_entries(dir_info) -> list:
+        """
+        获取单页目录信息中的 entries
+        :param dir_info:
+        :return: entries
+        """
+        try:
+            return dir_info["entries"]
+        except KeyError:
+            raise KeyError("有道云笔记修改了接口地址，此脚本暂时不能使用！请提 issue")
+
+    def iter_dir_entries(self, dir_id):
+        """
+        分页获取目录下所有文件信息，逐条返回，用到下一页时才请求下一页
+        :param dir_id:
+        :return: entry 生成器
+        """
+        last_id = None
+        while True:
+            with self.metrics.stage("list_dir"):
+                entries = self.get_page_entries(
+                    self.get_dir_info_by_id(dir_id, last_id)
+                )
+            yield from entries
+            # 不足一页，说明已是最后一页
+            if len(entries) < self.DIR_PAGE_SIZE:
+                return
+            last_id = entries[-1]["fileEntry"]["id"]
+
+    def get_file_by_id(self, file_id, stream=False):
         """
         根据文件 ID 获取文件内容
         :param file_id:
+        :param stream: 是否流式读取
         :return: response，内容为笔记字节码
         """
         data = {
@@ -139,4 +280,4 @@ class YoudaoNoteApi(object):
             "cstk": self.cstk,
         }
         url = self.FILE_URL.format(cstk=self.cstk)
-        return self.http_post(url, data=data)
+        return self.http_post(url, data=data, stream=stream)
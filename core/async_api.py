@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+
+from core.api import YoudaoNoteApi
+from core.metrics import PullMetrics
+from core.retry import THROTTLED_STATUS_CODES, RetryPolicy
+
+
+class AsyncResponse(object):
+    """
+    异步请求结果，属性与 requests.Response 常用属性一致
+    """
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+class AsyncYoudaoNoteApi(object):
+    """
+    有道云笔记异步 API 封装
+    基于 aiohttp，复用长连接，并用信号量限制同时进行的请求数
+    需要额外安装 aiohttp：pip install aiohttp
+    """
+
+    ROOT_ID_URL = YoudaoNoteApi.ROOT_ID_URL
+    DIR_MES_URL = YoudaoNoteApi.DIR_MES_URL
+    FILE_URL = YoudaoNoteApi.FILE_URL
+    DIR_PAGE_SIZE = YoudaoNoteApi.DIR_PAGE_SIZE
+
+    def __init__(
+        self,
+        cookies: dict,
+        cstk: str,
+        headers: dict = None,
+        concurrency=20,
+        retry_policy=None,
+        rate_limiter=None,
+        metrics=None,
+    ):
+        """
+        初始化
+        :param cookies: {name: value}
+        :param cstk: 接口验证
+        :param headers:
+        :param concurrency: 同时进行的最大请求数，同时也是连接池大小
+        :param retry_policy: 重试策略
+        :param rate_limiter: 令牌桶限流，为空时不限流
+        :param metrics: 请求数、字节数统计
+        """
+        self.cookies = cookies
+        self.cstk = cstk
+        self.headers = headers or {}
+        self.concurrency = max(1, concurrency)
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics if metrics else PullMetrics()
+        self.session = None
+        self._semaphore = None
+        # 需重试的网络错误，open 时加入 aiohttp.ClientError
+        self._network_errors = (asyncio.TimeoutError,)
+
+    @classmethod
+    def from_api(cls, youdaonote_api: YoudaoNoteApi, concurrency=20):
+        """
+        使用已登录的同步 API 创建异步 API，共用 Cookies、请求头、重试策略、限流和统计
+        :param youdaonote_api:
+        :param concurrency:
+        :return:
+        """
+        cookies = {
+            cookie.name: cookie.value for cookie in youdaonote_api.session.cookies
+        }
+        return cls(
+            cookies=cookies,
+            cstk=youdaonote_api.cstk,
+            headers=dict(youdaonote_api.session.headers),
+            concurrency=concurrency,
+            retry_policy=youdaonote_api.retry_policy,
+            rate_limiter=youdaonote_api.rate_limiter,
+            metrics=youdaonote_api.metrics,
+        )
+
+    async def open(self):
+        """创建连接池，需在事件循环中调用"""
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            keepalive_timeout=30,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, headers=self.headers, cookies=self.cookies
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._network_errors = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    async def close(self):
+        """关闭连接池"""
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _send(self, method, url, data=None) -> AsyncResponse:
+        async with self._semaphore:
+            async with self.session.request(method, url, data=data) as response:
+                content = await response.read()
+                return AsyncResponse(
+                    response.status, response.headers, content, str(response.url)
+                )
+
+    async def _request(self, method, url, data=None) -> AsyncResponse:
+        """
+        发送请求，重试、限流规则同 YoudaoNoteApi._request
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                await asyncio.sleep(self.rate_limiter.reserve())
+            try:
+                response = await self._send(method, url, data=data)
+            except self._network_errors as err:
+                self.metrics.add_request(url)
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                reason = format(err)
+            else:
+                self.metrics.add_request(
+                    url, response.status_code, len(response.content)
+                )
+                if response.status_code in THROTTLED_STATUS_CODES and self.rate_limiter:
+                    self.rate_limiter.on_throttled()
+                if not self.retry_policy.should_retry(attempt, response.status_code):
+                    if response.status_code < 400 and self.rate_limiter:
+                        self.rate_limiter.on_success()
+                    return response
+                delay = self.retry_policy.get_delay(
+                    attempt, response.headers.get("Retry-After")
+                )
+                reason = "状态码 {}".format(response.status_code)
+            attempt += 1
+            logging.info(
+                "请求「{}」失败（{}），{:.1f} 秒后第 {} 次重试".format(
+                    url.split("?")[0], reason, delay, attempt
+                )
+            )
+            await asyncio.sleep(delay)
+
+    async def http_post(self, url, data=None) -> AsyncResponse:
+        """
+        封装 post 请求
+        :param url:
+        :param data:
+        :return: response
+        """
+        return await self._request("POST", url, data=data)
+
+    async def http_get(self, url) -> AsyncResponse:
+        """
+        封装 get 请求，图片、附件也使用此方法下载
+        :param url:
+        :return: response
+        """
+        return await self._request("GET", url)
+
+    async def get_root_dir_info_id(self) -> dict:
+        """
+        获取有道云笔记根目录信息
+        :return: 同 YoudaoNoteApi.get_root_dir_info_id
+        """
+        data = {"path": "/", "entire": "true", "purge": "false", "cstk": self.cstk}
+        response = await self.http_post(
+            self.ROOT_ID_URL.format(cstk=self.cstk), data=data
+        )
+        return response.json()
+
+    async def get_dir_info_by_id(self, dir_id, last_id=None) -> dict:
+        """
+        根据目录 ID 获取目录下文件信息，每次最多 DIR_PAGE_SIZE 条
+        :return: 同 YoudaoNoteApi.get_dir_info_by_id
+        """
+        url = YoudaoNoteApi.format_dir_info_url(
+            self.DIR_MES_URL, dir_id, self.DIR_PAGE_SIZE, self.cstk, last_id
+        )
+        response = await self.http_get(url)
+        return response.json()
+
+    async def iter_dir_entries(self, dir_id):
+        """
+        分页获取目录下所有文件信息，逐条返回，用到下一页时才请求下一页
+        :param dir_id:
+        :return: entry 异步生成器
+        """
+        last_id = None
+        while True:
+            with self.metrics.stage("list_dir"):
+                dir_info = await self.get_dir_info_by_id(dir_id, last_id)
+                entries = YoudaoNoteApi.get_page_entries(dir_info)
+            for entry in entries:
+                yield entry
+            if len(entries) < self.DIR_PAGE_SIZE:
+                return
+            last_id = entries[-1]["fileEntry"]["id"]
+
+    async def get_file_by_id(self, file_id) -> AsyncResponse:
+        """
+        根据文件 ID 获取文件内容
+        :param file_id:
+        :return: response，内容为笔记字节码
+        """
+        data = {
+            "fileId": file_id,
+            "version": -1,
+            "convert": "true",
+            "editorType": 1,
+            "cstk": self.cstk,
+        }
+        url = self.FILE_URL.format(cstk=self.cstk)
+        return await self.http_post(url, data=data)
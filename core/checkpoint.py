@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+
+from core.manifest import trim_file_entry
+
+CHECKPOINT_FILE_NAME = ".youdaonote_checkpoint.jsonl"
+
+
+class PullCheckpoint(object):
+    """
+    导出断点记录
+    每行一条 json 事件：start 为起始目录；dir 为已遍历完的目录及其子目录、文件；file 为已处理完的文件。
+    中断后重新运行时，只需遍历未遍历完的目录、处理未处理完的文件
+    """
+
+    def __init__(self, root_local_dir, file_name=CHECKPOINT_FILE_NAME):
+        """
+        初始化
+        :param root_local_dir: 本地文件根目录
+        :param file_name: 断点记录文件名
+        """
+        self.path = os.path.join(root_local_dir, file_name).replace("\\", "/")
+        self.root = None  # (dir_id, local_dir)
+        self.done_dirs = {}  # {dir_id: {"dirs": [...], "files": [...]}}
+        self.done_file_ids = set()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self, dir_id) -> bool:
+        """
+        读取断点记录
+        :param dir_id: 本次导出的起始目录 ID，与断点记录不一致时不使用断点记录
+        :return: 是否有可用的断点记录
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下不完整的最后一行，忽略
+                    continue
+                if event["event"] == "start":
+                    self.root = (event["id"], event["local_dir"])
+                elif event["event"] == "dir":
+                    self.done_dirs[event["id"]] = event
+                elif event["event"] == "file":
+                    self.done_file_ids.add(event["id"])
+        if not self.root or self.root[0] != dir_id:
+            logging.info("断点记录的起始目录与本次导出不一致，将重新导出")
+            self.root = None
+            self.done_dirs = {}
+            self.done_file_ids = set()
+            return False
+        return True
+
+    def pending_dirs(self) -> list:
+        """
+        未遍历完的目录
+        :return: [(dir_id, local_dir, dir_entry), ...]，起始目录的 dir_entry 为 None
+        """
+        if self.root[0] not in self.done_dirs:
+            return [(self.root[0], self.root[1], None)]
+        pending = []
+        for event in self.done_dirs.values():
+            for dir_entry, local_dir in event["dirs"]:
+                if dir_entry["id"] not in self.done_dirs:
+                    pending.append((dir_entry["id"], local_dir, dir_entry))
+        return pending
+
+    def dir_ids(self) -> set:
+        """
+        已遍历到的所有目录 ID
+        :return:
+        """
+        dir_ids = set()
+        for event in self.done_dirs.values():
+            dir_ids.update(dir_entry["id"] for dir_entry, _ in event["dirs"])
+        return dir_ids
+
+    def pending_files(self) -> list:
+        """
+        已遍历完的目录中未处理完的文件
+        :return: [(file_entry, local_dir), ...]
+        """
+        return [
+            (file_entry, local_dir)
+            for event in self.done_dirs.values()
+            for file_entry, local_dir in event["files"]
+            if file_entry["id"] not in self.done_file_ids
+        ]
+
+    def is_file_done(self, file_id) -> bool:
+        """
+        文件是否已处理完，断点续传时重新遍历目录可跳过
+        :param file_id:
+        :return:
+        """
+        return file_id in self.done_file_ids
+
+    def _append(self, event):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def start(self, dir_id, local_dir):
+        """
+        开始新的导出，清空旧的断点记录
+        :param dir_id: 起始目录 ID
+        :param local_dir: 起始目录对应的本地目录
+        :return:
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.root = (dir_id, local_dir)
+        self._append({"event": "start", "id": dir_id, "local_dir": local_dir})
+
+    def dir_done(self, dir_id, sub_dirs, files):
+        """
+        记录目录已遍历完
+        :param dir_id:
+        :param sub_dirs: [(sub_dir_entry, sub_local_dir), ...]
+        :param files: [(file_entry, local_dir), ...]
+        :return:
+        """
+        self._append(
+            {
+                "event": "dir",
+                "id": dir_id,
+                "dirs": [[trim_file_entry(entry), path] for entry, path in sub_dirs],
+                "files": [[trim_file_entry(entry), path] for entry, path in files],
+            }
+        )
+
+    def file_done(self, file_id):
+        """
+        记录文件已处理完
+        :param file_id:
+        :return:
+        """
+        self._append({"event": "file", "id": file_id})
+
+    def finish(self):
+        """导出完成，删除断点记录"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,5 +1,8 @@
+import hashlib
 import os
 import sys
+import tempfile
+from typing import Tuple
 
 
 def get_script_directory():
@@ -11,3 +14,50 @@ def get_script_directory():
     else:
         # 如果是普通脚本
         return "."
+
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 流式下载每次读取的字节数
+HEAD_SIZE = 32  # 保留的文件头字节数，用于判断文件类型
+
+
+def stream_to_temp_file(response, dir_path) -> Tuple[str, str, bytes]:
+    """
+    将流式响应分块写入 dir_path 下的临时文件，边写边计算 MD5，内存占用与文件大小无关
+    :param response: stream=True 的 response
+    :param dir_path: 临时文件所在目录，与目标文件同目录才能原子替换
+    :return: (临时文件路径, MD5, 文件头)
+    """
+    md5 = hashlib.md5()
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                if len(head) < HEAD_SIZE:
+                    head += chunk[: HEAD_SIZE - len(head)]
+                md5.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        response.close()
+    return tmp_path, md5.hexdigest(), head
+
+
+def file_md5(file_path) -> str:
+    """
+    分块计算文件 MD5
+    :param file_path:
+    :return: MD5，文件不存在时为空
+    """
+    md5 = hashlib.md5()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                md5.update(chunk)
+    except FileNotFoundError:
+        return ""
+    return md5.hexdigest()
@@ -1,17 +1,94 @@
+import io
 import json
 import logging
 import os
+import re
 import xml.etree.ElementTree as ET
-from typing import Tuple
+from typing import Tuple, Union
 
 MARKDOWN_SUFFIX = ".md"
+# 代码块开始、结束标记
+CODE_FENCES = ("```", "~~~")
+# 标题前添加的章节分隔：{标题级别: 分隔}
+HEADING_BREAKS = {2: "<br><br>", 3: "<br>", 4: "<br>"}
+# 内存中的 XML 笔记超过此大小时增量转换，避免整棵元素树占用数倍于笔记的内存
+XML_STREAM_THRESHOLD = 32 * 1024 * 1024
+
+
+def _clean_heading_bold(match):
+    # 移除标题文本中的所有 ** 标记
+    return "{} {}".format(match.group(1), match.group(2).replace("**", ""))
+
+
+# 清理 markdown 格式的行内规则，依次作用于代码块外的每一行：(行中须包含的文本, 正则, 替换)
+MARKDOWN_LINE_RULES = (
+    # 清理标题中的所有粗体标记（包括部分粗体）
+    # 例如：## 学习表征（**Representations**） -> ## 学习表征（Representations）
+    ("#", re.compile(r"^(#{1,6})\s+(.+)$"), _clean_heading_bold),
+    # 修复 **Text: **[link] 格式，改为 **Text:** [link]
+    ("**", re.compile(r"\*\*([^*]+):\s*\*\*\s*\["), r"**\1:** ["),
+    # 修复连续的 **** 为 **（两个粗体紧邻）
+    ("****", re.compile(r"\*\*\*\*"), "**"),
+    # 修复不完整的粗体标记：**text1**text2** -> **text1text2**
+    # 只处理中间没有空格的情况，避免影响 **text1** text2 **text3** 这种正常情况
+    ("**", re.compile(r"\*\*([^*]+)\*\*([^*\s]+?)\*\*"), r"**\1\2**"),
+)
+
+
+class BlockConvert(object):
+    """
+    块转换规则基类
+    convert_{类型}_func 即为该类型的转换函数；新类型可通过 register 注册，无需修改转换流程
+    转换时先通过 get_handlers 生成 {类型: 转换函数}，每个块直接查表，不再逐块拼接方法名、getattr
+    """
+
+    @classmethod
+    def _handler_name(cls, block_type) -> str:
+        return "convert_{}_func".format(block_type.replace("-", "_"))
+
+    @classmethod
+    def _wrap_handler(cls, func):
+        return func
+
+    @classmethod
+    def register(cls, block_type, func=None):
+        """
+        注册类型的转换函数，已有同类型的转换函数时覆盖，也可作为装饰器使用：
+        @JsonConvert.register("xx")
+        def convert_xx(converter, content): ...
+        :param block_type: 块类型
+        :param func: 转换函数，参数同该类的 convert_{类型}_func
+        :return: func
+        """
 
+        def decorator(handler):
+            setattr(cls, cls._handler_name(block_type), cls._wrap_handler(handler))
+            return handler
 
-class XmlElementConvert(object):
+        return decorator(func) if func else decorator
+
+    def get_handlers(self) -> dict:
+        """
+        获取所有转换函数
+        :return: {类型: 转换函数}，类型中的 - 替换为 _
+        """
+        prefix, suffix = "convert_", "_func"
+        return {
+            name[len(prefix) : -len(suffix)]: getattr(self, name)
+            for name in dir(self)
+            if name.startswith(prefix) and name.endswith(suffix)
+        }
+
+
+class XmlElementConvert(BlockConvert):
     """
-    XML Element 转换规则
+    XML Element 转换规则，转换函数参数为 text、element、list_item
     """
 
+    @classmethod
+    def _wrap_handler(cls, func):
+        return staticmethod(func)
+
     @staticmethod
     def convert_para_func(**kwargs):
         """正常文本（粗体、斜体、删除线、链接）"""
@@ -164,9 +241,9 @@ class XmlElementConvert(object):
         return original_text
 
 
-class JsonConvert(object):
+class JsonConvert(BlockConvert):
     """
-    json 转换规则
+    json 转换规则，转换函数参数为 (self, content)
     """
 
     def _get_common_text(self, content: dict) -> Tuple[list, str]:
@@ -174,23 +251,27 @@ class JsonConvert(object):
         :return
             text(text): 文本内容
         """
-        all_text = ""
         # 5 内容
         five_contents = content.get("5")
         # 判断是否是普通文本
         if five_contents:
             seven_contents = five_contents[0].get("7")
-            if not seven_contents:
-                return all_text
-            for seven_content in seven_contents:
-                # 8 文本
-                text = seven_content.get("8")
-                # 9 文本属性
-                text_attrs = seven_content.get("9")
-                if text and text_attrs:
-                    text = self._convert_text_attribute(text, text_attrs)
-                all_text += text
-        return all_text
+            if seven_contents:
+                return self._join_texts(seven_contents)
+        return ""
+
+    def _join_texts(self, seven_contents: list) -> str:
+        """拼接 7 中的各段文本，先放入列表再一次拼接，避免逐段 += 复制"""
+        texts = []
+        for seven_content in seven_contents:
+            # 8 文本
+            text = seven_content.get("8")
+            # 9 文本属性
+            text_attrs = seven_content.get("9")
+            if text and text_attrs:
+                text = self._convert_text_attribute(text, text_attrs)
+            texts.append(text)
+        return "".join(texts)
 
     def _convert_text_attribute(self, text: str, text_attrs: list):
         """文本属性
@@ -261,7 +342,7 @@ class JsonConvert(object):
 
     def convert_text_func(self, content) -> str:
         """正常文本、粗体、斜体、删除线、链接"""
-        all_text = ""
+        texts = []
         one_five_contents = content.get("5")
         if one_five_contents:
             for one_five_content in one_five_contents:
@@ -274,15 +355,7 @@ class JsonConvert(object):
 
                 # 获取文本和属性
                 if seven_contents and not two_five_contents:
-                    text = ""
-                    for seven_content in seven_contents:
-                        # 8 文本
-                        raw = seven_content.get("8")
-                        # 9 文本属性
-                        text_attrs = seven_content.get("9")
-                        if raw and text_attrs:
-                            raw = self._convert_text_attribute(raw, text_attrs)
-                        text += raw
+                    text = self._join_texts(seven_contents)
 
                 # 链接类型
                 elif text_type == "li" and two_five_contents:
@@ -297,8 +370,8 @@ class JsonConvert(object):
                 else:
                     text = ""
                 if text:
-                    all_text += text
-        return all_text
+                    texts.append(text)
+        return "".join(texts)
 
     def convert_h_func(self, content) -> str:
         """标题"""
@@ -325,10 +398,10 @@ class JsonConvert(object):
         """代码块"""
         language = content.get("4").get("la")
         codes: list = content.get("5")
-        code_block = ""
-        for code in codes:
-            text = self._get_common_text(code)
-            code_block += text + "\n"
+        # 每行末尾换行
+        lines = [self._get_common_text(code) for code in codes]
+        lines.append("")
+        code_block = "\n".join(lines)
 
         return "```{language}\r\n{code_block}```".format(
             language=language, code_block=code_block
@@ -336,24 +409,22 @@ class JsonConvert(object):
 
     def convert_la_func(self, content):
         """高亮块"""
-        lines: list = content.get("5")
-        highlight_block = ""
-        for line in lines:
-            text = self._get_common_text(line)
-            highlight_block += text + "\n"
+        lines = [self._get_common_text(line) for line in content.get("5")]
+        lines.append("")
+        highlight_block = "\n".join(lines)
 
         return "```\r\n{highlight_block}```".format(highlight_block=highlight_block)
 
     def convert_q_func(self, content):
         """引用"""
         q_text_list = content["5"]
-        text = ""
+        lines = []
         for q_text_dict in q_text_list:
             q_text = self._get_common_text(q_text_dict)
             # 去除第一行的换行
             q_text = q_text.replace("\n", "")
-            text += "> {q_text}\n".format(q_text=q_text)
-        return text
+            lines.append("> {q_text}\n".format(q_text=q_text))
+        return "".join(lines)
 
     def convert_l_func(self, content):
         """有序列表和无序列表，有序列表转成无序列表"""
@@ -372,24 +443,23 @@ class JsonConvert(object):
         """
         nl = "\r\n"  # 考虑 Windows 系统，换行符设为 \r\n
         tr_list = content["5"]
-        table_lines = ""
+        # 整个表格的各段文本依次放入列表，最后一次拼接
+        table_parts = []
 
         for index, tc in enumerate(tr_list):
             table_content_list = tc["5"]
-            table_content_len = len(table_content_list)
             if index == 1:
-                table_line = "| -- " * table_content_len + "|\n| "
-            else:
-                table_line = "| "
+                table_parts.append("| -- " * len(table_content_list) + "|\n")
+            table_parts.append("| ")
             for table_content in table_content_list:
                 table_text_list = table_content.get("5")[0].get("5")[0].get("7")
                 if table_text_list:
-                    table_text = table_text_list[0]["8"]
+                    table_parts.append(table_text_list[0]["8"])
                 else:
-                    table_text = " "
-                table_line = table_line + table_text + " | "
-            table_lines = table_lines + table_line + f"{nl}"
-        return table_lines
+                    table_parts.append(" ")
+                table_parts.append(" | ")
+            table_parts.append(nl)
+        return "".join(table_parts)
 
 
 class YoudaoNoteConvert(object):
@@ -397,6 +467,22 @@ class YoudaoNoteConvert(object):
     有道云笔记 note 内容转换为 markdown 内容
     """
 
+    @staticmethod
+    def _to_str(content: Union[bytes, str]) -> str:
+        return content.decode("utf-8") if isinstance(content, bytes) else content
+
+    @staticmethod
+    def html_to_markdown(content: Union[bytes, str]) -> str:
+        """
+        转换 HTML 内容为 MarkDown 内容
+        :param content: HTML 字节码或字符串
+        :return: markdown 内容
+        """
+        from markdownify import markdownify as md
+
+        # 如果换行符丢失，使用 md(content_str.replace('<br>', '<br><br>').replace('</div>', '</div><br><br>')).rstrip()
+        return md(YoudaoNoteConvert._to_str(content))
+
     @staticmethod
     def covert_html_to_markdown(file_path):
         """
@@ -405,11 +491,7 @@ class YoudaoNoteConvert(object):
         :return:
         """
         with open(file_path, "rb") as f:
-            content_str = f.read().decode("utf-8")
-        from markdownify import markdownify as md
-
-        # 如果换行符丢失，使用 md(content_str.replace('<br>', '<br><br>').replace('</div>', '</div><br><br>')).rstrip()
-        new_content = md(content_str)
+            new_content = YoudaoNoteConvert.html_to_markdown(f.read())
         base = os.path.splitext(file_path)[0]
         new_file_path = "".join([base, MARKDOWN_SUFFIX])
         os.rename(file_path, new_file_path)
@@ -417,37 +499,104 @@ class YoudaoNoteConvert(object):
             f.write(new_content.encode())
 
     @staticmethod
-    def _covert_xml_to_markdown_content(file_path):
-        # 使用 xml.etree.ElementTree 将 xml 文件转换为对象
-        element_tree = ET.parse(file_path)
-        note_element = element_tree.getroot()  # note Element
+    def _xml_element_converter(list_item: dict):
+        """
+        获取 body 下元素的转换函数，每种 tag 只查找一次转换函数
+        :param list_item: list_item 的 id 与 type 的对应，可在 head 解析完后再填入
+        :return: convert(element) -> markdown 块
+        """
+        handlers = XmlElementConvert().get_handlers()
+        tag_handlers = {}  # {element.tag: 转换函数}
+
+        def convert(element):
+            text = XmlElementConvert.get_text_by_key(list(element))
+            if element.tag not in tag_handlers:
+                name = element.tag.replace("{http://note.youdao.com}", "")
+                tag_handlers[element.tag] = handlers.get(name.replace("-", "_"))
+            convert_func = tag_handlers[element.tag]
+            # 如果没有转换，只保留文字
+            if not convert_func:
+                return text
+            return convert_func(text=text, element=element, list_item=list_item)
+
+        return convert
 
+    @staticmethod
+    def _xml_tree_to_markdown(note_element) -> str:
+        """
+        转换已解析的 XML 笔记元素树
+        :param note_element: note Element
+        :return: markdown 内容
+        """
         # list_item 的 id 与 type 的对应
         list_item = {}
         for child in note_element[0]:
             if "list" in child.tag:
                 list_item[child.attrib["id"]] = child.attrib["type"]
+        convert = YoudaoNoteConvert._xml_element_converter(list_item)
+        return f"\r\n\r\n".join(convert(element) for element in note_element[1])
 
-        body_element = note_element[1]  # Element
-        new_content_list = []
-        for element in list(body_element):
-            text = XmlElementConvert.get_text_by_key(list(element))
-            name = element.tag.replace("{http://note.youdao.com}", "").replace("-", "_")
-            convert_func = getattr(
-                XmlElementConvert, "convert_{}_func".format(name), None
-            )
-            # 如果没有转换，只保留文字
-            if not convert_func:
-                new_content_list.append(text)
+    @staticmethod
+    def iter_xml_to_markdown(source):
+        """
+        增量转换 XML 笔记：body 下每个元素解析完成后立即转换并返回，随后释放该元素，
+        不用先构建整棵元素树，内存占用只与最大的单个元素有关；比整篇解析慢，只用于文件或很大的笔记
+        :param source: 文件路径或文件对象
+        :return: markdown 块生成器，XML 格式错误时抛出 ET.ParseError
+        """
+        list_item = {}  # list_item 的 id 与 type 的对应，在 head 中
+        convert = YoudaoNoteConvert._xml_element_converter(list_item)
+        depth = 0
+        section_count = 0  # note 下已开始的元素数，第 1 个为 head，第 2 个为 body
+        section = None
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2:
+                    section_count += 1
+                    section = element
                 continue
-            line_content = convert_func(text=text, element=element, list_item=list_item)
-            new_content_list.append(line_content)
-        return f"\r\n\r\n".join(new_content_list)  # 换行 1 行
+            depth -= 1
+            # 只处理 head、body 下的直接子元素
+            if depth != 2:
+                continue
+            if section_count == 1:
+                if "list" in element.tag:
+                    list_item[element.attrib["id"]] = element.attrib["type"]
+            elif section_count == 2:
+                yield convert(element)
+            # 已处理的元素从树中移除，释放内存
+            section.remove(element)
+
+    @staticmethod
+    def xml_to_markdown(content: Union[bytes, str]) -> str:
+        """
+        转换 XML 内容为 MarkDown 内容
+        内容已在内存中，一般整篇解析后转换（更快）；超过 XML_STREAM_THRESHOLD 时增量转换，不构建整棵元素树
+        :param content: XML 字节码或字符串，为空时返回空字符串
+        :return: markdown 内容
+        """
+        if not content:
+            return ""
+        if len(content) < XML_STREAM_THRESHOLD:
+            # 使用 xml.etree.ElementTree 将 xml 内容转换为对象
+            return YoudaoNoteConvert._xml_tree_to_markdown(ET.fromstring(content))
+        if isinstance(content, bytes):
+            source = io.BytesIO(content)
+        else:
+            source = io.StringIO(content)
+        blocks = YoudaoNoteConvert.iter_xml_to_markdown(source)
+        return f"\r\n\r\n".join(blocks)  # 换行 1 行
+
+    @staticmethod
+    def _covert_xml_to_markdown_content(file_path):
+        blocks = YoudaoNoteConvert.iter_xml_to_markdown(file_path)
+        return f"\r\n\r\n".join(blocks)
 
     @staticmethod
     def covert_xml_to_markdown(file_path) -> bool:
         """
-        转换 XML 为 MarkDown
+        转换 XML 为 MarkDown，边解析边写入，大笔记不用整篇读入内存
         :param file_path:
         :return:
         """
@@ -458,88 +607,134 @@ class YoudaoNoteConvert(object):
             os.rename(file_path, new_file_path)
             return False
 
-        new_content = YoudaoNoteConvert._covert_xml_to_markdown_content(file_path)
-        os.rename(file_path, new_file_path)
-        with open(new_file_path, "wb") as f:
-            f.write(new_content.encode("utf-8"))
+        tmp_path = new_file_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                blocks = YoudaoNoteConvert.iter_xml_to_markdown(file_path)
+                for i, block in enumerate(blocks):
+                    if i:
+                        f.write(b"\r\n\r\n")  # 换行 1 行
+                    f.write(block.encode("utf-8"))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, new_file_path)
+        if os.path.exists(file_path) and file_path != new_file_path:
+            os.remove(file_path)
         return True
 
     @staticmethod
-    def _covert_json_to_markdown_content(file_path):
+    def json_to_markdown(content: Union[bytes, str]) -> str:
+        """
+        转换 Json 内容为 MarkDown 内容，并清理格式问题
+        :param content: Json 字节码或字符串，为空时返回空字符串
+        :return: markdown 内容
+        """
+        if not content:
+            return ""
+        new_content = YoudaoNoteConvert._json_to_markdown_content(
+            YoudaoNoteConvert._to_str(content)
+        )
+        # 清理格式问题
+        return YoudaoNoteConvert._clean_markdown_format(new_content)
+
+    @staticmethod
+    def _json_to_markdown_content(content: str) -> str:
         new_content_list = []
-        # 加载 json 文件
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                json_data = json.load(f)
-            except Exception as e:
-                logging.error(e)
-                json_data = {}
+        # 加载 json 内容
+        try:
+            json_data = json.loads(content)
+        except Exception as e:
+            logging.error(e)
+            json_data = {}
 
         json_contents = json_data["5"]  # 3 代表 id，4 代表信息，5 代表内容，6 代表类型
+        converter = JsonConvert()
+        handlers = converter.get_handlers()
         for content in json_contents:
-            type = content.get("6")
-            # 根据类型处理，无类型的为普通文本
-            if type:
-                convert_func = getattr(
-                    JsonConvert(), "convert_{}_func".format(type), None
-                )
-                # 如果类型没有对应转换函数，只保留文字
-                if not convert_func:
-                    line_content = JsonConvert().convert_text_func(content)
-                else:
-                    line_content = convert_func(content)
-            else:
-                line_content = JsonConvert().convert_text_func(content)
+            # 根据类型处理，无类型或类型没有对应转换函数的，只保留文字
+            block_type = str(content.get("6", "")).replace("-", "_")
+            convert_func = handlers.get(block_type) or converter.convert_text_func
+            line_content = convert_func(content)
 
             # 判断是否有内容
             if line_content:
                 new_content_list.append(line_content)
         return f"\r\n\r\n".join(new_content_list)  # 换行 1 行
 
+    @staticmethod
+    def _covert_json_to_markdown_content(file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return YoudaoNoteConvert._json_to_markdown_content(f.read())
+
     @staticmethod
     def _clean_markdown_format(content: str) -> str:
         """
         清理 markdown 格式问题
+        逐行扫描一次：代码块外的行依次应用 MARKDOWN_LINE_RULES，并在标题前添加 <br> 分隔章节，
+        代码块内的内容保持不变；规则只在行内匹配，不跨行
         :param content: markdown 内容
         :return: 清理后的内容
         """
-        import re
-        # 清理标题中的所有粗体标记（包括部分粗体）
-        # 例如：## 学习表征（**Representations**） -> ## 学习表征（Representations）
-        def clean_heading_bold(match):
-            prefix = match.group(1)  # ## 或 ###
-            heading_text = match.group(2)  # 标题文本
-            # 移除文本中的所有 ** 标记
-            cleaned_text = heading_text.replace('**', '')
-            return f"{prefix} {cleaned_text}"
-        
-        content = re.sub(r'^(#{1,6})\s+(.+)$', clean_heading_bold, content, flags=re.MULTILINE)
-        
-        # 修复 **Text: **[link] 格式，改为 **Text:** [link]
-        # 这种情况通常出现在粗体文本后紧跟链接
-        content = re.sub(r'\*\*([^*]+):\s*\*\*\s*\[', r'**\1:** [', content)
-        
-        # 修复连续的 **** 为 **（两个粗体紧邻）
-        content = re.sub(r'\*\*\*\*', '**', content)
-        
-        # 修复不完整的粗体标记：**text1**text2** -> **text1text2**
-        # 只处理中间没有空格的情况，避免影响 **text1** text2 **text3** 这种正常情况
-        content = re.sub(r'\*\*([^*\n]+)\*\*([^*\s\n]+?)\*\*', r'**\1\2**', content)
-        
-        # 在标题前添加<br>分隔章节，但需要避免：
-        # - 文档开头的标题
-        # - 代码块后的标题（```后）
-        # - 另一个标题后的标题
-        # - 列表后的标题
-        # 只在普通段落、图片、引用等内容后添加
-        
-        # 二级标题前添加2个<br>（只在段落文本、图片、引用块等后面）
-        content = re.sub(r'([^\n`#\-*])\n\n(## [^#])', r'\1<br><br>\n\n\2', content)
-        # 三级和四级标题前添加1个<br>
-        content = re.sub(r'([^\n`#\-*])\n\n(### [^#])', r'\1<br>\n\n\2', content)
-        content = re.sub(r'([^\n`#\-*])\n\n(#### [^#])', r'\1<br>\n\n\2', content)
-        
-        return content
+        lines = content.split("\n")
+        fence = None  # 所在代码块的开始标记，不在代码块中时为 None
+        last_code_index = -1  # 最后一个代码块行
+        last_break = None  # 最后一个添加了分隔的标题 (行号, 级别)
+        for i, line in enumerate(lines):
+            # 代码块标记前最多 3 个空格，缩进更多的是代码内容
+            stripped = line.lstrip(" ")
+            is_fence = stripped.startswith(CODE_FENCES) and len(line) - len(stripped) <= 3
+            if fence or is_fence:
+                if not fence:
+                    fence = stripped[:3]
+                elif is_fence and stripped.startswith(fence):
+                    fence = None
+                last_code_index = i
+                continue
+            for keyword, pattern, repl in MARKDOWN_LINE_RULES:
+                if keyword in line:
+                    line = pattern.sub(repl, line)
+            lines[i] = line
+
+            # 在标题前添加<br>分隔章节，但需要避免：
+            # - 文档开头的标题
+            # - 代码块后的标题（```后）
+            # - 另一个标题后的标题
+            # - 列表后的标题
+            # 只在普通段落、图片、引用等内容后添加（标题与上一段之间为一个空行）
+            if not line.startswith("##") or i < 2 or lines[i - 1]:
+                continue
+            level, heading_break = YoudaoNoteConvert._get_heading_break(
+                line, i + 1 < len(lines)
+            )
+            prev_line = lines[i - 2]
+            if not heading_break or not prev_line or last_code_index == i - 2:
+                continue
+            if prev_line[-1] in "`#-*":
+                continue
+            # 与逐条正则替换的结果保持一致：上一段是已添加分隔的同级标题且只有一个字时，不添加
+            if last_break == (i - 2, level) and len(prev_line) <= level + 2:
+                continue
+            lines[i - 2] = prev_line + heading_break
+            last_break = (i, level)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _get_heading_break(line: str, has_next_line: bool) -> Tuple[int, str]:
+        """
+        标题前的章节分隔：二级标题前 2 个<br>，三级和四级标题前 1 个<br>
+        :param line: 以 ## 开头的行
+        :param has_next_line: 是否还有下一行
+        :return: (标题级别, 分隔)，不需要分隔时分隔为空字符串
+        """
+        level = len(line) - len(line.lstrip("#"))
+        if level not in HEADING_BREAKS or line[level : level + 1] != " ":
+            return level, ""
+        # 空格后须有非 # 字符，行尾的换行也算
+        next_char = line[level + 1 : level + 2] or ("\n" if has_next_line else "")
+        if not next_char or next_char == "#":
+            return level, ""
+        return level, HEADING_BREAKS[level]
 
     @staticmethod
     def covert_json_to_markdown(file_path) -> str:
@@ -554,12 +749,27 @@ class YoudaoNoteConvert(object):
         if os.path.getsize(file_path) == 0:
             os.rename(file_path, new_file_path)
             return False
-        new_content = YoudaoNoteConvert._covert_json_to_markdown_content(file_path)
-        # 清理格式问题
-        new_content = YoudaoNoteConvert._clean_markdown_format(new_content)
+        with open(file_path, "rb") as f:
+            new_content = YoudaoNoteConvert.json_to_markdown(f.read())
         with open(new_file_path, "wb") as f:
             f.write(new_content.encode("utf-8"))
         # 删除旧文件
         if os.path.exists(file_path):
             os.remove(file_path)
         return new_file_path
+
+
+def covert_note_to_markdown(content: bytes, note_type: str) -> Tuple[str, bool]:
+    """
+    转换笔记内容为 MarkDown 内容，模块级函数，可在子进程中执行
+    :param content: 笔记字节码
+    :param note_type: xml 或 json
+    :return: (markdown 内容, 是否按 HTML 转换)
+    """
+    if note_type == "json":
+        return YoudaoNoteConvert.json_to_markdown(content), False
+    try:
+        return YoudaoNoteConvert.xml_to_markdown(content), False
+    except ET.ParseError:
+        # 17 年以前新建的 note 笔记格式为 html
+        return YoudaoNoteConvert.html_to_markdown(content), True
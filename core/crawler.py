@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core.async_api import AsyncYoudaoNoteApi
+
+# 文件任务队列结束标记，不能与任务或 None 混淆
+CRAWL_DONE = object()
+
+
+class DirCrawler(object):
+    """
+    有道云笔记目录树并发爬取
+    广度优先并发获取目录信息，将文件任务放入队列，由下载线程消费
+    """
+
+    def __init__(self, youdaonote_api, workers: int, manifest=None, checkpoint=None):
+        """
+        初始化
+        :param youdaonote_api:
+        :param workers: 并发获取目录信息的线程数
+        :param manifest: 同步记录，不为空时未更新的目录直接使用上次的目录内容
+        :param checkpoint: 断点记录，不为空时记录已遍历完的目录
+        """
+        self.youdaonote_api = youdaonote_api
+        self.workers = max(1, workers)
+        self.manifest = manifest
+        self.checkpoint = checkpoint
+        self.dir_count = 0  # 已遍历的目录数
+        self.cached_dir_count = 0  # 未更新、未请求目录信息的目录数
+        self.dir_ids = set()  # 已遍历的目录 ID
+        self._stop_event = threading.Event()
+        self._count_lock = threading.Lock()
+
+    def stop(self):
+        """停止遍历，已提交的目录请求完成后结束"""
+        self._stop_event.set()
+
+    def _get_cached_entries(self, dir_entry, local_dir):
+        """
+        目录未更新时返回上次的目录内容
+        :param dir_entry: 目录的 fileEntry，起始目录为 None
+        :param local_dir:
+        :return: entries 或 None
+        """
+        if self.manifest is None or dir_entry is None:
+            return None
+        entries = self.manifest.get_dir_entries(dir_entry, local_dir)
+        if entries is not None:
+            with self._count_lock:
+                self.cached_dir_count += 1
+        return entries
+
+    def _list_dir(self, dir_id, local_dir, file_queue, dir_entry=None) -> list:
+        """
+        分页获取目录下所有文件信息，文件放入队列，子目录在本地创建后返回，等待继续遍历
+        :param dir_id:
+        :param local_dir: 目录对应的本地目录
+        :param file_queue:
+        :param dir_entry: 目录的 fileEntry，起始目录为 None
+        :return: [(sub_dir_entry, sub_local_dir), ...]
+        """
+        entries = self._get_cached_entries(dir_entry, local_dir)
+        if entries is None:
+            entries = self.youdaonote_api.iter_dir_entries(dir_id)
+            if self.manifest is not None and dir_entry is not None:
+                entries = self.manifest.record_dir_entries(
+                    dir_entry, local_dir, entries
+                )
+        files = [] if self.checkpoint else None
+        sub_dirs = self._dispatch_entries(entries, local_dir, file_queue, files)
+        if self.checkpoint:
+            self.checkpoint.dir_done(dir_id, sub_dirs, files)
+        return sub_dirs
+
+    def _dispatch_entries(self, entries, local_dir, file_queue, files=None) -> list:
+        """
+        分发目录下所有文件信息
+        :param files: 不为空时，同时将文件 (file_entry, local_dir) 放入此列表
+        断点续传时已处理完的文件只放入 files，不放入队列
+        :return: [(sub_dir_entry, sub_local_dir), ...]
+        """
+        sub_dirs = []
+        for entry in entries:
+            file_entry = entry["fileEntry"]
+            if self.checkpoint and self.checkpoint.is_file_done(file_entry["id"]):
+                # 断点续传时已处理完的文件不再放入队列
+                if files is not None:
+                    files.append((file_entry, local_dir))
+                continue
+            sub_dir = self._dispatch_entry(entry, local_dir, file_queue)
+            if sub_dir:
+                sub_dirs.append(sub_dir)
+            elif files is not None:
+                files.append((entry["fileEntry"], local_dir))
+        return sub_dirs
+
+    @staticmethod
+    def _dispatch_entry(entry, local_dir, file_queue):
+        """
+        文件放入队列；子目录在本地创建后返回
+        :param entry:
+        :param local_dir:
+        :param file_queue:
+        :return: (sub_dir_entry, sub_local_dir) 或 None
+        """
+        file_entry = entry["fileEntry"]
+        if not file_entry["dir"]:
+            file_queue.put((file_entry, local_dir))
+            return None
+        sub_dir = os.path.join(local_dir, file_entry["name"]).replace("\\", "/")
+        if not os.path.exists(sub_dir):
+            os.mkdir(sub_dir)
+        return file_entry, sub_dir
+
+    def _crawl(self, start_dirs, file_queue):
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="crawler"
+        ) as executor:
+            pending = {
+                executor.submit(
+                    self._list_dir, dir_id, local_dir, file_queue, dir_entry
+                )
+                for dir_id, local_dir, dir_entry in start_dirs
+            }
+            while pending and not self._stop_event.is_set():
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.dir_count += 1
+                    for sub_dir_entry, sub_dir in future.result():
+                        self.dir_ids.add(sub_dir_entry["id"])
+                        pending.add(
+                            executor.submit(
+                                self._list_dir,
+                                sub_dir_entry["id"],
+                                sub_dir,
+                                file_queue,
+                                sub_dir_entry,
+                            )
+                        )
+            for future in pending:
+                future.cancel()
+
+    def crawl(self, start_dirs, file_queue: queue.Queue, consumer_count=1):
+        """
+        广度优先遍历目录树，文件任务 (file_entry, local_dir) 放入 file_queue
+        遍历结束（或出错）后放入 consumer_count 个 CRAWL_DONE 结束标记
+        :param start_dirs: 起始目录 [(dir_id, local_dir, dir_entry), ...]，最顶层目录的 dir_entry 为 None
+        :param file_queue: 文件任务队列
+        :param consumer_count: 消费线程数
+        :return:
+        """
+        try:
+            self._crawl(start_dirs, file_queue)
+            if not self._stop_event.is_set():
+                logging.info(
+                    "目录遍历完成，共 {} 个目录，其中 {} 个目录未更新".format(
+                        self.dir_count, self.cached_dir_count
+                    )
+                )
+        finally:
+            for _ in range(consumer_count):
+                file_queue.put(CRAWL_DONE)
+
+
+class AsyncDirCrawler(DirCrawler):
+    """
+    基于 AsyncYoudaoNoteApi 的目录树爬取，单线程内同时进行 workers 个目录请求
+    """
+
+    def _crawl(self, start_dirs, file_queue):
+        asyncio.run(self._async_crawl(start_dirs, file_queue))
+
+    async def _async_crawl(self, start_dirs, file_queue):
+        async_api = AsyncYoudaoNoteApi.from_api(self.youdaonote_api, self.workers)
+        loop = asyncio.get_running_loop()
+
+        async def list_dir(sub_dir_id, sub_local_dir, sub_dir_entry=None):
+            # 文件任务先放入本地缓冲，每页结束后在线程中放入 file_queue，队列已满时不阻塞事件循环
+            buffer_queue = queue.Queue()
+            files = [] if self.checkpoint else None
+            cached_entries = self._get_cached_entries(sub_dir_entry, sub_local_dir)
+            if cached_entries is not None:
+                sub_dirs = self._dispatch_entries(
+                    cached_entries, sub_local_dir, buffer_queue, files
+                )
+            else:
+                sub_dirs = []
+                children = []
+                async for entry in async_api.iter_dir_entries(sub_dir_id):
+                    children.append(entry)
+                    sub_dirs += self._dispatch_entries(
+                        [entry], sub_local_dir, buffer_queue, files
+                    )
+                    if buffer_queue.qsize() >= async_api.DIR_PAGE_SIZE:
+                        await self._flush(loop, buffer_queue, file_queue)
+                if self.manifest is not None and sub_dir_entry is not None:
+                    self.manifest.update_dir(sub_dir_entry, sub_local_dir, children)
+            await self._flush(loop, buffer_queue, file_queue)
+            if self.checkpoint:
+                self.checkpoint.dir_done(sub_dir_id, sub_dirs, files)
+            return sub_dirs
+
+        async with async_api:
+            pending = {
+                asyncio.ensure_future(list_dir(dir_id, local_dir, dir_entry))
+                for dir_id, local_dir, dir_entry in start_dirs
+            }
+            while pending and not self._stop_event.is_set():
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    self.dir_count += 1
+                    for sub_dir_entry, sub_dir in task.result():
+                        self.dir_ids.add(sub_dir_entry["id"])
+                        pending.add(
+                            asyncio.ensure_future(
+                                list_dir(sub_dir_entry["id"], sub_dir, sub_dir_entry)
+                            )
+                        )
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _flush(loop, buffer_queue, file_queue):
+        while not buffer_queue.empty():
+            await loop.run_in_executor(None, file_queue.put, buffer_queue.get_nowait())
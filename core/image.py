@@ -1,17 +1,26 @@
-import hashlib
 import imghdr
 import logging
 import mimetypes
 import os
 import re
+import time
+from itertools import repeat
 from typing import Tuple
 from urllib import parse
 from urllib.parse import urlparse
 
 import requests
 
+from core.common import stream_to_temp_file
+from core.metrics import PullMetrics
+from core.output import OutputWriter
+from core.pool import OrderedTaskPool
+from core.store import OBJECTS_DIR_NAME
+
 REGEX_IMAGE_URL = re.compile(r"!\[.*?\]\((.*?note\.youdao\.com.*?)\)")
 REGEX_ATTACH = re.compile(r"\[(.*?)\]\(((http|https)://note\.youdao\.com.*?)\)")
+# 图片、附件链接中的有道云链接，用于一次性替换
+REGEX_LINK_URL = re.compile(r"(\]\()([^)\n]*?note\.youdao\.com[^)\n]*)\)")
 # 资源统一目录
 ASSETS = "assets_ori"
 
@@ -45,10 +54,18 @@ class ImagePull:
         youdaonote_api,
         smms_secret_token: str,
         is_relative_path: bool,
+        asset_store=None,
+        max_workers=1,
+        output=None,
+        metrics=None,
     ):
         self.youdaonote_api = youdaonote_api
         self.smms_secret_token = smms_secret_token
         self.is_relative_path = is_relative_path
+        self.asset_store = asset_store  # 全局资源存储，为空时直接保存到笔记资源目录
+        self.max_workers = max_workers  # 每篇笔记同时下载的图片、附件数
+        self.output = output if output else OutputWriter()  # 内容未变化时不写入
+        self.metrics = metrics if metrics else PullMetrics()  # 下载、上传耗时统计
 
     @classmethod
     def _url_encode(cls, file_path: str):
@@ -63,71 +80,143 @@ class ImagePull:
         迁移有道云笔记文件 URL
         :param file_path: markdown文件路径
         :param local_dir: 本地目录，用于计算assets路径
-        :return:
+        :return: {有道云链接: 新链接}
         """
-
         # 文件内容为空，也下载到本地
         with open(file_path, "rb") as f:
             content = f.read().decode("utf-8")
+        content, migrated_urls = self.migrate_content(content, file_path, local_dir)
+        self.output.write(file_path, content.encode())
+        return migrated_urls
 
-        # 图片
-        image_urls = REGEX_IMAGE_URL.findall(content)
+    def migrate_content(self, content, file_path, local_dir=None) -> Tuple[str, dict]:
+        """
+        迁移 markdown 内容中的有道云笔记文件 URL
+        :param content: markdown 内容
+        :param file_path: markdown文件路径，用于计算资源目录
+        :param local_dir: 本地目录，用于计算assets路径
+        :return: (新内容, {有道云链接: 新链接})
+        """
+        # 图片、附件，相同链接只处理一次
+        image_urls = list(dict.fromkeys(REGEX_IMAGE_URL.findall(content)))
+        attach_names = {}  # {附件链接: 附件名}
+        for attach_name, attach_url, _ in REGEX_ATTACH.findall(content):
+            # 图片链接也符合附件格式，跳过
+            if attach_url not in image_urls:
+                attach_names.setdefault(attach_url, attach_name)
         if len(image_urls) > 0:
             logging.info("正在转换有道云笔记「{}」中的有道云图片链接...".format(file_path))
-        for image_url in image_urls:
-            try:
-                image_path = self._get_new_image_path(file_path, image_url, local_dir)
-            except Exception as error:
-                logging.info(
-                    "下载图片「{}」可能失败！请检查图片！错误提示：{}".format(image_url, format(error))
-                )
+        if len(attach_names) > 0:
+            logging.info("正在转换有道云笔记「{}」中的有道云附件链接...".format(file_path))
+
+        # 图片、附件一起并发下载，全部完成后再统一替换
+        with OrderedTaskPool(self.max_workers, "image") as pool:
+            paths = pool.map(
+                self._migrate_url,
+                repeat(file_path),
+                image_urls + list(attach_names),
+                [None] * len(image_urls) + list(attach_names.values()),
+                repeat(local_dir),
+            )
+        image_paths, attach_paths = paths[: len(image_urls)], paths[len(image_urls) :]
+
+        migrated_urls = {}
+        for image_url, image_path in zip(image_urls, image_paths):
             if image_url == image_path:
                 continue
-            # 将绝对路径替换为相对路径
-            # markdown 文件在 posts/ 目录，图片在 assets/ 目录，需要 ../assets/...
             if self.is_relative_path and not self.smms_secret_token:
-                assets_index = image_path.find(ASSETS)
-                if assets_index != -1:
-                    # 从 assets 开始的相对路径
-                    relative_path = image_path[assets_index:]
-                    # 由于 md 文件在 posts/ 目录，需要 ../ 前缀
-                    # 使用 <> 包裹路径以支持包含空格和括号的路径
-                    image_path = "<../" + relative_path + ">"
-                else:
-                    # 如果找不到 assets，保持原样
-                    image_path = image_path
-
-            content = content.replace(image_url, image_path)
-
-        # 附件
-        attach_name_and_url_list = REGEX_ATTACH.findall(content)
-        if len(attach_name_and_url_list) > 0:
-            logging.info("正在转换有道云笔记「{}」中的有道云附件链接...".format(file_path))
-        for attach_name_and_url in attach_name_and_url_list:
-            attach_url = attach_name_and_url[1]
-            attach_path = self._download_ydnote_url(
-                file_path, attach_url, attach_name_and_url[0], local_dir
-            )
+                image_path = self._get_relative_path(image_path)
+            migrated_urls[image_url] = image_path
+        for attach_url, attach_path in zip(attach_names, attach_paths):
+            # 下载失败的附件保留原链接
             if not attach_path:
                 continue
-            # 将绝对路径替换为相对路径
-            # markdown 文件在 posts/ 目录，附件在 assets/ 目录，需要 ../assets/...
             if self.is_relative_path:
-                assets_index = attach_path.find(ASSETS)
-                if assets_index != -1:
-                    # 从 assets 开始的相对路径
-                    relative_path = attach_path[assets_index:]
-                    # 由于 md 文件在 posts/ 目录，需要 ../ 前缀
-                    # 使用 <> 包裹路径以支持包含空格和括号的路径
-                    attach_path = "<../" + relative_path + ">"
-                else:
-                    # 如果找不到 assets，保持原样
-                    attach_path = attach_path
-            content = content.replace(attach_url, attach_path)
-
-        with open(file_path, "wb") as f:
-            f.write(content.encode())
-        return
+                attach_path = self._get_relative_path(attach_path)
+            migrated_urls[attach_url] = attach_path
+
+        content = self._rewrite_links(content, migrated_urls)
+
+        # 笔记更新时不再清空资源目录，只删除不再引用的图片、附件，其余不用重新下载
+        self._clean_unused_assets(file_path, local_dir, migrated_urls)
+        return content, migrated_urls
+
+    @staticmethod
+    def _rewrite_links(content, migrated_urls) -> str:
+        """
+        一次遍历替换所有图片、附件链接，只替换链接中的地址，正文中相同的文字不受影响
+        :param content:
+        :param migrated_urls: {有道云链接: 新链接}
+        :return:
+        """
+        if not migrated_urls:
+            return content
+
+        def replace(match):
+            new_path = migrated_urls.get(match.group(2))
+            if new_path is None:
+                return match.group(0)
+            return match.group(1) + new_path + ")"
+
+        return REGEX_LINK_URL.sub(replace, content)
+
+    def _migrate_url(self, file_path, url, attach_name=None, local_dir=None) -> str:
+        """
+        迁移图片或附件
+        :param attach_name: 附件名，为 None 时为图片
+        :return: 同 _migrate_image、_download_ydnote_url
+        """
+        if attach_name is None:
+            return self._migrate_image(file_path, url, local_dir)
+        return self._download_ydnote_url(file_path, url, attach_name, local_dir)
+
+    def _migrate_image(self, file_path, image_url, local_dir=None) -> str:
+        """
+        下载或上传图片
+        :return: new_image_path，失败时为原链接
+        """
+        try:
+            return self._get_new_image_path(file_path, image_url, local_dir)
+        except Exception as error:
+            logging.info(
+                "下载图片「{}」可能失败！请检查图片！错误提示：{}".format(image_url, format(error))
+            )
+            return image_url
+
+    @staticmethod
+    def _get_relative_path(path) -> str:
+        """
+        将绝对路径替换为相对路径
+        markdown 文件在 posts/ 目录，图片、附件在 assets/ 目录，需要 ../assets/...
+        :param path:
+        :return:
+        """
+        assets_index = path.find(ASSETS)
+        if assets_index == -1:
+            # 如果找不到 assets，保持原样
+            return path
+        # 使用 <> 包裹路径以支持包含空格和括号的路径
+        return "<../" + path[assets_index:] + ">"
+
+    def _clean_unused_assets(self, file_path, local_dir, migrated_urls):
+        """
+        删除笔记资源目录中不再引用的文件
+        :param file_path: markdown文件路径
+        :param local_dir:
+        :param migrated_urls: {有道云链接: 新链接}
+        :return:
+        """
+        local_file_dir = self._get_local_file_dir(file_path, local_dir)
+        if not os.path.isdir(local_file_dir):
+            return
+        used_names = {
+            os.path.basename(path.strip("<>")) for path in migrated_urls.values()
+        }
+        for name in os.listdir(local_file_dir):
+            unused_path = os.path.join(local_file_dir, name).replace("\\", "/")
+            if name not in used_names and os.path.isfile(unused_path):
+                logging.info("删除笔记中已不再引用的资源：「{}」".format(unused_path))
+                os.remove(unused_path)
 
     def _get_new_image_path(self, file_path, image_url, local_dir=None) -> str:
         """
@@ -143,11 +232,14 @@ class ImagePull:
             return image_path or image_url
 
         # smms_secret_token 不为空，上传到 SM.MS
-        new_file_url, error_msg = ImageUpload.upload_to_smms(
-            youdaonote_api=self.youdaonote_api,
-            image_url=image_url,
-            smms_secret_token=self.smms_secret_token,
-        )
+        with self.metrics.stage("upload_smms"):
+            new_file_url, error_msg = ImageUpload.upload_to_smms(
+                youdaonote_api=self.youdaonote_api,
+                image_url=image_url,
+                smms_secret_token=self.smms_secret_token,
+                asset_store=self.asset_store,
+                metrics=self.metrics,
+            )
         # 如果上传失败，仍下载到本地
         if not error_msg:
             return new_file_url
@@ -164,20 +256,46 @@ class ImagePull:
         :param local_dir: 本地目录，用于计算assets路径
         :return:  path
         """
+        file_type = "附件" if attach_name else "图片"
+        local_file_dir = self._get_local_file_dir(file_path, local_dir)
+
+        # 已下载过此链接（本笔记上次导出或其他笔记），直接链接到缓存文件
+        record = self.asset_store.get(url) if self.asset_store else None
+        if record and not self.asset_store.is_stale(record):
+            local_file_path = self._link_cached(record, url, file_type, local_file_dir)
+            if local_file_path:
+                return local_file_path
+
+        start = time.perf_counter()
         try:
-            response = self.youdaonote_api.http_get(url)
-        except requests.exceptions.ProxyError as err:
+            # 流式下载，大附件也不会整个读入内存；缓存较旧时带上 ETag 等确认是否变化
+            if record:
+                response = self.youdaonote_api.http_get(
+                    url, stream=True, headers=self.asset_store.get_validators(record)
+                )
+                if response.status_code == 304:
+                    response.close()
+                    self.asset_store.touch(url)
+                    local_file_path = self._link_cached(
+                        record, url, file_type, local_file_dir
+                    )
+                    if local_file_path:
+                        return local_file_path
+                    response = self.youdaonote_api.http_get(url, stream=True)
+            else:
+                response = self.youdaonote_api.http_get(url, stream=True)
+        except requests.exceptions.RequestException as err:
             error_msg = "网络错误，「{}」下载失败。错误提示：{}".format(url, format(err))
             logging.info(error_msg)
             return ""
 
         content_type = response.headers.get("Content-Type")
-        file_type = "附件" if attach_name else "图片"
         if response.status_code != 200 or not content_type:
             error_msg = "下载「{}」失败！{}可能已失效，可浏览器登录有道云笔记后，查看{}是否能正常加载".format(
                 url, file_type, file_type
             )
             logging.info(error_msg)
+            response.close()
             return ""
 
         normalized_content_type = content_type.split(";")[0].strip().lower() if content_type else ""
@@ -189,40 +307,33 @@ class ImagePull:
         ):
             error_msg = "下载「{}」失败！返回内容非图片（{}）".format(url, normalized_content_type)
             logging.info(error_msg)
+            response.close()
+            return ""
+
+        if not os.path.exists(local_file_dir):
+            os.makedirs(local_file_dir, exist_ok=True)
+
+        # 先写入临时文件，边写边计算 MD5，完成后再原子重命名
+        tmp_dir = self.asset_store.get_temp_dir() if self.asset_store else local_file_dir
+        try:
+            tmp_path, unique_hash, head = stream_to_temp_file(response, tmp_dir)
+        except Exception as err:
+            error_msg = "{} {}有误！错误提示：{}".format(url, file_type, format(err))
+            logging.info(error_msg)
             return ""
+        self.metrics.add_stage(
+            "download_attach" if attach_name else "download_image",
+            time.perf_counter() - start,
+            size=os.path.getsize(tmp_path),
+        )
 
         if attach_name:
             # 附件使用原文件名
             file_suffix = attach_name
         else:
-            # 图片根据 URL 或 content-type 获取扩展名
-            file_suffix = self._guess_image_extension(url, normalized_content_type, response.content)
+            # 图片根据 URL、文件头或 content-type 获取扩展名
+            file_suffix = self._guess_image_extension(url, normalized_content_type, head)
 
-        # 获取文件所在目录
-        if file_path.find(".") == -1:
-            # 如果 file_path 没有扩展名，说明是目录，直接在该目录下创建 assets 文件夹
-            file_dir = file_path
-            md_file_name = None
-        else:
-            # 获取markdown文件名（不含扩展名）
-            md_file_name = os.path.splitext(os.path.basename(file_path))[0]
-            # 如果提供了local_dir，说明markdown文件在posts文件夹，需要在local_dir下创建 assets
-            if local_dir:
-                file_dir = local_dir
-            else:
-                # 否则使用markdown文件所在目录
-                file_dir = file_path[: file_path.rfind("/")]
-        
-        # 构建本地文件目录
-        # 图片和附件都保存在 assets/{markdown文件名}/ 下
-        if md_file_name:
-            local_file_dir = os.path.join(file_dir, ASSETS, md_file_name).replace("\\", "/")
-        else:
-            # 如果没有文件名，直接保存在assets文件夹下
-            local_file_dir = os.path.join(file_dir, ASSETS).replace("\\", "/")
-
-        if not os.path.exists(local_file_dir):
-            os.makedirs(local_file_dir, exist_ok=True)
         file_basename = os.path.basename(urlparse(url).path)
 
         if attach_name:
@@ -244,22 +355,76 @@ class ImagePull:
             file_name = sanitize_filename(file_name)
         else:
             # 图片使用唯一编码命名（基于内容 MD5，相同内容复用文件）
-            unique_hash = hashlib.md5(response.content).hexdigest()
             file_name = f"{unique_hash}{file_suffix}"
         
         local_file_path = os.path.join(local_file_dir, file_name).replace("\\", "/")
 
         try:
-            with open(local_file_path, "wb") as f:
-                f.write(response.content)  # response.content 本身就为字节类型
+            if self.asset_store:
+                # 相同内容只保存一份，笔记资源目录中为硬链接
+                object_path = self.asset_store.add(
+                    tmp_path, unique_hash, os.path.splitext(file_name)[1]
+                )
+                self.output.link(object_path, local_file_path)
+                self.asset_store.put(url, object_path, file_name, response.headers)
+            else:
+                self.output.replace(tmp_path, local_file_path, unique_hash)
             logging.info("已将{}「{}」转换为「{}」".format(file_type, url, local_file_path))
         except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             error_msg = "{} {}有误！".format(url, file_type)
             logging.info(error_msg)
             return ""
 
         return local_file_path
 
+    def _link_cached(self, record, url, file_type, local_file_dir) -> str:
+        """
+        将缓存文件链接到笔记资源目录
+        :return: path，失败时为空
+        """
+        local_file_path = os.path.join(local_file_dir, record["name"]).replace("\\", "/")
+        try:
+            os.makedirs(local_file_dir, exist_ok=True)
+            self.output.link(self.asset_store.object_path(record), local_file_path)
+        except OSError as err:
+            logging.info("复用{}「{}」失败，将重新下载。错误提示：{}".format(file_type, url, format(err)))
+            return ""
+        logging.info("{}「{}」已下载过，复用「{}」".format(file_type, url, local_file_path))
+        return local_file_path
+
+    @staticmethod
+    def _get_local_file_dir(file_path, local_dir=None) -> str:
+        """
+        获取笔记的资源目录，图片和附件都保存在 assets/{markdown文件名}/ 下
+        :param file_path: markdown文件路径
+        :param local_dir: 本地目录
+        :return:
+        """
+        # 获取文件所在目录
+        if file_path.find(".") == -1:
+            # 如果 file_path 没有扩展名，说明是目录，直接在该目录下创建 assets 文件夹
+            file_dir = file_path
+            md_file_name = None
+        else:
+            # 获取markdown文件名（不含扩展名）
+            md_file_name = os.path.splitext(os.path.basename(file_path))[0]
+            # 如果提供了local_dir，说明markdown文件在posts文件夹，需要在local_dir下创建 assets
+            if local_dir:
+                file_dir = local_dir
+            else:
+                # 否则使用markdown文件所在目录
+                file_dir = file_path[: file_path.rfind("/")]
+
+        if md_file_name:
+            # 笔记名与全局资源存储目录同名时加上后缀，避免覆盖或清理存储中的文件
+            if md_file_name == OBJECTS_DIR_NAME:
+                md_file_name += "_"
+            return os.path.join(file_dir, ASSETS, md_file_name).replace("\\", "/")
+        # 如果没有文件名，直接保存在assets文件夹下
+        return os.path.join(file_dir, ASSETS).replace("\\", "/")
+
     @staticmethod
     def _guess_image_extension(url: str, content_type: str, data: bytes) -> str:
         ext = os.path.splitext(urlparse(url).path)[1].lower()
@@ -299,15 +464,29 @@ class ImageUpload(object):
     """
 
     @staticmethod
-    def upload_to_smms(youdaonote_api, image_url, smms_secret_token) -> Tuple[str, str]:
+    def upload_to_smms(
+        youdaonote_api, image_url, smms_secret_token, asset_store=None, metrics=None
+    ) -> Tuple[str, str]:
         """
         上传图片到 sm.ms
         :param image_url:
         :param smms_secret_token:
+        :param asset_store: 资源缓存，已上传过的图片不再上传，已下载过的图片不再下载
+        :param metrics: 记录上传请求
         :return: url, error_msg
         """
+        if asset_store:
+            url = asset_store.get_uploaded(image_url)
+            if url:
+                logging.info("图片「{}」已上传过，复用「{}」".format(image_url, url))
+                return url, ""
+        record = asset_store.get(image_url) if asset_store else None
         try:
-            smfile = youdaonote_api.http_get(image_url).content
+            if record:
+                with open(asset_store.object_path(record), "rb") as f:
+                    smfile = f.read()
+            else:
+                smfile = youdaonote_api.http_get(image_url).content
         except:
             error_msg = "下载「{}」失败！图片可能已失效，可浏览器登录有道云笔记后，查看图片是否能正常加载".format(image_url)
             return "", error_msg
@@ -320,9 +499,12 @@ class ImageUpload(object):
             "将下载图片到本地".format(image_url)
         )
         try:
-            res_json = requests.post(
+            response = requests.post(
                 upload_api_url, headers=headers, files=files, timeout=5
-            ).json()
+            )
+            if metrics:
+                metrics.add_request(upload_api_url, response.status_code, len(response.content))
+            res_json = response.json()
         except requests.exceptions.ProxyError as err:
             error_msg = "网络错误，上传「{}」到 SM.MS 失败！将下载图片到本地。错误提示：{}".format(
                 image_url, format(err)
@@ -333,10 +515,13 @@ class ImageUpload(object):
 
         if res_json.get("success"):
             url = res_json["data"]["url"]
-            logging.info("已将图片「{}」转换为「{}」".format(image_url, url))
-            return url, ""
-        if res_json.get("code") == "image_repeated":
+        elif res_json.get("code") == "image_repeated":
             url = res_json["images"]
+        else:
+            url = ""
+        if url:
+            if asset_store:
+                asset_store.set_uploaded(image_url, url)
             logging.info("已将图片「{}」转换为「{}」".format(image_url, url))
             return url, ""
         if res_json.get("code") == "flood":
@@ -1,6 +1,7 @@
 import logging
 import os
 import sys
+import threading
 from datetime import datetime
 
 from core.common import get_script_directory
@@ -24,3 +25,45 @@ def init_logging():
         format=LOG_FORMAT,
         datefmt=DATE_FORMAT,
     )
+
+
+# 并发执行时按线程暂存日志，任务结束后再按提交顺序输出，保证日志顺序确定
+_thread_buffer = threading.local()
+
+
+class _ThreadBufferFilter(logging.Filter):
+    def filter(self, record):
+        records = getattr(_thread_buffer, "records", None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+
+_BUFFER_FILTER = _ThreadBufferFilter()
+
+
+def start_buffering():
+    """当前线程开始暂存日志"""
+    root_logger = logging.getLogger()
+    if _BUFFER_FILTER not in root_logger.filters:
+        root_logger.addFilter(_BUFFER_FILTER)
+    _thread_buffer.records = []
+
+
+def stop_buffering() -> list:
+    """当前线程停止暂存日志，返回暂存的日志记录"""
+    records = getattr(_thread_buffer, "records", None) or []
+    _thread_buffer.records = None
+    return records
+
+
+def emit_records(records):
+    """输出暂存的日志记录，当前线程也在暂存时（线程池嵌套）并入当前线程的暂存"""
+    buffered = getattr(_thread_buffer, "records", None)
+    if buffered is not None:
+        buffered.extend(records)
+        return
+    root_logger = logging.getLogger()
+    for record in records:
+        root_logger.callHandlers(record)
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+
+MANIFEST_FILE_NAME = ".youdaonote_manifest.jsonl"
+DIR_RECORD_TYPE = "dir"
+# 目录缓存中每个文件保留的 fileEntry 字段
+CACHED_ENTRY_KEYS = (
+    "id",
+    "name",
+    "dir",
+    "modifyTimeForSort",
+    "createTimeForSort",
+    "version",
+)
+
+
+def trim_file_entry(file_entry) -> dict:
+    """
+    只保留同步需要的 fileEntry 字段
+    :param file_entry:
+    :return:
+    """
+    return {key: file_entry[key] for key in CACHED_ENTRY_KEYS if key in file_entry}
+
+
+class SyncManifest(object):
+    """
+    本地同步记录
+    按有道云笔记文件 ID 记录 modifyTimeForSort、version、本地路径和资源，每行一条 json 记录，
+    后写入的同 ID 记录覆盖先写入的。增量同步时只需查内存中的记录，不用读取本地文件时间
+    目录记录（type 为 dir）额外保存目录内容，目录未更新时可直接使用，不用再请求目录信息
+    """
+
+    def __init__(self, root_local_dir, file_name=MANIFEST_FILE_NAME):
+        """
+        初始化
+        :param root_local_dir: 本地文件根目录
+        :param file_name: 记录文件名
+        """
+        self.root_local_dir = root_local_dir
+        self.path = os.path.join(root_local_dir, file_name).replace("\\", "/")
+        self.records = {}
+        self.dir_records = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """读取记录文件，记录文件不存在时为空"""
+        self.records = {}
+        self.dir_records = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中途中断可能留下不完整的最后一行，忽略
+                    logging.info("同步记录「{}」存在无法解析的行，已忽略".format(self.path))
+                    continue
+                if record.get("type") == DIR_RECORD_TYPE:
+                    self.dir_records[record["id"]] = record
+                else:
+                    self.records[record["id"]] = record
+        logging.info(
+            "已读取同步记录 {} 条，目录记录 {} 条".format(len(self.records), len(self.dir_records))
+        )
+
+    def get(self, file_id) -> dict:
+        """
+        获取文件同步记录
+        :param file_id:
+        :return: record 或 None
+        """
+        return self.records.get(file_id)
+
+    def update(self, file_id, **fields):
+        """
+        更新文件同步记录，立即追加到记录文件，中途中断也不会丢失已同步的记录
+        :param file_id:
+        :param fields: modify_time, version, name, dir, path, assets 等
+        :return:
+        """
+        record = dict(fields, id=file_id)
+        self._append(self.records, record)
+
+    def _append(self, records, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            records[record["id"]] = record
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _rel_dir(self, local_dir) -> str:
+        return os.path.relpath(local_dir, self.root_local_dir).replace("\\", "/")
+
+    def get_dir_entries(self, dir_entry, local_dir):
+        """
+        目录未更新时，返回上次同步时的目录内容
+        :param dir_entry: 目录的 fileEntry
+        :param local_dir: 目录对应的本地目录
+        :return: entries 或 None
+        """
+        # 没有修改时间的目录无法判断是否更新
+        if dir_entry.get("modifyTimeForSort") is None:
+            return None
+        record = self.dir_records.get(dir_entry["id"])
+        if not record or record["dir"] != self._rel_dir(local_dir):
+            return None
+        if record["version"] != dir_entry.get("version"):
+            return None
+        if record["modify_time"] != dir_entry.get("modifyTimeForSort"):
+            return None
+        return record["entries"]
+
+    def update_dir(self, dir_entry, local_dir, entries):
+        """
+        记录目录内容
+        :param dir_entry: 目录的 fileEntry
+        :param local_dir: 目录对应的本地目录
+        :param entries: 目录下所有文件信息
+        :return:
+        """
+        record = {
+            "id": dir_entry["id"],
+            "type": DIR_RECORD_TYPE,
+            "modify_time": dir_entry.get("modifyTimeForSort"),
+            "version": dir_entry.get("version"),
+            "dir": self._rel_dir(local_dir),
+            "entries": [
+                {"fileEntry": trim_file_entry(entry["fileEntry"])} for entry in entries
+            ],
+        }
+        self._append(self.dir_records, record)
+
+    def record_dir_entries(self, dir_entry, local_dir, entries):
+        """
+        逐条返回目录内容，全部返回后记录目录内容
+        :param dir_entry: 目录的 fileEntry
+        :param local_dir:
+        :param entries: entry 生成器
+        :return: entry 生成器
+        """
+        children = []
+        for entry in entries:
+            children.append(entry)
+            yield entry
+        self.update_dir(dir_entry, local_dir, children)
+
+    def prune(self, file_ids, dir_ids=None):
+        """
+        删除不在 file_ids 中的记录（云端已删除的文件）
+        :param file_ids: 本次同步的所有文件 ID
+        :param dir_ids: 本次同步的所有目录 ID，为空时不删除目录记录
+        :return:
+        """
+        with self._lock:
+            for file_id in set(self.records) - set(file_ids):
+                del self.records[file_id]
+            if dir_ids is not None:
+                for dir_id in set(self.dir_records) - set(dir_ids):
+                    del self.dir_records[dir_id]
+
+    def save(self):
+        """压缩记录文件：每个文件只保留最新一条记录，先写临时文件再替换"""
+        with self._lock:
+            self.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in list(self.records.values()) + list(
+                    self.dir_records.values()
+                ):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,201 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from core.retry import THROTTLED_STATUS_CODES
+
+SMMS_HOST = "sm.ms"
+
+
+def get_endpoint(url) -> str:
+    """
+    获取请求所属接口：有道云笔记 API 取 method 参数，如 listPageByParentId、download；
+    上传 SM.MS 为 smms，其他（图片、附件）为 resource
+    :param url:
+    :return: 接口名
+    """
+    parsed = urlparse(url)
+    method = parse_qs(parsed.query).get("method")
+    if method:
+        return method[0]
+    if parsed.netloc == SMMS_HOST:
+        return "smms"
+    return "resource"
+
+
+class PullMetrics(object):
+    """
+    统计 pull 各阶段耗时、次数、字节数，以及各接口的请求数、字节数，线程安全
+    阶段耗时为各线程累计耗时，并发时可能大于运行总耗时
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = {}  # {阶段: {"count": 次数, "seconds": 耗时, "bytes": 字节数}}
+        self.endpoints = (
+            {}
+        )  # {接口: {"requests": 请求数, "throttled": 被限流数, "errors": 失败数, "bytes": 字节数}}
+        self.counters = {}  # {名称: 数量}，如 files、skipped
+        self.total_files = None  # 预先遍历目录树得到的文件总数，未遍历时为空
+        self._total_time = None  # 得到文件总数的时间，之后的速度用于估计剩余时间
+        self._lock = threading.Lock()
+        self._progress_stop = threading.Event()
+        self._progress_thread = None
+
+    def add_stage(self, name, seconds, count=1, size=0):
+        """
+        累加阶段耗时
+        :param name: 阶段名，如 list_dir、download_note、convert_xml
+        :param seconds:
+        :param count:
+        :param size: 阶段处理的字节数
+        """
+        with self._lock:
+            stage = self.stages.setdefault(
+                name, {"count": 0, "seconds": 0.0, "bytes": 0}
+            )
+            stage["count"] += count
+            stage["seconds"] += seconds
+            stage["bytes"] += size
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """统计 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_request(self, url, status_code=None, size=0):
+        """
+        记录一次请求，重试的每次请求都会记录
+        :param url:
+        :param status_code: 状态码，网络错误时为 None
+        :param size: 响应字节数
+        """
+        endpoint = get_endpoint(url)
+        with self._lock:
+            counts = self.endpoints.setdefault(
+                endpoint, {"requests": 0, "throttled": 0, "errors": 0, "bytes": 0}
+            )
+            counts["requests"] += 1
+            counts["bytes"] += size
+            if status_code in THROTTLED_STATUS_CODES:
+                counts["throttled"] += 1
+            elif status_code is None or status_code >= 400:
+                counts["errors"] += 1
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def set_total_files(self, total_files):
+        """
+        设置本次需处理的文件总数，进度中输出完成比例和预计剩余时间
+        :param total_files:
+        """
+        with self._lock:
+            self.total_files = total_files
+            self._total_time = time.perf_counter()
+
+    def summary(self) -> dict:
+        """
+        获取统计结果
+        :return: {"seconds": 运行耗时, "total_files": 文件总数, "counters": {...}, "stages": {...}, "endpoints": {...}}
+        """
+        with self._lock:
+            stages = {
+                name: dict(stage, seconds=round(stage["seconds"], 3))
+                for name, stage in self.stages.items()
+            }
+            return {
+                "seconds": round(time.perf_counter() - self.start_time, 3),
+                "total_files": self.total_files,
+                "counters": dict(self.counters),
+                "stages": stages,
+                "endpoints": {
+                    name: dict(counts) for name, counts in self.endpoints.items()
+                },
+            }
+
+    def log_summary(self):
+        logging.info("运行统计：{}".format(json.dumps(self.summary(), ensure_ascii=False)))
+
+    def save(self, file_path):
+        """将统计结果保存为 json"""
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _format_seconds(seconds) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+    def progress_line(self) -> str:
+        """
+        进度：已处理文件数、下载字节数、速度，已知文件总数时还有完成比例和预计剩余时间
+        """
+        with self._lock:
+            files = self.counters.get("files", 0)
+            skipped = self.counters.get("skipped", 0)
+            requests = sum(counts["requests"] for counts in self.endpoints.values())
+            size = sum(counts["bytes"] for counts in self.endpoints.values())
+            total_files = self.total_files
+            total_time = self._total_time
+        now = time.perf_counter()
+        elapsed = now - self.start_time
+        if total_files is None:
+            return "已处理 {} 个文件（{} 个未更新），请求 {} 次，下载 {:.2f} MB，已运行 {}".format(
+                files, skipped, requests, size / 2**20, self._format_seconds(elapsed)
+            )
+        # 速度从得到文件总数（遍历完目录树）后开始计算
+        files_per_second = files / max(now - total_time, 1e-6)
+        if files >= total_files:
+            eta = self._format_seconds(0)
+        elif files:
+            eta = self._format_seconds((total_files - files) / files_per_second)
+        else:
+            eta = "未知"
+        return (
+            "进度 {}/{}（{:.1%}，{} 个未更新），{:.1f} 个/秒，下载 {:.2f} MB（{:.2f} MB/秒），"
+            "已运行 {}，预计剩余 {}".format(
+                files,
+                total_files,
+                files / total_files if total_files else 1,
+                skipped,
+                files_per_second,
+                size / 2**20,
+                size / 2**20 / max(elapsed, 1e-6),
+                self._format_seconds(elapsed),
+                eta,
+            )
+        )
+
+    def start_progress(self, interval):
+        """
+        每 interval 秒输出一次进度
+        :param interval: 秒数，不大于 0 时不输出
+        """
+        if interval <= 0 or self._progress_thread:
+            return
+        self._progress_stop.clear()
+
+        def report():
+            while not self._progress_stop.wait(interval):
+                logging.info(self.progress_line())
+
+        self._progress_thread = threading.Thread(
+            target=report, name="progress", daemon=True
+        )
+        self._progress_thread.start()
+
+    def stop_progress(self):
+        if self._progress_thread:
+            self._progress_stop.set()
+            self._progress_thread.join()
+            self._progress_thread = None
@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from core.common import file_md5
+from core.metrics import PullMetrics
+
+
+def _timed(func):
+    """写入、替换、链接的耗时计入 write 阶段"""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.stage("write"):
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class OutputWriter(object):
+    """
+    写入笔记、图片、附件：内容与本地文件相同时不写入，不同时先写临时文件再原子替换
+    并统计本次写入、未变化的文件数，避免内容未变的文件触发下游（git、静态站点）重新构建
+    """
+
+    def __init__(self, metrics=None):
+        """
+        初始化
+        :param metrics: 耗时统计
+        """
+        self.written_count = 0
+        self.unchanged_count = 0
+        self.metrics = metrics if metrics else PullMetrics()
+        self._lock = threading.Lock()
+
+    def _count(self, changed) -> bool:
+        with self._lock:
+            if changed:
+                self.written_count += 1
+            else:
+                self.unchanged_count += 1
+        return changed
+
+    @staticmethod
+    def _is_same(file_path, md5, size) -> bool:
+        """本地文件大小、MD5 与新内容相同"""
+        try:
+            if os.path.getsize(file_path) != size:
+                return False
+        except OSError:
+            return False
+        return file_md5(file_path) == md5
+
+    @_timed
+    def write(self, file_path, data: bytes) -> bool:
+        """
+        写入文件
+        :param file_path:
+        :param data:
+        :return: 是否写入
+        """
+        if self._is_same(file_path, hashlib.md5(data).hexdigest(), len(data)):
+            return self._count(False)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(file_path) or ".", suffix=".part"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._count(True)
+
+    @_timed
+    def replace(self, tmp_path, file_path, md5=None) -> bool:
+        """
+        用已写好的临时文件替换文件，临时文件需与 file_path 在同一磁盘
+        :param tmp_path:
+        :param file_path:
+        :param md5: 临时文件 MD5，为空时计算
+        :return: 是否替换
+        """
+        md5 = md5 or file_md5(tmp_path)
+        if self._is_same(file_path, md5, os.path.getsize(tmp_path)):
+            os.remove(tmp_path)
+            return self._count(False)
+        os.replace(tmp_path, file_path)
+        return self._count(True)
+
+    @_timed
+    def link(self, object_path, file_path) -> bool:
+        """
+        创建指向资源存储文件的硬链接，不支持硬链接（如跨磁盘）时复制
+        已是同一文件或内容相同时不修改
+        :param object_path:
+        :param file_path:
+        :return: 是否修改
+        """
+        if os.path.exists(file_path):
+            if os.path.samefile(object_path, file_path):
+                return self._count(False)
+            if self._is_same(
+                file_path, file_md5(object_path), os.path.getsize(object_path)
+            ):
+                return self._count(False)
+            os.remove(file_path)
+        try:
+            os.link(object_path, file_path)
+        except FileExistsError:
+            # 同一笔记中相同内容的图片并发下载时，已由其他线程创建
+            return self._count(False)
+        except OSError:
+            shutil.copyfile(object_path, file_path)
+        return self._count(True)
+
+    def log_summary(self):
+        logging.info(
+            "本次写入 {} 个文件，{} 个文件内容未变化，未写入".format(
+                self.written_count, self.unchanged_count
+            )
+        )
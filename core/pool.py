@@ -0,0 +1,235 @@
+import collections
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core import log
+
+
+class OrderedTaskPool(object):
+    """
+    有序任务线程池
+    任务并发执行，日志和异常按提交顺序输出；max_workers 为 1 时直接在当前线程执行
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix="worker"):
+        """
+        初始化
+        :param max_workers: 并发线程数
+        :param thread_name_prefix:
+        """
+        self.max_workers = max(1, max_workers)
+        # 最多允许多少个任务未输出，避免任务无限堆积
+        self.window_size = self.max_workers * 4
+        self.executor = None
+        if self.max_workers > 1:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=thread_name_prefix
+            )
+        self.futures = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.join()
+        else:
+            for future in self.futures:
+                future.cancel()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def _run(func, args, kwargs):
+        log.start_buffering()
+        error = None
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as err:
+            error = err
+        return log.stop_buffering(), error, result
+
+    def _emit_oldest(self):
+        """等待最早提交的任务完成，输出其日志，任务出错时抛出异常"""
+        records, error, result = self.futures.popleft().result()
+        log.emit_records(records)
+        if error:
+            raise error
+        return result
+
+    def submit(self, func, *args, **kwargs):
+        """
+        提交任务
+        :param func:
+        :return:
+        """
+        if not self.executor:
+            func(*args, **kwargs)
+            return
+        while len(self.futures) >= self.window_size:
+            self._emit_oldest()
+        self.futures.append(self.executor.submit(self._run, func, args, kwargs))
+
+    def map(self, func, *iterables) -> list:
+        """
+        并发执行 func，按提交顺序返回结果，日志和异常同 submit
+        需在没有未完成任务时调用
+        :param func:
+        :param iterables:
+        :return: [result, ...]
+        """
+        if not self.executor:
+            return [func(*args) for args in zip(*iterables)]
+        results = []
+        for args in zip(*iterables):
+            while len(self.futures) >= self.window_size:
+                results.append(self._emit_oldest())
+            self.futures.append(self.executor.submit(self._run, func, args, {}))
+        while self.futures:
+            results.append(self._emit_oldest())
+        return results
+
+    def join(self):
+        """等待所有任务完成"""
+        while self.futures:
+            self._emit_oldest()
+
+
+class ProcessTaskPool(object):
+    """
+    进程池，用于笔记转换等 CPU 密集的任务，不受 GIL 限制
+    submit 不等待结果，任务完成后在回调线程中执行 callback（如迁移图片、写入文件），提交任务的下载线程可继续下载；
+    未完成（含回调）的任务数有上限，超过时提交任务的线程等待，避免下载快于转换时内存中堆积大量笔记内容
+    max_workers 为 0 时直接在当前线程执行
+    子进程以 spawn 方式启动：进程池创建时下载线程已在运行，fork 会复制其他线程持有的锁，子进程可能卡死
+    """
+
+    def __init__(self, max_workers: int, max_pending: int = None, callback_workers=1):
+        """
+        初始化
+        :param max_workers: 进程数
+        :param max_pending: 未完成的最大任务数，默认为进程数的 2 倍
+        :param callback_workers: 执行回调的线程数
+        """
+        self.max_workers = max(0, max_workers)
+        self.executor = None
+        self.callback_executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if self.max_workers > 0:
+            self.executor = self._create_executor()
+            self.callback_executor = ThreadPoolExecutor(
+                max_workers=max(1, callback_workers), thread_name_prefix="convert-done"
+            )
+            self._slots = threading.BoundedSemaphore(
+                max_pending or self.max_workers * 2
+            )
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def submit(self, func, *args, callback=None) -> Future:
+        """
+        提交任务，不等待结果，func 和参数需可被 pickle
+        子进程异常退出（如内存不足被杀掉）时重建进程池重试一次，仍失败时任务以 BrokenProcessPool 结束，不在当前进程执行
+        :param func: 模块级函数
+        :param args:
+        :param callback: callback(task)，task 为 func 的 Future，任务完成后在回调线程中执行
+        :return: Future，结果为 callback 的返回值，没有 callback 时为 func 的返回值
+        """
+        future = Future()
+        if not self.executor:
+            task = Future()
+            try:
+                task.set_result(func(*args))
+            except Exception as error:
+                task.set_exception(error)
+            self._finish(future, task, callback)
+            return future
+        self._slots.acquire()
+        self._submit(future, func, args, callback, retries=1)
+        return future
+
+    def run(self, func, *args):
+        """
+        在子进程中执行 func 并等待结果
+        :param func: 模块级函数
+        :param args:
+        :return: func 的返回值
+        """
+        return self.submit(func, *args).result()
+
+    def _submit(self, future, func, args, callback, retries):
+        executor = self.executor
+        try:
+            if executor is None:
+                raise RuntimeError("进程池已关闭")
+            task = executor.submit(func, *args)
+        except Exception as error:
+            task = Future()
+            task.set_exception(error)
+        task.add_done_callback(
+            lambda task: self._on_task_done(
+                future, task, func, args, callback, retries, executor
+            )
+        )
+
+    def _on_task_done(self, future, task, func, args, callback, retries, executor):
+        if (
+            retries
+            and not task.cancelled()
+            and isinstance(task.exception(), BrokenProcessPool)
+        ):
+            logging.info("转换子进程异常退出，重建进程池后重试")
+            self._restart(executor)
+            self._submit(future, func, args, callback, retries - 1)
+            return
+        try:
+            self.callback_executor.submit(self._finish, future, task, callback)
+        except RuntimeError:
+            # 回调线程池已关闭
+            self._finish(future, task, callback)
+
+    def _finish(self, future, task, callback):
+        try:
+            result = callback(task) if callback else task.result()
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    def _restart(self, broken_executor):
+        """
+        重建已损坏的进程池，多个任务同时发现损坏时只重建一次
+        :param broken_executor: 已损坏的进程池
+        :return:
+        """
+        with self._lock:
+            if self.executor is broken_executor:
+                broken_executor.shutdown(wait=False)
+                self.executor = self._create_executor()
+
+    def shutdown(self):
+        """等待所有任务及其回调完成"""
+        with self._lock:
+            executor, self.executor = self.executor, None
+        if executor:
+            executor.shutdown(wait=True)
+        if self.callback_executor:
+            self.callback_executor.shutdown(wait=True)
@@ -0,0 +1,121 @@
+import email.utils
+import random
+import threading
+import time
+
+# 需要重试的状态码：限流、服务暂不可用、网关错误
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+THROTTLED_STATUS_CODES = (429, 503)
+
+
+class RetryPolicy(object):
+    """
+    重试策略：指数退避 + 随机抖动，优先使用服务端返回的 Retry-After
+    """
+
+    def __init__(self, max_retries=3, backoff_base=1.0, backoff_max=60.0):
+        """
+        初始化
+        :param max_retries: 最大重试次数，0 为不重试
+        :param backoff_base: 第一次重试的最长等待秒数，之后每次翻倍
+        :param backoff_max: 单次最长等待秒数
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry(self, attempt, status_code=None) -> bool:
+        """
+        是否需要重试
+        :param attempt: 已重试次数
+        :param status_code: 响应状态码，请求异常时为 None
+        :return:
+        """
+        if attempt >= self.max_retries:
+            return False
+        return status_code is None or status_code in RETRY_STATUS_CODES
+
+    def get_delay(self, attempt, retry_after=None) -> float:
+        """
+        获取重试前等待秒数
+        :param attempt: 已重试次数
+        :param retry_after: 响应头 Retry-After
+        :return: seconds
+        """
+        seconds = self._parse_retry_after(retry_after)
+        if seconds is not None:
+            return min(seconds, self.backoff_max)
+        # full jitter：在 [0, base * 2^attempt] 中随机，避免多个线程同时重试
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    @staticmethod
+    def _parse_retry_after(retry_after):
+        """Retry-After 可能为秒数或 HTTP 日期"""
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_time = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_time.timestamp() - time.time())
+
+
+class TokenBucket(object):
+    """
+    令牌桶限流，线程安全
+    被限流（429/503）时速率减半，之后每次成功请求逐步恢复到设定速率
+    """
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = 0.5):
+        """
+        初始化
+        :param rate: 每秒请求数
+        :param capacity: 桶容量，即允许的突发请求数，默认与 rate 相同
+        :param min_rate: 被限流时最低每秒请求数
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.min_rate = min(min_rate, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        预定一个令牌
+        :return: 需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """获取一个令牌，没有令牌时等待"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_throttled(self):
+        """被服务端限流，速率减半"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self):
+        """请求成功，逐步恢复速率"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
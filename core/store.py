@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+
+OBJECTS_DIR_NAME = "_objects"
+INDEX_FILE_NAME = "index.jsonl"
+# 缓存超过此秒数后，使用时带 ETag / Last-Modified 向服务端确认是否变化
+REVALIDATE_AFTER = 30 * 24 * 3600
+
+
+class AssetStore(object):
+    """
+    全局图片、附件存储，按内容 MD5 保存：_objects/ab/abcdef….png
+    相同内容只保存一份，各笔记的 assets_ori/<笔记名>/ 下为指向它的硬链接（见 OutputWriter.link）
+    同时按有道云链接缓存文件及其 ETag、Last-Modified、大小，任一笔记下载过的链接不再重复下载；
+    上传到 SM.MS 的链接也会记录，不再重复上传。超过容量上限时，按最近使用时间淘汰
+    """
+
+    def __init__(self, assets_dir, max_size=0, file_name=INDEX_FILE_NAME):
+        """
+        初始化
+        :param assets_dir: 资源根目录，如 <local_dir>/assets_ori
+        :param max_size: 缓存文件总大小上限（字节），0 为不限制
+        :param file_name: 链接索引文件名
+        """
+        self.objects_dir = os.path.join(assets_dir, OBJECTS_DIR_NAME).replace("\\", "/")
+        self.path = os.path.join(self.objects_dir, file_name).replace("\\", "/")
+        self.max_size = max_size
+        # {有道云链接: {"url", "object", "name", "size", "etag", "last_modified", "checked_at", "used_at", "smms_url"}}
+        self.urls = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """读取链接索引，索引不存在时为空"""
+        self.urls = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下不完整的最后一行，忽略
+                    continue
+                self.urls[record["url"]] = record
+        logging.info("已读取资源链接索引 {} 条".format(len(self.urls)))
+
+    def object_path(self, record) -> str:
+        return os.path.join(self.objects_dir, record["object"]).replace("\\", "/")
+
+    def get(self, url):
+        """
+        获取已下载过的链接
+        :param url: 有道云链接
+        :return: record 或 None
+        """
+        record = self.urls.get(url)
+        if not record or not record.get("object"):
+            return None
+        # 文件被手动删除或不完整时重新下载
+        try:
+            size = os.path.getsize(self.object_path(record))
+        except OSError:
+            return None
+        if record.get("size") is not None and size != record["size"]:
+            return None
+        record["used_at"] = time.time()
+        return record
+
+    @staticmethod
+    def is_stale(record) -> bool:
+        """缓存是否需要向服务端确认"""
+        return time.time() - record.get("checked_at", 0) > REVALIDATE_AFTER
+
+    @staticmethod
+    def get_validators(record) -> dict:
+        """
+        条件请求头，服务端未变化时返回 304
+        :param record:
+        :return: headers
+        """
+        headers = {}
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def put(self, url, object_path, file_name, headers=None):
+        """
+        记录链接对应的文件
+        :param url: 有道云链接
+        :param object_path: add 返回的路径
+        :param file_name: 在笔记资源目录中的文件名
+        :param headers: 下载时的响应头
+        :return:
+        """
+        headers = headers or {}
+        now = time.time()
+        self._append(
+            {
+                "url": url,
+                "object": os.path.relpath(object_path, self.objects_dir).replace(
+                    "\\", "/"
+                ),
+                "name": file_name,
+                "size": os.path.getsize(object_path),
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "checked_at": now,
+                "used_at": now,
+            }
+        )
+
+    def touch(self, url):
+        """服务端确认未变化（304），更新确认时间"""
+        record = dict(self.urls[url], checked_at=time.time())
+        self._append(record)
+
+    def get_uploaded(self, url):
+        """
+        获取已上传到 SM.MS 的链接
+        :param url: 有道云链接
+        :return: SM.MS 链接或 None
+        """
+        record = self.urls.get(url)
+        if not record:
+            return None
+        return record.get("smms_url")
+
+    def set_uploaded(self, url, smms_url):
+        """
+        记录上传到 SM.MS 的链接
+        :param url: 有道云链接
+        :param smms_url:
+        :return:
+        """
+        record = dict(self.urls.get(url, {"url": url}), smms_url=smms_url)
+        self._append(record)
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.urls[record["url"]] = record
+            if self._file is None:
+                os.makedirs(self.objects_dir, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def get_temp_dir(self) -> str:
+        """下载用的临时目录，与存储目录在同一磁盘才能原子替换"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        return self.objects_dir
+
+    def add(self, tmp_path, md5, suffix) -> str:
+        """
+        将下载完的临时文件放入存储，内容已存在时直接删除临时文件
+        :param tmp_path: 临时文件
+        :param md5: 文件内容 MD5
+        :param suffix: 扩展名，如 .png
+        :return: object_path
+        """
+        object_dir = os.path.join(self.objects_dir, md5[:2]).replace("\\", "/")
+        object_path = os.path.join(object_dir, md5 + suffix).replace("\\", "/")
+        if os.path.exists(object_path):
+            os.remove(tmp_path)
+            return object_path
+        os.makedirs(object_dir, exist_ok=True)
+        os.replace(tmp_path, object_path)
+        return object_path
+
+    def evict(self):
+        """
+        缓存文件总大小超过上限时，按最近使用时间淘汰，笔记资源目录中的文件不受影响
+        多个链接可能对应同一文件，文件最近使用时间取其中最晚的
+        """
+        if not self.max_size:
+            return
+        objects = {}  # {object: [size, used_at, [url, ...]]}
+        for url, record in self.urls.items():
+            if not record.get("object"):
+                continue
+            item = objects.setdefault(
+                record["object"], [record.get("size") or 0, 0, []]
+            )
+            item[1] = max(item[1], record.get("used_at", 0))
+            item[2].append(url)
+        total_size = sum(item[0] for item in objects.values())
+        evicted_count = 0
+        for object_name, (size, _, urls) in sorted(
+            objects.items(), key=lambda x: x[1][1]
+        ):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.objects_dir, object_name))
+            except OSError:
+                pass
+            for url in urls:
+                record = self.urls[url]
+                if record.get("smms_url"):
+                    # 保留 SM.MS 链接，不用重新上传
+                    self.urls[url] = {"url": url, "smms_url": record["smms_url"]}
+                else:
+                    del self.urls[url]
+            total_size -= size
+            evicted_count += 1
+        if evicted_count:
+            logging.info("资源缓存超过上限，已淘汰 {} 个最久未使用的文件".format(evicted_count))
+
+    def save(self):
+        """淘汰超出上限的缓存，压缩链接索引：每个链接只保留最新一条记录"""
+        with self._lock:
+            self.close()
+            self.evict()
+            if not self.urls:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in self.urls.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import functools
 import json
 import logging
 import os
 import platform
+import queue
 import re
 import sys
+import threading
 import time
 import traceback
-import xml.etree.ElementTree as ET
+from concurrent.futures import Future
 from enum import Enum
-from typing import Tuple
+from typing import Tuple, Union
 
 import requests
 
@@ -21,15 +25,44 @@ if platform.system() == "Windows":
 
 from core import log
 from core.api import YoudaoNoteApi
-from core.common import get_script_directory
-from core.covert import YoudaoNoteConvert
-from core.image import ImagePull
+from core.checkpoint import PullCheckpoint
+from core.common import get_script_directory, stream_to_temp_file
+from core.covert import covert_note_to_markdown
+from core.crawler import CRAWL_DONE, AsyncDirCrawler, DirCrawler
+from core.image import ASSETS, ImagePull
+from core.manifest import SyncManifest
+from core.metrics import PullMetrics
+from core.output import OutputWriter
+from core.pool import OrderedTaskPool, ProcessTaskPool
+from core.retry import RetryPolicy, TokenBucket
+from core.store import OBJECTS_DIR_NAME, AssetStore
 
 __author__ = "Depp Wang (deppwxq@gmail.com)"
 __github__ = "https//github.com/DeppWang/youdaonote-pull"
 
 REGEX_SYMBOL = re.compile(r'[\\/:\*\?"<>\|]')  # 符号：\ / : * ? " < > |
 MARKDOWN_SUFFIX = ".md"
+NOTE_SUFFIXES = (".note", ".clip", "")  # 需要根据内容判断类型的笔记后缀
+
+
+REQUIRED_CONFIG_KEYS = [
+    "local_dir",
+    "ydnote_dir",
+    "smms_secret_token",
+    "is_relative_path",
+]
+# 选填配置及默认值
+OPTIONAL_CONFIG = {
+    "crawl_workers": 0,  # 并发遍历目录的线程数，0 为逐个目录递归遍历
+    "max_workers": 1,  # 并发下载、转换笔记的线程数，1 为逐个笔记处理
+    "async_workers": 0,  # 异步遍历目录时同时进行的请求数，0 为不使用异步请求（需安装 aiohttp）
+    "skip_unchanged_dirs": False,  # 目录修改时间、版本未变化时，不再请求目录信息
+    "max_retries": 3,  # 网络错误、被限流时的最大重试次数
+    "requests_per_second": 0,  # 每秒最多请求有道云笔记的次数，0 为不限制
+    "convert_workers": 0,  # 转换笔记的进程数，0 为在下载线程中转换
+    "image_workers": 4,  # 每篇笔记同时下载的图片、附件数
+    "asset_cache_mb": 0,  # 图片、附件缓存上限（MB），超过时淘汰最久未使用的，0 为不限制
+}
 
 
 class FileType(Enum):
@@ -56,6 +89,21 @@ class YoudaoNotePull(object):
         self.smms_secret_token = None
         self.is_relative_path = None  # 是否使用相对路径
         self.synced_files = set()  # 记录所有同步的文件（相对于root_local_dir）
+        self.synced_file_ids = set()  # 记录所有同步的有道云笔记文件 ID
+        self._synced_files_lock = threading.Lock()
+        self.crawl_workers = OPTIONAL_CONFIG["crawl_workers"]
+        self.max_workers = OPTIONAL_CONFIG["max_workers"]
+        self.image_workers = OPTIONAL_CONFIG["image_workers"]
+        self.convert_workers = OPTIONAL_CONFIG["convert_workers"]
+        self.convert_pool = None  # 笔记转换进程池
+        self.async_workers = OPTIONAL_CONFIG["async_workers"]
+        self.manifest = None  # 同步记录
+        self.asset_store = None  # 全局图片、附件存储
+        self.metrics = PullMetrics()  # 各阶段耗时、各接口请求数统计
+        self.output = OutputWriter(self.metrics)  # 内容未变化时不写入
+        self.checkpoint = None  # 断点记录
+        self.skip_unchanged_dirs = OPTIONAL_CONFIG["skip_unchanged_dirs"]
+        self.synced_dir_ids = set()  # 记录所有同步的有道云笔记目录 ID
 
     def _covert_config(self, config_path=None) -> Tuple[dict, str]:
         """
@@ -80,12 +128,19 @@ class YoudaoNotePull(object):
                 "请检查「config.json」格式是否为 utf-8 格式的 json！建议使用 Sublime 编辑「config.json」",
             )
 
-        key_list = ["local_dir", "ydnote_dir", "smms_secret_token", "is_relative_path"]
-        if key_list != list(config_dict.keys()):
+        key_list = [key for key in config_dict.keys() if key in REQUIRED_CONFIG_KEYS]
+        if key_list != REQUIRED_CONFIG_KEYS:
             return (
                 {},
                 "请检查「config.json」的 key 是否分别为 local_dir, ydnote_dir, smms_secret_token, is_relative_path",
             )
+        unknown_keys = [
+            key
+            for key in config_dict.keys()
+            if key not in REQUIRED_CONFIG_KEYS and key not in OPTIONAL_CONFIG
+        ]
+        if unknown_keys:
+            return {}, "请检查「config.json」的 key，不支持：{}".format(", ".join(unknown_keys))
         return config_dict, ""
 
     def _check_local_dir(self, local_dir, test_default_dir=None) -> Tuple[str, str]:
@@ -121,27 +176,54 @@ class YoudaoNotePull(object):
         if not ydnote_dir:
             return root_dir_id, ""
 
-        dir_info = self.youdaonote_api.get_dir_info_by_id(root_dir_id)
-        for entry in dir_info["entries"]:
+        for entry in self.youdaonote_api.iter_dir_entries(root_dir_id):
             file_entry = entry["fileEntry"]
             if file_entry["name"] == ydnote_dir:
                 return file_entry["id"], ""
 
         return "", "有道云笔记指定顶层目录不存在"
 
-    def get_ydnote_dir_id(self) -> Tuple[str, str]:
+    def get_ydnote_dir_id(self, config_path=None) -> Tuple[str, str]:
         """
         获取有道云笔记根目录或指定目录 ID
+        :param config_path: config 文件路径，默认为脚本目录下的 config.json
         :return:
         """
-        config_dict, error_msg = self._covert_config()
+        config_dict, error_msg = self._covert_config(config_path)
         if error_msg:
             return "", error_msg
         local_dir, error_msg = self._check_local_dir(local_dir=config_dict["local_dir"])
         if error_msg:
             return "", error_msg
         self.root_local_dir = local_dir
-        self.youdaonote_api = YoudaoNoteApi()
+        self.manifest = SyncManifest(local_dir)
+        self.manifest.load()
+        asset_cache_mb = config_dict.get(
+            "asset_cache_mb", OPTIONAL_CONFIG["asset_cache_mb"]
+        )
+        self.asset_store = AssetStore(
+            os.path.join(local_dir, ASSETS), max_size=asset_cache_mb * 1024 * 1024
+        )
+        self.asset_store.load()
+        self.crawl_workers = config_dict.get(
+            "crawl_workers", OPTIONAL_CONFIG["crawl_workers"]
+        )
+        self.max_workers = config_dict.get(
+            "max_workers", OPTIONAL_CONFIG["max_workers"]
+        )
+        self.image_workers = config_dict.get(
+            "image_workers", OPTIONAL_CONFIG["image_workers"]
+        )
+        self.convert_workers = config_dict.get(
+            "convert_workers", OPTIONAL_CONFIG["convert_workers"]
+        )
+        self.async_workers = config_dict.get(
+            "async_workers", OPTIONAL_CONFIG["async_workers"]
+        )
+        self.skip_unchanged_dirs = config_dict.get(
+            "skip_unchanged_dirs", OPTIONAL_CONFIG["skip_unchanged_dirs"]
+        )
+        self.youdaonote_api = self._create_api(config_dict)
         error_msg = self.youdaonote_api.login_by_cookies()
         logging.info("本次使用 Cookies 登录")
         if error_msg:
@@ -150,11 +232,36 @@ class YoudaoNotePull(object):
         self.is_relative_path = config_dict["is_relative_path"]
         return self._get_ydnote_dir_id(ydnote_dir=config_dict["ydnote_dir"])
 
-    def _judge_type(self, file_id, youdao_file_suffix) -> Enum:
+    def _create_api(self, config_dict) -> YoudaoNoteApi:
         """
-        判断笔记类型
-        :param file_id:
+        按配置创建有道云笔记 API，需先读取并发配置
+        :param config_dict:
+        :return:
+        """
+        requests_per_second = config_dict.get(
+            "requests_per_second", OPTIONAL_CONFIG["requests_per_second"]
+        )
+        # 连接池大小需覆盖所有并发线程
+        return YoudaoNoteApi(
+            pool_size=max(
+                self.crawl_workers, self.max_workers * max(1, self.image_workers), 10
+            ),
+            retry_policy=RetryPolicy(
+                max_retries=config_dict.get(
+                    "max_retries", OPTIONAL_CONFIG["max_retries"]
+                )
+            ),
+            rate_limiter=TokenBucket(requests_per_second)
+            if requests_per_second
+            else None,
+            metrics=self.metrics,
+        )
+
+    def _judge_type(self, youdao_file_suffix, content=None) -> Enum:
+        """
+        判断笔记类型，只根据已下载的内容嗅探，不再单独请求
         :param youdao_file_suffix:
+        :param content: 笔记字节码
         :return:
         """
         file_type = FileType.OTHER
@@ -162,31 +269,31 @@ class YoudaoNotePull(object):
         if youdao_file_suffix == MARKDOWN_SUFFIX:
             file_type = FileType.MARKDOWN
             return file_type
-        elif (
-            youdao_file_suffix == ".note"
-            or youdao_file_suffix == ".clip"
-            or youdao_file_suffix == ""
-        ):
-            response = self.youdaonote_api.get_file_by_id(file_id)
+        elif youdao_file_suffix in NOTE_SUFFIXES and content:
             # 2、如果文件以 `<?xml` 开头
-            if response.content[:5] == b"<?xml":
+            if content[:5] == b"<?xml":
                 file_type = FileType.XML
             # 3、如果文件以 `{` 开头
-            elif response.content.startswith(b'{"'):
+            elif content.startswith(b'{"'):
                 file_type = FileType.JSON
         return file_type
 
-    def _get_file_action(self, local_file_path, modify_time) -> Enum:
+    def _get_file_action(self, local_file_path, modify_time, record=None) -> Enum:
         """
         获取文件操作行为
         :param local_file_path:
         :param modify_time:
+        :param record: 同步记录，有记录时说明已确认云端有更新
         :return: FileActionEnum
         """
         # 如果不存在，则下载
         if not os.path.exists(local_file_path):
             return FileActionEnum.ADD
 
+        # 同步记录中已有此文件，说明云端已更新，不再比较本地文件时间
+        if record is not None:
+            return FileActionEnum.UPDATE
+
         # 如果已经存在，判断是否需要更新
         # 如果有道云笔记文件更新时间小于本地文件时间，说明没有更新，则不下载，跳过
         if modify_time <= os.path.getmtime(local_file_path):
@@ -203,47 +310,291 @@ class YoudaoNotePull(object):
         """
         # 去除换行符和首尾空格
         name = name.replace("\n", "").strip()
-        
+
         # 分离文件名和扩展名
         base_name, ext = os.path.splitext(name)
-        
+
         # 保留英文字母、数字、中文、下划线、横杠，其他字符替换为下划线
-        base_name = re.sub(r'[^a-zA-Z0-9\u4e00-\u9fff_-]', '_', base_name)
-        
+        base_name = re.sub(r"[^a-zA-Z0-9\u4e00-\u9fff_-]", "_", base_name)
+
         # 合并连续的下划线
-        base_name = re.sub(r'_+', '_', base_name)
-        
+        base_name = re.sub(r"_+", "_", base_name)
+
         # 去除首尾的下划线和横杠
-        base_name = base_name.strip('_-')
-        
+        base_name = base_name.strip("_-")
+
         return base_name + ext
 
-    def pull_dir_by_id_recursively(self, dir_id, local_dir):
+    @property
+    def dir_manifest(self):
+        """开启 skip_unchanged_dirs 时，用于跳过未更新目录的同步记录"""
+        return self.manifest if self.skip_unchanged_dirs else None
+
+    def _iter_dir_entries(self, dir_id, local_dir, dir_entry=None):
         """
-        根据目录 ID 循环遍历下载目录下所有文件
+        获取目录下所有文件信息，目录未更新时直接使用上次的目录内容
         :param dir_id:
         :param local_dir: 本地目录
-        :return: error_msg
+        :param dir_entry: 目录的 fileEntry，起始目录为 None
+        :return: entry 迭代器
         """
-        dir_info = self.youdaonote_api.get_dir_info_by_id(dir_id)
-        try:
-            entries = dir_info["entries"]
-        except KeyError:
-            raise KeyError("有道云笔记修改了接口地址，此脚本暂时不能使用！请提 issue")
-        for entry in entries:
+        dir_manifest = self.dir_manifest
+        if dir_manifest is None or dir_entry is None:
+            return self.youdaonote_api.iter_dir_entries(dir_id)
+        entries = dir_manifest.get_dir_entries(dir_entry, local_dir)
+        if entries is not None:
+            return iter(entries)
+        return dir_manifest.record_dir_entries(
+            dir_entry, local_dir, self.youdaonote_api.iter_dir_entries(dir_id)
+        )
+
+    def pull_dir_by_id_recursively(
+        self, dir_id, local_dir, note_pool=None, dir_entry=None
+    ):
+        """
+        根据目录 ID 循环遍历下载目录下所有文件，子目录递归遍历
+        :param dir_id:
+        :param local_dir: 本地目录
+        :param note_pool: 笔记下载线程池（OrderedTaskPool），子目录共用；为空时新建，所有文件处理完后返回
+        :param dir_entry: 目录的 fileEntry，用于判断目录是否更新；起始目录为 None
+        :return:
+        """
+        if note_pool is None:
+            with OrderedTaskPool(self.max_workers, "note") as note_pool:
+                return self.pull_dir_by_id_recursively(
+                    dir_id, local_dir, note_pool, dir_entry
+                )
+
+        sub_dirs = []
+        files = []
+        for entry in self._iter_dir_entries(dir_id, local_dir, dir_entry):
             file_entry = entry["fileEntry"]
-            id = file_entry["id"]
-            name = file_entry["name"]
             if file_entry["dir"]:
-                sub_dir = os.path.join(local_dir, name).replace("\\", "/")
+                sub_dir = os.path.join(local_dir, file_entry["name"]).replace("\\", "/")
                 if not os.path.exists(sub_dir):
                     os.mkdir(sub_dir)
-                self.pull_dir_by_id_recursively(id, sub_dir)
+                sub_dirs.append((file_entry, sub_dir))
+            else:
+                files.append((file_entry, local_dir))
+                # 断点续传时已处理完的文件不再下载
+                if not (
+                    self.checkpoint and self.checkpoint.is_file_done(file_entry["id"])
+                ):
+                    note_pool.submit(self._pull_file_entry, file_entry, local_dir)
+        if self.checkpoint:
+            self.checkpoint.dir_done(dir_id, sub_dirs, files)
+        for sub_dir_entry, sub_dir in sub_dirs:
+            self.synced_dir_ids.add(sub_dir_entry["id"])
+            self.pull_dir_by_id_recursively(
+                sub_dir_entry["id"], sub_dir, note_pool, sub_dir_entry
+            )
+
+    def pull_dir_by_crawler(self, start_dirs, pending_files=()):
+        """
+        并发遍历目录树，边遍历边下载，结果与 pull_dir_by_id_recursively 一致
+        :param start_dirs: 起始目录 [(dir_id, local_dir, dir_entry), ...]
+        :param pending_files: 断点续传时未处理完的文件 [(file_entry, local_dir), ...]
+        :return:
+        """
+        # 有界队列，避免目录遍历远快于下载时任务无限堆积
+        file_queue = queue.Queue(
+            maxsize=max(self.crawl_workers, self.max_workers) * 100
+        )
+        crawler = self._create_crawler()
+        errors = []
+
+        def crawl():
+            try:
+                crawler.crawl(start_dirs, file_queue)
+            except Exception as error:
+                errors.append(error)
+
+        crawl_thread = threading.Thread(target=crawl, name="crawler-main")
+        crawl_thread.start()
+        job = None
+        try:
+            with OrderedTaskPool(self.max_workers, "note") as note_pool:
+                for file_entry, file_local_dir in pending_files:
+                    note_pool.submit(self._pull_file_entry, file_entry, file_local_dir)
+                while True:
+                    job = file_queue.get()
+                    if job is CRAWL_DONE:
+                        break
+                    file_entry, file_local_dir = job
+                    note_pool.submit(self._pull_file_entry, file_entry, file_local_dir)
+        finally:
+            # 下载出错时停止遍历，并取完队列，保证遍历线程不被阻塞
+            crawler.stop()
+            while job is not CRAWL_DONE:
+                job = file_queue.get()
+            crawl_thread.join()
+            self.synced_dir_ids.update(crawler.dir_ids)
+        if errors:
+            raise errors[0]
+
+    def _create_crawler(self) -> DirCrawler:
+        if self.async_workers > 0:
+            return AsyncDirCrawler(
+                self.youdaonote_api,
+                self.async_workers,
+                self.dir_manifest,
+                self.checkpoint,
+            )
+        return DirCrawler(
+            self.youdaonote_api, self.crawl_workers, self.dir_manifest, self.checkpoint
+        )
+
+    def list_files(self, start_dirs) -> list:
+        """
+        先遍历完整个目录树，返回所有文件，用于在下载前统计文件总数
+        下载时直接使用返回的文件，每个目录的目录信息只请求一次
+        :param start_dirs: 起始目录 [(dir_id, local_dir, dir_entry), ...]
+        :return: [(file_entry, local_dir), ...]
+        """
+        # 不限制队列大小，遍历完才开始下载
+        file_queue = queue.Queue()
+        crawler = self._create_crawler()
+        crawler.crawl(start_dirs, file_queue)
+        self.synced_dir_ids.update(crawler.dir_ids)
+        files = []
+        job = file_queue.get()
+        while job is not CRAWL_DONE:
+            files.append(job)
+            job = file_queue.get()
+        return files
+
+    def _pull_file_entry(self, file_entry, local_dir):
+        """
+        新增或更新目录中的文件，成功后记录断点；失败的文件不记录，断点续传时重试
+        :param file_entry:
+        :param local_dir:
+        :return:
+        """
+        result = self._add_or_update_file(
+            file_entry["id"],
+            file_entry["name"],
+            local_dir,
+            file_entry["modifyTimeForSort"],
+            file_entry["createTimeForSort"],
+            file_entry.get("version"),
+        )
+        if isinstance(result, Future):
+            # 笔记在转换进程池中转换，保存完成后再记录
+            result.add_done_callback(
+                lambda future: self._file_entry_done(file_entry["id"], future.result())
+            )
+        else:
+            self._file_entry_done(file_entry["id"], result)
+
+    def _file_entry_done(self, file_id, succeeded):
+        """
+        文件处理完成，成功时记录断点
+        :param file_id:
+        :param succeeded:
+        :return:
+        """
+        if succeeded and self.checkpoint:
+            self.checkpoint.file_done(file_id)
+        self.metrics.incr("files")
+
+    def _restore_checkpoint(self):
+        """
+        断点续传时，上次已处理完的文件和目录也记为本次同步，避免被当作云端已删除的文件清理
+        :return:
+        """
+        self.synced_dir_ids.update(self.checkpoint.dir_ids())
+        for file_id in self.checkpoint.done_file_ids:
+            record = self.manifest.get(file_id) if self.manifest else None
+            if record:
+                self.synced_file_ids.add(file_id)
+                self._add_synced_file(record["path"])
+
+    def pull(self, dir_id, resume=False, progress_interval=0):
+        """
+        导出目录下所有文件，完成后清理本地多余的文件，并输出运行统计
+        :param dir_id: 有道云笔记目录 ID
+        :param resume: 是否从上次中断的位置继续
+        :param progress_interval: 每隔多少秒输出一次进度，0 为不输出；
+            输出进度时先遍历完目录树统计文件总数，进度中包含完成比例和预计剩余时间
+        :return:
+        """
+        self.metrics.start_progress(progress_interval)
+        try:
+            self._pull(dir_id, resume, count_first=progress_interval > 0)
+        finally:
+            self.metrics.stop_progress()
+        self.metrics.log_summary()
+
+    def _pull(self, dir_id, resume, count_first=False):
+        """
+        导出目录下所有文件，完成后清理本地多余的文件
+        :param dir_id:
+        :param resume:
+        :param count_first: 是否先遍历完目录树统计文件总数，再下载
+        :return:
+        """
+        self.checkpoint = PullCheckpoint(self.root_local_dir)
+        if resume and self.checkpoint.load(dir_id):
+            self._restore_checkpoint()
+            start_dirs = self.checkpoint.pending_dirs()
+            pending_files = self.checkpoint.pending_files()
+            logging.info(
+                "从上次中断的位置继续，剩余 {} 个目录未遍历，{} 个文件未处理".format(
+                    len(start_dirs), len(pending_files)
+                )
+            )
+        else:
+            self.checkpoint.start(dir_id, self.root_local_dir)
+            start_dirs = [(dir_id, self.root_local_dir, None)]
+            pending_files = []
+
+        # 转换完成后在 max_workers 个回调线程中迁移图片、写入文件，下载线程不等待转换
+        self.convert_pool = ProcessTaskPool(
+            self.convert_workers,
+            max_pending=self.convert_workers * 2 + self.max_workers,
+            callback_workers=self.max_workers,
+        )
+        with self.convert_pool:
+            if count_first:
+                files = list(pending_files) + self.list_files(start_dirs)
+                self.metrics.set_total_files(len(files))
+                logging.info("共 {} 个文件需要处理".format(len(files)))
+                with OrderedTaskPool(self.max_workers, "note") as note_pool:
+                    for file_entry, file_local_dir in files:
+                        note_pool.submit(
+                            self._pull_file_entry, file_entry, file_local_dir
+                        )
+            elif self.crawl_workers > 0 or self.async_workers > 0:
+                self.pull_dir_by_crawler(start_dirs, pending_files)
             else:
-                modify_time = file_entry["modifyTimeForSort"]
-                create_time = file_entry["createTimeForSort"]
-                self._add_or_update_file(id, name, local_dir, modify_time, create_time)
-    
+                with OrderedTaskPool(self.max_workers, "note") as note_pool:
+                    for file_entry, file_local_dir in pending_files:
+                        note_pool.submit(
+                            self._pull_file_entry, file_entry, file_local_dir
+                        )
+                    for start_dir_id, start_local_dir, dir_entry in start_dirs:
+                        self.pull_dir_by_id_recursively(
+                            start_dir_id, start_local_dir, note_pool, dir_entry
+                        )
+        self.convert_pool = None
+
+        # 清理云端不存在的文件
+        logging.info("正在清理本地多余的文件 ...")
+        with self.metrics.stage("clean_orphans"):
+            self._clean_orphaned_files()
+        self.manifest.prune(self.synced_file_ids, self.synced_dir_ids)
+        self.manifest.save()
+        self.output.log_summary()
+        if self.asset_store:
+            self.asset_store.save()
+        failed_count = self.metrics.counters.get("failed", 0)
+        if failed_count:
+            # 保留断点记录，失败的文件未记为已处理，加上 --resume 重新运行时重试
+            self.checkpoint.close()
+            logging.info("{} 个文件处理失败，已保留断点记录，可加上 --resume 重试".format(failed_count))
+        else:
+            self.checkpoint.finish()
+
     def _clean_orphaned_files(self):
         """
         清理本地存在但云端不存在的文件和资源
@@ -259,23 +610,57 @@ class YoudaoNotePull(object):
                     if rel_path not in self.synced_files:
                         logging.info("删除云端不存在的笔记：「{}」".format(file_path))
                         os.remove(file_path)
-        
+
         # 2. 清理assets中无主的资源文件夹
         assets_dir = os.path.join(self.root_local_dir, "assets")
         if os.path.exists(assets_dir):
             for note_folder in os.listdir(assets_dir):
                 note_folder_path = os.path.join(assets_dir, note_folder)
+                # 全局资源存储不属于任何笔记，不清理
+                if note_folder == OBJECTS_DIR_NAME:
+                    continue
                 if os.path.isdir(note_folder_path):
                     # 检查对应的md文件是否存在于synced_files中
-                    expected_md = os.path.join("posts", note_folder + ".md").replace("\\", "/")
+                    expected_md = os.path.join("posts", note_folder + ".md").replace(
+                        "\\", "/"
+                    )
                     if expected_md not in self.synced_files:
                         import shutil
+
                         logging.info("删除无主的资源文件夹：「{}」".format(note_folder_path))
                         shutil.rmtree(note_folder_path)
 
+    def _is_unchanged(self, record, file_name, rel_dir, modify_time, version) -> bool:
+        """
+        根据同步记录判断文件是否未更新
+        :param record: 同步记录
+        :param file_name: 优化后的文件名
+        :param rel_dir: 相对于 root_local_dir 的目录
+        :param modify_time:
+        :param version:
+        :return:
+        """
+        if not record:
+            return False
+        # 文件重命名或移动目录后，本地路径会变化，需要重新下载
+        if record.get("name") != file_name or record.get("dir") != rel_dir:
+            return False
+        if version is not None and record.get("version") != version:
+            return False
+        return modify_time <= record.get("modify_time", 0)
+
+    def _add_synced_file(self, rel_path):
+        """
+        记录同步的文件（相对路径）
+        :param rel_path:
+        :return:
+        """
+        with self._synced_files_lock:
+            self.synced_files.add(rel_path)
+
     def _add_or_update_file(
-        self, file_id, file_name, local_dir, modify_time, create_time
-    ):
+        self, file_id, file_name, local_dir, modify_time, create_time, version=None
+    ) -> Union[bool, Future]:
         """
         新增或更新文件
         :param file_id:
@@ -283,7 +668,8 @@ class YoudaoNotePull(object):
         :param local_dir:
         :param modify_time:
         :param create_time:
-        :return:
+        :param version: 有道云笔记文件版本
+        :return: 是否成功，下载、转换出错时为 False；笔记在转换进程池中转换时返回 Future，结果为是否成功
         """
         file_name = self._optimize_file_name(file_name)
         youdao_file_suffix = os.path.splitext(file_name)[1]  # 笔记后缀
@@ -291,8 +677,24 @@ class YoudaoNotePull(object):
             "\\", "/"
         )  # 原后缀路径
 
-        # 所有类型文件均下载，不做处理
-        file_type = self._judge_type(file_id, youdao_file_suffix)
+        with self._synced_files_lock:
+            self.synced_file_ids.add(file_id)
+
+        # 同步记录中文件未更新，直接跳过，不下载也不读取本地文件
+        record = self.manifest.get(file_id) if self.manifest else None
+        rel_dir = os.path.relpath(local_dir, self.root_local_dir).replace("\\", "/")
+        if self._is_unchanged(record, file_name, rel_dir, modify_time, version):
+            self._add_synced_file(record["path"])
+            logging.info("此文件「%s」不更新，跳过", record["path"])
+            self.metrics.incr("skipped")
+            return True
+
+        # 「笔记」类型需要根据内容判断类型，先下载；下载内容会直接用于转换，不会重复下载
+        content = None
+        if youdao_file_suffix in NOTE_SUFFIXES:
+            content = self._download_note(file_id)
+        with self.metrics.stage("sniff_type"):
+            file_type = self._judge_type(youdao_file_suffix, content)
 
         # 「文档」类型本地文件均已 .md 结尾，并保存在 posts 文件夹中
         if file_type != FileType.OTHER:
@@ -311,101 +713,211 @@ class YoudaoNotePull(object):
             "，云笔记原格式为 {}".format(file_type.name) if file_type != FileType.OTHER else ""
         )
 
-        file_action = self._get_file_action(local_file_path, modify_time)
-        
-        # 记录同步的文件（相对路径）
-        rel_path = os.path.relpath(local_file_path, self.root_local_dir).replace("\\", "/")
-        self.synced_files.add(rel_path)
-        
-        if file_action == FileActionEnum.CONTINUE:
-            return
-        if file_action == FileActionEnum.UPDATE:
-            # 考虑到使用 f.write() 直接覆盖原文件，在 Windows 下报错（WinError 183），先将其删除
-            os.remove(local_file_path)
-        try:
-            self._pull_file(
-                file_id,
-                original_file_path,
-                local_file_path,
-                file_type,
-                youdao_file_suffix,
-                local_dir,
-            )
-            logging.info("{}「{}」{}".format(file_action.value, local_file_path, tip))
+        file_action = self._get_file_action(local_file_path, modify_time, record)
 
-            # 本地文件时间设置为有道云笔记的时间
-            if platform.system() == "Windows":
-                setctime(local_file_path, create_time)
-            else:
-                os.utime(local_file_path, (create_time, modify_time))
+        rel_path = os.path.relpath(local_file_path, self.root_local_dir).replace(
+            "\\", "/"
+        )
+        self._add_synced_file(rel_path)
+        manifest_fields = {
+            "modify_time": modify_time,
+            "version": version,
+            "name": file_name,
+            "dir": rel_dir,
+            "path": rel_path,
+        }
 
-        except Exception as error:
+        if file_action == FileActionEnum.CONTINUE:
+            # 旧版本导出的文件没有同步记录，补上记录，下次不用再读取本地文件时间
+            if self.manifest:
+                self.manifest.update(file_id, assets={}, **manifest_fields)
+            self.metrics.incr("skipped")
+            return True
+
+        def fail(error):
+            self.metrics.incr("failed")
             logging.info(
                 "{}「{}」可能失败！请检查文件！错误提示：{}".format(
                     file_action.value, original_file_path, format(error)
                 )
             )
+            return False
 
-    def _pull_file(
-        self, file_id, file_path, local_file_path, file_type, youdao_file_suffix, local_dir
-    ):
+        def finish(assets, changed):
+            if not changed:
+                # 内容未变化，不修改本地文件，也不修改文件时间
+                logging.info("「{}」内容未变化，不写入{}".format(local_file_path, tip))
+            else:
+                logging.info("{}「{}」{}".format(file_action.value, local_file_path, tip))
+
+                # 本地文件时间设置为有道云笔记的时间
+                if platform.system() == "Windows":
+                    setctime(local_file_path, create_time)
+                else:
+                    os.utime(local_file_path, (create_time, modify_time))
+
+            if self.manifest:
+                self.manifest.update(file_id, assets=assets, **manifest_fields)
+            return True
+
+        def finish_converted(task, note_type, start, size):
+            # 在转换进程池的回调线程中执行
+            try:
+                return finish(
+                    *self._save_converted(
+                        task, note_type, start, size, local_file_path, local_dir
+                    )
+                )
+            except Exception as error:
+                return fail(error)
+
+        try:
+            if file_type == FileType.OTHER and content is None:
+                # 附件等其他文件可能很大，流式写入临时文件，不读入内存
+                start = time.perf_counter()
+                tmp_path, md5, _ = stream_to_temp_file(
+                    self.youdaonote_api.get_file_by_id(file_id, stream=True), local_dir
+                )
+                try:
+                    self.metrics.add_stage(
+                        "download_file",
+                        time.perf_counter() - start,
+                        size=os.path.getsize(tmp_path),
+                    )
+                    changed = self.output.replace(tmp_path, local_file_path, md5)
+                except BaseException:
+                    # 替换失败时删除临时文件，不留下 .part 文件
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                assets = {}
+            else:
+                if content is None:
+                    content = self._download_note(file_id)
+                if (
+                    self.convert_pool
+                    and self.convert_pool.max_workers
+                    and file_type in (FileType.XML, FileType.JSON)
+                ):
+                    # 设置了 convert_workers 时在子进程中转换，不等待转换完成
+                    note_type = "xml" if file_type == FileType.XML else "json"
+                    return self.convert_pool.submit(
+                        covert_note_to_markdown,
+                        content,
+                        note_type,
+                        callback=functools.partial(
+                            finish_converted,
+                            note_type=note_type,
+                            start=time.perf_counter(),
+                            size=len(content),
+                        ),
+                    )
+                assets, changed = self._pull_file(
+                    content, local_file_path, file_type, local_dir
+                )
+            return finish(assets, changed)
+        except Exception as error:
+            return fail(error)
+
+    def _download_note(self, file_id) -> bytes:
         """
-        下载文件
+        下载笔记内容，计入 download_note 阶段
         :param file_id:
-        :param file_path:
+        :return: 笔记字节码
+        """
+        start = time.perf_counter()
+        content = self.youdaonote_api.get_file_by_id(file_id).content
+        self.metrics.add_stage(
+            "download_note", time.perf_counter() - start, size=len(content)
+        )
+        return content
+
+    def _pull_file(self, content, local_file_path, file_type, local_dir):
+        """
+        保存文件
+        :param content: 已下载的文件字节码
         :param local_file_path: 本地
         :param file_type:
-        :param youdao_file_suffix:
         :param local_dir: 本地目录
-        :return:
+        :return: (笔记中迁移的图片、附件 {有道云链接: 新链接}, 是否写入)
         """
-        # 0、如果是文档类型（会被转换为markdown），清理对应的资源文件夹
-        if file_type != FileType.OTHER:
-            import shutil
-            # 获取笔记名称（不含扩展名）
-            note_name = os.path.splitext(os.path.basename(local_file_path))[0]
-            # 清理资源文件夹
-            assets_folder = os.path.join(local_dir, "assets", note_name).replace("\\", "/")
-            if os.path.exists(assets_folder):
-                logging.info("清理旧资源文件夹：「{}」".format(assets_folder))
-                shutil.rmtree(assets_folder)
-        
-        # 1、所有的都先下载
-        response = self.youdaonote_api.get_file_by_id(file_id)
-        with open(file_path, "wb") as f:
-            f.write(response.content)  # response.content 本身就是字节类型
-
-        # 2、如果文件是 note 类型，将其转换为 MarkDown 类型
-        if file_type == FileType.XML:
-            try:
-                YoudaoNoteConvert.covert_xml_to_markdown(file_path)
-            except ET.ParseError:
-                logging.info("此 note 笔记应该为 17 年以前新建，格式为 html，将转换为 Markdown ...")
-                YoudaoNoteConvert.covert_html_to_markdown(file_path)
-            except Exception as e:
-                logging.info("note 笔记转换 MarkDown 失败，将跳过", repr(e))
-            # 转换后文件名变为 .md
-            file_path = os.path.splitext(file_path)[0] + MARKDOWN_SUFFIX
-        elif file_type == FileType.JSON:
-            YoudaoNoteConvert.covert_json_to_markdown(file_path)
-            # 转换后文件名变为 .md
-            file_path = os.path.splitext(file_path)[0] + MARKDOWN_SUFFIX
-
-        # 2.5、如果是文档类型且路径不同，将文件移动到目标位置（posts文件夹）
-        if file_type != FileType.OTHER and file_path != local_file_path:
-            import shutil
-            shutil.move(file_path, local_file_path)
+        # 1、非文档类型，直接保存
+        if file_type == FileType.OTHER:
+            return {}, self.output.write(local_file_path, content)
+
+        # 2、如果文件是 note 类型，在内存中转换为 MarkDown，原始内容不写入磁盘
+        if file_type in (FileType.XML, FileType.JSON):
+            note_type = "xml" if file_type == FileType.XML else "json"
+            start = time.perf_counter()
+            markdown, is_html = covert_note_to_markdown(content, note_type)
+            self._add_convert_stage(
+                note_type, is_html, time.perf_counter() - start, len(content)
+            )
+        else:
+            markdown = content.decode("utf-8")
+        return self._save_markdown(markdown, local_file_path, local_dir)
+
+    def _save_converted(self, task, note_type, start, size, local_file_path, local_dir):
+        """
+        保存在转换进程池中转换的笔记
+        :param task: covert_note_to_markdown 的 Future
+        :param note_type: xml 或 json
+        :param start: 提交转换的时间，转换耗时包含排队时间
+        :param size: 笔记字节数
+        :param local_file_path:
+        :param local_dir:
+        :return: 同 _pull_file
+        """
+        markdown, is_html = task.result()
+        self._add_convert_stage(note_type, is_html, time.perf_counter() - start, size)
+        return self._save_markdown(markdown, local_file_path, local_dir)
+
+    def _add_convert_stage(self, note_type, is_html, seconds, size):
+        # 17 年以前的 html 笔记转换后才能确定类型
+        self.metrics.add_stage(
+            "convert_html" if is_html else "convert_" + note_type, seconds, size=size
+        )
+        if is_html:
+            logging.info("此 note 笔记应该为 17 年以前新建，格式为 html，已转换为 Markdown")
 
+    def _save_markdown(self, markdown, local_file_path, local_dir):
+        """
+        迁移图片、附件后保存 markdown
+        :return: 同 _pull_file
+        """
         # 3、迁移文本文件里面的有道云笔记图片（链接）
-        if file_type != FileType.OTHER or youdao_file_suffix == MARKDOWN_SUFFIX:
-            imagePull = ImagePull(
-                self.youdaonote_api, self.smms_secret_token, self.is_relative_path
-            )
-            # 传入local_dir以便正确计算assets路径
-            imagePull.migration_ydnote_url(local_file_path, local_dir)
+        imagePull = ImagePull(
+            self.youdaonote_api,
+            self.smms_secret_token,
+            self.is_relative_path,
+            self.asset_store,
+            self.image_workers,
+            self.output,
+            self.metrics,
+        )
+        # 传入local_dir以便正确计算assets路径
+        markdown, assets = imagePull.migrate_content(
+            markdown, local_file_path, local_dir
+        )
+
+        # 4、保存到目标位置（posts文件夹），内容未变化时不写入
+        return assets, self.output.write(local_file_path, markdown.encode("utf-8"))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出有道云笔记到本地")
+    parser.add_argument(
+        "--resume", action="store_true", help="从上次中断的位置继续导出，不再遍历已遍历完的目录"
+    )
+    parser.add_argument(
+        "--progress",
+        type=float,
+        default=0,
+        help="每隔多少秒输出一次进度（先遍历目录树统计文件总数，输出完成比例和预计剩余时间），默认不输出",
+    )
+    parser.add_argument("--metrics", help="将各阶段耗时、各接口请求数等运行统计保存为 json 文件")
+    args = parser.parse_args()
+
     log.init_logging()
 
     start_time = int(time.time())
@@ -417,12 +929,11 @@ if __name__ == "__main__":
             logging.info(error_msg)
             sys.exit(1)
         logging.info("正在 pull，请稍后 ...")
-        youdaonote_pull.pull_dir_by_id_recursively(
-            ydnote_dir_id, youdaonote_pull.root_local_dir
+        youdaonote_pull.pull(
+            ydnote_dir_id, resume=args.resume, progress_interval=args.progress
         )
-        # 清理云端不存在的文件
-        logging.info("正在清理本地多余的文件 ...")
-        youdaonote_pull._clean_orphaned_files()
+        if args.metrics:
+            youdaonote_pull.metrics.save(args.metrics)
     except requests.exceptions.ProxyError:
         logging.info(
             "请检查网络代理设置；也有可能是调用有道云笔记接口次数达到限制，请等待一段时间后重新运行脚本，若一直失败，可删除「cookies.json」后重试"
@@ -7,6 +7,8 @@ import os
 import shutil
 from pathlib import Path
 
+from core.store import OBJECTS_DIR_NAME
+
 
 def get_image_md5(file_path):
     """计算图片内容的 MD5"""
@@ -42,6 +44,9 @@ def rename_images_by_md5(source_dir, output_dir):
     for file_path in source_path.rglob('*'):
         if not file_path.is_file():
             continue
+        # 跳过全局资源存储，其中的文件均为各笔记资源的硬链接源
+        if OBJECTS_DIR_NAME in file_path.relative_to(source_path).parts:
+            continue
             
         total += 1
         ext = file_path.suffix.lower()
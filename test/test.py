@@ -2,15 +2,40 @@
 
 from __future__ import absolute_import
 
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
 import os
 import sys
+import tempfile
+import threading
+import time
 import unittest
+import xml.etree.ElementTree as ET
+from concurrent.futures.process import BrokenProcessPool
 from unittest.mock import Mock, mock_open, patch
 
+import requests
+
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from core.api import YoudaoNoteApi
-from core.covert import YoudaoNoteConvert
+from core.checkpoint import PullCheckpoint
+from core.covert import (
+    JsonConvert,
+    XmlElementConvert,
+    YoudaoNoteConvert,
+    covert_note_to_markdown,
+)
+from core.image import ImagePull
+from core.manifest import SyncManifest
+from core.metrics import PullMetrics
+from core.pool import OrderedTaskPool, ProcessTaskPool
+from core.retry import RetryPolicy, TokenBucket
+from core.store import AssetStore
 from pull import YoudaoNotePull
 
 # 使用 test_cookies.json 作为 cookies 地址，避免 cookies.json 数据在运行测试用例时被错误覆盖
@@ -26,6 +51,38 @@ class MockResponse:
         return self.json_data
 
 
+def file_entry(id, is_dir=False):
+    """
+    目录信息中的一项，目录名为 id，文件名为 id.md
+    :param id: 文件或目录 ID
+    :param is_dir: 是否为目录
+    :return:
+    """
+    return {
+        "fileEntry": {
+            "id": id,
+            "name": id if is_dir else id + ".md",
+            "dir": is_dir,
+            "modifyTimeForSort": 1600000000,
+            "createTimeForSort": 1600000000,
+        }
+    }
+
+
+def exit_in_child_process(marker_path=None):
+    """
+    模拟转换进程被系统杀掉：marker_path 不存在时创建后退出子进程，已存在时返回 marker_path
+    不应在主进程中执行
+    """
+    if multiprocessing.current_process().name == "MainProcess":
+        raise AssertionError("在主进程中执行")
+    if marker_path and os.path.exists(marker_path):
+        return marker_path
+    if marker_path:
+        open(marker_path, "w").close()
+    os._exit(1)
+
+
 class YoudaoNoteApiTest(unittest.TestCase):
     """
     测试有道云笔记 API
@@ -156,6 +213,35 @@ class YoudaoNoteApiTest(unittest.TestCase):
         self.assertTrue(dir_info["entries"][0]["fileEntry"]["dir"])
         self.assertFalse(dir_info["entries"][1]["fileEntry"]["dir"])
 
+    def test_iter_dir_entries(self):
+        """
+        测试分页获取目录下所有文件信息
+        python test.py YoudaoNoteApiTest.test_iter_dir_entries
+        """
+        youdaonote_api = YoudaoNoteApi(cookies_path=TEST_COOKIES_PATH)
+        youdaonote_api.cstk = "fPk5IkDg"
+        youdaonote_api.DIR_PAGE_SIZE = 2
+        entries = [{"fileEntry": {"id": "note_%d" % i, "dir": False}} for i in range(5)]
+        pages = {
+            None: entries[0:2],
+            "note_1": entries[2:4],
+            "note_3": entries[4:5],
+        }
+
+        def http_get(url):
+            last_id = url.split("&lastId=")[1] if "&lastId=" in url else None
+            return MockResponse({"count": 5, "entries": pages[last_id]}, 200)
+
+        youdaonote_api.http_get = Mock(side_effect=http_get)
+        # 期待：不足一页时停止，共请求 3 页，返回所有文件
+        self.assertEqual(list(youdaonote_api.iter_dir_entries("test_dir_id")), entries)
+        self.assertEqual(youdaonote_api.http_get.call_count, 3)
+
+        # 接口返回格式变化时。期待：提示接口已修改
+        youdaonote_api.http_get = Mock(return_value=MockResponse({}, 200))
+        with self.assertRaises(KeyError):
+            list(youdaonote_api.iter_dir_entries("test_dir_id"))
+
     def test_get_file_by_id(self):
         """
         测试根据文件 ID 获取文件内容
@@ -176,6 +262,111 @@ class YoudaoNoteApiTest(unittest.TestCase):
         file = youdaonote_api.get_file_by_id(file_id="test_note_id")
         self.assertTrue(file)
 
+    def test_retry_request(self):
+        """
+        测试网络错误、被限流时重试
+        python test.py YoudaoNoteApiTest.test_retry_request
+        """
+        youdaonote_api = YoudaoNoteApi(
+            cookies_path=TEST_COOKIES_PATH, retry_policy=RetryPolicy(max_retries=2)
+        )
+        throttled = Mock(status_code=429, headers={"Retry-After": "7"})
+        ok = Mock(status_code=200, headers={})
+
+        # 被限流后恢复。期待：按 Retry-After 等待后重试成功
+        youdaonote_api.session.request = Mock(side_effect=[throttled, ok])
+        with patch("core.api.time.sleep") as sleep:
+            self.assertIs(youdaonote_api.http_get("https://note.youdao.com/x"), ok)
+            sleep.assert_called_once_with(7.0)
+        # 期待：重试的请求也计入统计
+        self.assertEqual(
+            youdaonote_api.metrics.summary()["endpoints"]["resource"],
+            {"requests": 2, "throttled": 1, "errors": 0, "bytes": 0},
+        )
+
+        # 一直网络错误。期待：重试 2 次后抛出异常
+        youdaonote_api.session.request = Mock(
+            side_effect=requests.exceptions.ConnectionError("connection reset")
+        )
+        with patch("core.api.time.sleep") as sleep:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                youdaonote_api.http_get("https://note.youdao.com/x")
+            self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(youdaonote_api.session.request.call_count, 3)
+
+        # 非限流的错误状态码。期待：不重试
+        not_found = Mock(status_code=404, headers={})
+        youdaonote_api.session.request = Mock(return_value=not_found)
+        self.assertIs(youdaonote_api.http_get("https://note.youdao.com/x"), not_found)
+        youdaonote_api.session.request.assert_called_once()
+
+    def test_token_bucket(self):
+        """
+        测试令牌桶限流
+        python test.py YoudaoNoteApiTest.test_token_bucket
+        """
+        bucket = TokenBucket(rate=10, capacity=2)
+        # 桶内 2 个令牌可立即使用，第 3 个需等待 0.1 秒
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        # 被限流后速率减半，成功后逐步恢复
+        bucket.on_throttled()
+        self.assertEqual(bucket.rate, 5)
+        for _ in range(100):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 10)
+
+
+@unittest.skipUnless(importlib.util.find_spec("aiohttp"), "需要安装 aiohttp")
+class AsyncYoudaoNoteApiTest(unittest.TestCase):
+    """
+    测试有道云笔记异步 API
+    python test.py AsyncYoudaoNoteApiTest
+    """
+
+    def test_get_dir_info_by_id_concurrently(self):
+        """
+        测试并发获取目录信息，同时进行的请求数不超过 concurrency
+        python test.py AsyncYoudaoNoteApiTest.test_get_dir_info_by_id_concurrently
+        """
+        from aiohttp import web
+
+        from core.async_api import AsyncYoudaoNoteApi
+
+        in_flight = {"now": 0, "max": 0}
+
+        async def handler(request):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return web.json_response(
+                {"count": 0, "entries": [], "dirId": request.match_info["dir_id"]}
+            )
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/{dir_id}", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            async_api = AsyncYoudaoNoteApi(cookies={}, cstk="fPk5IkDg", concurrency=3)
+            async_api.DIR_MES_URL = "http://127.0.0.1:%d/{dir_id}?cstk={cstk}" % port
+            async with async_api:
+                dir_infos = await asyncio.gather(
+                    *[async_api.get_dir_info_by_id("dir_%d" % i) for i in range(10)]
+                )
+            await runner.cleanup()
+            return dir_infos
+
+        dir_infos = asyncio.run(run())
+        self.assertEqual([info["dirId"] for info in dir_infos], ["dir_%d" % i for i in range(10)])
+        self.assertLessEqual(in_flight["max"], 3)
+
 
 class YoudaoNoteCovert(unittest.TestCase):
     """
@@ -228,6 +419,199 @@ class YoudaoNoteCovert(unittest.TestCase):
         # CRLF => \r\n, LF => \n
         self.assertEqual(line.replace("\r\n", "\n"), target)
 
+    def test_covert_content_in_memory(self):
+        """
+        测试直接转换内存中的笔记内容
+        python test.py YoudaoNoteCovert.test_covert_content_in_memory
+        """
+        with open("test/test.note", "rb") as f:
+            content = YoudaoNoteConvert.xml_to_markdown(f.read())
+        with open("test/test.md", "rb") as f:
+            self.assertEqual(content.replace("\r\n", "\n"), f.read().decode())
+
+        with open("test/test.json", "rb") as f:
+            content = YoudaoNoteConvert.json_to_markdown(f.read())
+        self.assertEqual(
+            content,
+            YoudaoNoteConvert._clean_markdown_format(
+                YoudaoNoteConvert._covert_json_to_markdown_content("test/test.json")
+            ),
+        )
+
+        self.assertEqual(YoudaoNoteConvert.xml_to_markdown(b""), "")
+        self.assertEqual(
+            YoudaoNoteConvert.html_to_markdown("<div><b>bold</b></div>"), "**bold**"
+        )
+
+    def test_covert_xml_to_markdown_streaming(self):
+        """
+        测试边解析边转换 XML 笔记
+        python test.py YoudaoNoteCovert.test_covert_xml_to_markdown_streaming
+        """
+        with open("test/test.md", "rb") as f:
+            content_target = f.read().decode()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "test.note")
+            with open("test/test.note", "rb") as f, open(file_path, "wb") as new_f:
+                new_f.write(f.read())
+            # 逐块返回
+            blocks = list(YoudaoNoteConvert.iter_xml_to_markdown(file_path))
+            self.assertEqual("\r\n\r\n".join(blocks).replace("\r\n", "\n"), content_target)
+
+            # 转换后写入 .md 文件，删除原文件
+            self.assertTrue(YoudaoNoteConvert.covert_xml_to_markdown(file_path))
+            self.assertFalse(os.path.exists(file_path))
+            with open(os.path.join(tmp_dir, "test.md"), "rb") as f:
+                self.assertEqual(f.read().decode().replace("\r\n", "\n"), content_target)
+
+            # XML 格式错误时。期待：抛出异常，不留下不完整的文件
+            with open(file_path, "wb") as f:
+                f.write(b"<div>text<br></div>")
+            with self.assertRaises(ET.ParseError):
+                YoudaoNoteConvert.covert_xml_to_markdown(file_path)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["test.md", "test.note"])
+
+        # 内存中的内容超过阈值时增量转换。期待：与整篇解析结果一致
+        with open("test/test.note", "rb") as f:
+            content = f.read()
+        with patch("core.covert.XML_STREAM_THRESHOLD", 0):
+            self.assertEqual(
+                YoudaoNoteConvert.xml_to_markdown(content).replace("\r\n", "\n"),
+                content_target,
+            )
+
+    def test_covert_json_blocks(self):
+        """
+        测试 json 代码块、高亮块、引用、表格转换
+        python test.py YoudaoNoteCovert.test_covert_json_blocks
+        """
+
+        def line(text):
+            return {"5": [{"7": [{"8": text}]}]}
+
+        def cell(text):
+            return {"5": [{"5": [{"7": [{"8": text}] if text else []}]}]}
+
+        converter = JsonConvert()
+        lines = [line("a = 1"), line(""), line("b = 2")]
+        self.assertEqual(
+            converter.convert_cd_func({"4": {"la": "python"}, "5": lines}),
+            "```python\r\na = 1\n\nb = 2\n```",
+        )
+        self.assertEqual(converter.convert_la_func({"5": []}), "```\r\n```")
+        self.assertEqual(
+            converter.convert_q_func({"5": [line("a\n"), line("b")]}), "> a\n> b\n"
+        )
+        table = {
+            "5": [
+                {"5": [cell("h1"), cell("h2")]},
+                {"5": [cell("a"), cell("")]},
+                {"5": [cell("b"), cell("c")]},
+            ]
+        }
+        self.assertEqual(
+            converter.convert_t_func(table),
+            "| h1 | h2 | \r\n| -- | -- |\n| a |   | \r\n| b | c | \r\n",
+        )
+
+    def test_clean_markdown_format(self):
+        """
+        测试清理 markdown 格式问题
+        python test.py YoudaoNoteCovert.test_clean_markdown_format
+        """
+        content = "\n".join(
+            [
+                "# 标题",
+                "段落",
+                "",
+                "##   学习表征（**Representations**）",
+                "**Text: **[link](url)",
+                "前****后",
+                "![](image.png)",
+                "",
+                "### 三级标题",
+                "```python",
+                "**code: **[x] ****",
+                "    ```",
+                "",
+                "## not a heading",
+                "```",
+                "",
+                "## 代码块后的标题",
+            ]
+        )
+        expected = "\n".join(
+            [
+                "# 标题",
+                "段落<br><br>",
+                "",
+                "## 学习表征（Representations）",
+                "**Text:** [link](url)",
+                "前**后",
+                "![](image.png)<br>",
+                "",
+                "### 三级标题",
+                "```python",
+                "**code: **[x] ****",
+                "    ```",
+                "",
+                "## not a heading",
+                "```",
+                "",
+                "## 代码块后的标题",
+            ]
+        )
+        self.assertEqual(YoudaoNoteConvert._clean_markdown_format(content), expected)
+
+    def test_register_block_convert(self):
+        """
+        测试注册新的块类型转换函数
+        python test.py YoudaoNoteCovert.test_register_block_convert
+        """
+        JsonConvert.register("my-block", lambda converter, content: "my-block")
+        self.addCleanup(delattr, JsonConvert, "convert_my_block_func")
+
+        @XmlElementConvert.register("custom-block")
+        def convert_custom_block(**kwargs):
+            return "custom:" + kwargs["text"]
+
+        self.addCleanup(delattr, XmlElementConvert, "convert_custom_block_func")
+
+        json_content = '{"5": [{"6": "my-block", "5": []}, {"5": [{"7": [{"8": "text"}]}]}]}'
+        self.assertEqual(
+            YoudaoNoteConvert._json_to_markdown_content(json_content), "my-block\r\n\r\ntext"
+        )
+
+        xml_content = (
+            '<note xmlns="http://note.youdao.com"><head/><body>'
+            "<custom-block><text>abc</text></custom-block>"
+            "<unknown><text>def</text></unknown>"
+            "</body></note>"
+        )
+        self.assertEqual(
+            YoudaoNoteConvert.xml_to_markdown(xml_content), "custom:abc\r\n\r\ndef"
+        )
+
+    def test_covert_corpus_note(self):
+        """
+        测试合成语料：同一 seed 的三种格式内容一致，都能转换出全部图片
+        python test.py YoudaoNoteCovert.test_covert_corpus_note
+        """
+        from benchmark.corpus import make_blocks, make_corpus_note
+
+        blocks = make_blocks(60, seed=1)
+        image_urls = [block["url"] for block in blocks if block["kind"] == "image"]
+        self.assertTrue(image_urls)
+        for note_format in ("xml", "json", "html"):
+            content = make_corpus_note(note_format, 60, seed=1)
+            self.assertEqual(content, make_corpus_note(note_format, 60, seed=1))
+            markdown, is_html = covert_note_to_markdown(
+                content, "json" if note_format == "json" else "xml"
+            )
+            self.assertEqual(is_html, note_format == "html")
+            for image_url in image_urls:
+                self.assertIn("]({})".format(image_url), markdown)
+
 
 class YoudaoNotePullTest(unittest.TestCase):
     TEST_CONFIG_PATH = "test_config.json"
@@ -385,6 +769,954 @@ class YoudaoNotePullTest(unittest.TestCase):
         dir_id, error_msg = youdaonote_pull._get_ydnote_dir_id(ydnote_dir="test_dir")
         self.assertEqual(dir_id, "test_dir_id")
 
+    def test_add_file_downloads_once(self):
+        """
+        测试新增笔记时只下载一次
+        python test.py YoudaoNotePullTest.test_add_file_downloads_once
+        """
+        with open("test/test.note", "rb") as f:
+            note_content = f.read()
+        youdaonote_api = Mock()
+        youdaonote_api.get_file_by_id = Mock(
+            return_value=Mock(content=note_content, status_code=200)
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.is_relative_path = True
+            youdaonote_pull._add_or_update_file(
+                "test_note_id", "test.note", local_dir, 1600000000, 1600000000
+            )
+            # 下载一次，类型判断和转换共用同一份内容
+            youdaonote_api.get_file_by_id.assert_called_once_with("test_note_id")
+            self.assertTrue(os.path.exists(os.path.join(local_dir, "posts", "test.md")))
+            self.assertFalse(os.path.exists(os.path.join(local_dir, "test.note")))
+
+    def test_update_unchanged_content_not_written(self):
+        """
+        测试云端更新但转换后内容不变时，不写入本地文件
+        python test.py YoudaoNotePullTest.test_update_unchanged_content_not_written
+        """
+        with open("test/test.note", "rb") as f:
+            note_content = f.read()
+        youdaonote_api = Mock()
+        youdaonote_api.get_file_by_id = Mock(
+            return_value=Mock(content=note_content, status_code=200)
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.is_relative_path = True
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull._add_or_update_file(
+                "test_note_id", "test.note", local_dir, 1600000000, 1600000000, 1
+            )
+            md_path = os.path.join(local_dir, "posts", "test.md")
+            self.assertEqual(os.path.getmtime(md_path), 1600000000)
+
+            # 只有版本变化，内容相同。期待：重新下载但不写入，文件时间不变
+            youdaonote_pull._add_or_update_file(
+                "test_note_id", "test.note", local_dir, 1600000100, 1600000000, 2
+            )
+            self.assertEqual(youdaonote_api.get_file_by_id.call_count, 2)
+            self.assertEqual(os.path.getmtime(md_path), 1600000000)
+            self.assertEqual(youdaonote_pull.output.written_count, 1)
+            self.assertEqual(youdaonote_pull.output.unchanged_count, 1)
+            self.assertEqual(sorted(os.listdir(local_dir)), [".youdaonote_manifest.jsonl", "posts"])
+            youdaonote_pull.manifest.close()
+
+    def test_add_attachment_by_stream(self):
+        """
+        测试附件流式写入本地
+        python test.py YoudaoNotePullTest.test_add_attachment_by_stream
+        """
+        chunks = [b"%PDF-1.4 ", b"attachment ", b"content"]
+        response = Mock(status_code=200)
+        response.iter_content = Mock(return_value=iter(chunks))
+        youdaonote_api = Mock()
+        youdaonote_api.get_file_by_id = Mock(return_value=response)
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull._add_or_update_file(
+                "test_pdf_id", "test.pdf", local_dir, 1600000000, 1600000000
+            )
+            youdaonote_api.get_file_by_id.assert_called_once_with(
+                "test_pdf_id", stream=True
+            )
+            response.close.assert_called_once()
+            with open(os.path.join(local_dir, "test.pdf"), "rb") as f:
+                self.assertEqual(f.read(), b"".join(chunks))
+            # 临时文件已被替换，不残留
+            self.assertEqual(os.listdir(local_dir), ["test.pdf"])
+
+            # 替换本地文件失败时。期待：处理失败，删除临时文件
+            response.iter_content = Mock(return_value=iter([b"new content"]))
+            with patch.object(
+                youdaonote_pull.output, "replace", side_effect=PermissionError
+            ):
+                self.assertFalse(
+                    youdaonote_pull._add_or_update_file(
+                        "test_pdf_id", "test.pdf", local_dir, 1600000001, 1600000001
+                    )
+                )
+            self.assertEqual(os.listdir(local_dir), ["test.pdf"])
+
+    def test_skip_unchanged_file_by_manifest(self):
+        """
+        测试根据同步记录跳过未更新的笔记
+        python test.py YoudaoNotePullTest.test_skip_unchanged_file_by_manifest
+        """
+        with open("test/test.note", "rb") as f:
+            note_content = f.read()
+        youdaonote_api = Mock()
+        youdaonote_api.get_file_by_id = Mock(
+            return_value=Mock(content=note_content, status_code=200)
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.is_relative_path = True
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull._add_or_update_file(
+                "test_note_id", "test.note", local_dir, 1600000000, 1600000000, 3
+            )
+            youdaonote_pull.manifest.close()
+
+            # 重新读取同步记录，未更新时。期待：不下载，也不读取本地文件
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull.manifest.load()
+            self.assertEqual(
+                youdaonote_pull.manifest.get("test_note_id")["path"], "posts/test.md"
+            )
+            with patch("os.path.exists") as exists, patch("os.path.getmtime") as getmtime:
+                youdaonote_pull._add_or_update_file(
+                    "test_note_id", "test.note", local_dir, 1600000000, 1600000000, 3
+                )
+                exists.assert_not_called()
+                getmtime.assert_not_called()
+            youdaonote_api.get_file_by_id.assert_called_once()
+            self.assertIn("posts/test.md", youdaonote_pull.synced_files)
+
+            # 云端更新后。期待：重新下载
+            youdaonote_pull._add_or_update_file(
+                "test_note_id", "test.note", local_dir, 1600000100, 1600000000, 4
+            )
+            self.assertEqual(youdaonote_api.get_file_by_id.call_count, 2)
+            self.assertEqual(
+                youdaonote_pull.manifest.get("test_note_id")["modify_time"], 1600000100
+            )
+            youdaonote_pull.manifest.save()
+
+    def test_skip_unchanged_dir(self):
+        """
+        测试目录未更新时不再获取目录信息
+        python test.py YoudaoNotePullTest.test_skip_unchanged_dir
+        """
+        tree = {
+            "root": [
+                {"fileEntry": {"id": "a", "name": "a", "dir": True, "modifyTimeForSort": 1}},
+            ],
+            "a": [
+                {"fileEntry": {"id": "b", "name": "b", "dir": True, "modifyTimeForSort": 1}},
+                {
+                    "fileEntry": {
+                        "id": "n1",
+                        "name": "n1.md",
+                        "dir": False,
+                        "modifyTimeForSort": 1,
+                        "createTimeForSort": 1,
+                    }
+                },
+            ],
+            "b": [],
+        }
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(
+            side_effect=lambda dir_id: iter(tree[dir_id])
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.skip_unchanged_dirs = True
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull._add_or_update_file = Mock()
+            youdaonote_pull.pull_dir_by_id_recursively("root", local_dir)
+            youdaonote_pull.manifest.save()
+            self.assertEqual(youdaonote_api.iter_dir_entries.call_count, 3)
+
+            # 目录未更新时。期待：只获取起始目录信息，文件仍交给 _add_or_update_file 判断
+            youdaonote_api.iter_dir_entries.reset_mock()
+            youdaonote_pull._add_or_update_file.reset_mock()
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull.manifest.load()
+            youdaonote_pull.pull_dir_by_id_recursively("root", local_dir)
+            youdaonote_api.iter_dir_entries.assert_called_once_with("root")
+            self.assertEqual(youdaonote_pull._add_or_update_file.call_count, 1)
+
+            # 子目录更新后。期待：重新获取该目录信息
+            youdaonote_api.iter_dir_entries.reset_mock()
+            tree["root"][0]["fileEntry"]["modifyTimeForSort"] = 2
+            youdaonote_pull.pull_dir_by_id_recursively("root", local_dir)
+            self.assertEqual(
+                [call.args[0] for call in youdaonote_api.iter_dir_entries.call_args_list],
+                ["root", "a"],
+            )
+            youdaonote_pull.manifest.close()
+
+    def test_resume_from_checkpoint(self):
+        """
+        测试中断后从断点继续导出
+        python test.py YoudaoNotePullTest.test_resume_from_checkpoint
+        """
+        tree = {
+            "root": [file_entry("a", True), file_entry("n1")],
+            "a": [file_entry("b", True), file_entry("n2")],
+            "b": [file_entry("n3")],
+        }
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(
+            side_effect=lambda dir_id: iter(tree[dir_id])
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            # 处理 n2 时中断
+            youdaonote_pull._add_or_update_file = Mock(
+                side_effect=lambda id, *args: 1 / 0 if id == "n2" else True
+            )
+            with self.assertRaises(ZeroDivisionError):
+                youdaonote_pull.pull("root")
+            youdaonote_pull.checkpoint.close()
+
+            # 从断点继续。期待：只遍历未遍历完的目录 a、b，只处理 n2、n3
+            youdaonote_api.iter_dir_entries.reset_mock()
+            youdaonote_pull._add_or_update_file = Mock()
+            youdaonote_pull.pull("root", resume=True)
+            self.assertEqual(
+                [call.args[0] for call in youdaonote_api.iter_dir_entries.call_args_list],
+                ["a", "b"],
+            )
+            self.assertEqual(
+                [call.args[0] for call in youdaonote_pull._add_or_update_file.call_args_list],
+                ["n2", "n3"],
+            )
+            # 导出完成后删除断点记录
+            self.assertFalse(os.path.exists(youdaonote_pull.checkpoint.path))
+
+    def test_resume_retries_failed_files(self):
+        """
+        测试处理失败的文件不记为已处理，保留断点记录，断点续传时重试
+        python test.py YoudaoNotePullTest.test_resume_retries_failed_files
+        """
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(
+            side_effect=lambda dir_id: iter([file_entry("n1"), file_entry("n2")])
+        )
+        youdaonote_api.get_file_by_id = Mock(return_value=Mock(content=b"# note"))
+        pulled = []
+
+        def pull_file(content, local_file_path, *args):
+            # n1 第一次下载图片时网络断开
+            file_name = os.path.basename(local_file_path)
+            pulled.append(file_name)
+            if file_name == "n1.md" and pulled.count(file_name) == 1:
+                raise requests.exceptions.ConnectionError("Connection reset")
+            return {}, False
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.root_local_dir = local_dir
+            youdaonote_pull.manifest = SyncManifest(local_dir)
+            youdaonote_pull._pull_file = Mock(side_effect=pull_file)
+            youdaonote_pull.pull("root")
+            # 期待：n1 未记为已处理，保留断点记录
+            self.assertEqual(sorted(pulled), ["n1.md", "n2.md"])
+            self.assertTrue(os.path.exists(youdaonote_pull.checkpoint.path))
+            self.assertNotIn("n1", youdaonote_pull.checkpoint.done_file_ids)
+
+            # 从断点继续。期待：只重试 n1，完成后删除断点记录
+            youdaonote_pull.metrics = PullMetrics()
+            youdaonote_pull.pull("root", resume=True)
+            self.assertEqual(pulled[2:], ["n1.md"])
+            self.assertFalse(os.path.exists(youdaonote_pull.checkpoint.path))
+            youdaonote_pull.manifest.close()
+
+    def test_resume_skips_done_files_in_pending_dirs(self):
+        """
+        测试断点续传时重新遍历未遍历完的目录，跳过其中已处理完的文件
+        python test.py YoudaoNotePullTest.test_resume_skips_done_files_in_pending_dirs
+        """
+        tree = {
+            "root": [file_entry("a", True), file_entry("n1")],
+            "a": [file_entry("n2"), file_entry("n3")],
+        }
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(
+            side_effect=lambda dir_id: iter(tree[dir_id])
+        )
+
+        for crawl_workers in (0, 2):
+            with self.subTest(crawl_workers=crawl_workers):
+                with tempfile.TemporaryDirectory() as local_dir:
+                    # 目录 a 未遍历完时中断，其中 n2 已处理完
+                    checkpoint = PullCheckpoint(local_dir)
+                    checkpoint.start("root", local_dir)
+                    checkpoint.dir_done(
+                        "root",
+                        [(tree["root"][0]["fileEntry"], local_dir + "/a")],
+                        [(tree["root"][1]["fileEntry"], local_dir)],
+                    )
+                    checkpoint.file_done("n1")
+                    checkpoint.file_done("n2")
+                    checkpoint.close()
+                    os.mkdir(os.path.join(local_dir, "a"))
+
+                    youdaonote_pull = YoudaoNotePull()
+                    youdaonote_pull.youdaonote_api = youdaonote_api
+                    youdaonote_pull.root_local_dir = local_dir
+                    youdaonote_pull.crawl_workers = crawl_workers
+                    youdaonote_pull.manifest = SyncManifest(local_dir)
+                    youdaonote_pull._add_or_update_file = Mock()
+                    youdaonote_pull.pull("root", resume=True)
+                    # 期待：只处理 a 中未处理完的 n3
+                    self.assertEqual(
+                        [
+                            call.args[0]
+                            for call in youdaonote_pull._add_or_update_file.call_args_list
+                        ],
+                        ["n3"],
+                    )
+                    self.assertFalse(os.path.exists(youdaonote_pull.checkpoint.path))
+                    youdaonote_pull.manifest.close()
+
+    def test_pull_dir_by_crawler(self):
+        """
+        测试并发遍历目录树
+        python test.py YoudaoNotePullTest.test_pull_dir_by_crawler
+        """
+        tree = {
+            "root": [file_entry("a", True), file_entry("n1")],
+            "a": [file_entry("b", True), file_entry("n2")],
+            "b": [file_entry("n3")],
+        }
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(
+            side_effect=lambda dir_id: iter(tree[dir_id])
+        )
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.crawl_workers = 3
+            youdaonote_pull._add_or_update_file = Mock()
+            youdaonote_pull.pull_dir_by_crawler([("root", local_dir, None)])
+
+            pulled = sorted(
+                (call.args[0], call.args[2])
+                for call in youdaonote_pull._add_or_update_file.call_args_list
+            )
+            self.assertEqual(
+                pulled,
+                [
+                    ("n1", local_dir),
+                    ("n2", local_dir + "/a"),
+                    ("n3", local_dir + "/a/b"),
+                ],
+            )
+            self.assertTrue(os.path.isdir(os.path.join(local_dir, "a", "b")))
+
+    def test_pull_dir_by_async_crawler(self):
+        """
+        测试设置 async_workers 时用异步 API 并发遍历目录树，使用替身 session，不需要安装 aiohttp
+        python test.py YoudaoNotePullTest.test_pull_dir_by_async_crawler
+        """
+        from urllib.parse import urlparse
+
+        from core.async_api import AsyncYoudaoNoteApi
+        from core.crawler import AsyncDirCrawler
+
+        tree = {
+            "root": [file_entry("a", True), file_entry("n1")],
+            "a": [file_entry("b", True), file_entry("n2")],
+            "b": [file_entry("n3")],
+        }
+        requested_urls = []
+
+        class FakeResponse(object):
+            def __init__(self, url):
+                self.url = url
+                self.status = 200
+                self.headers = {}
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                pass
+
+            async def read(self):
+                dir_id = urlparse(self.url).path.rsplit("/", 1)[-1]
+                return json.dumps({"entries": tree[dir_id]}).encode("utf-8")
+
+        class FakeSession(object):
+            def request(self, method, url, data=None):
+                requested_urls.append(url)
+                return FakeResponse(url)
+
+            async def close(self):
+                pass
+
+        async def fake_open(async_api):
+            async_api.session = FakeSession()
+            async_api._semaphore = asyncio.Semaphore(async_api.concurrency)
+
+        youdaonote_api = YoudaoNoteApi(cookies_path=TEST_COOKIES_PATH)
+        youdaonote_api.cstk = "fPk5IkDg"
+
+        with tempfile.TemporaryDirectory() as local_dir, patch.object(
+            AsyncYoudaoNoteApi, "open", fake_open
+        ):
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.async_workers = 3
+            youdaonote_pull._add_or_update_file = Mock()
+            self.assertIsInstance(youdaonote_pull._create_crawler(), AsyncDirCrawler)
+            youdaonote_pull.pull_dir_by_crawler([("root", local_dir, None)])
+
+            pulled = sorted(
+                (call.args[0], call.args[2])
+                for call in youdaonote_pull._add_or_update_file.call_args_list
+            )
+            self.assertEqual(
+                pulled,
+                [
+                    ("n1", local_dir),
+                    ("n2", local_dir + "/a"),
+                    ("n3", local_dir + "/a/b"),
+                ],
+            )
+            self.assertEqual(
+                sorted(urlparse(url).path.rsplit("/", 1)[-1] for url in requested_urls),
+                ["a", "b", "root"],
+            )
+            self.assertTrue(all("cstk=fPk5IkDg" in url for url in requested_urls))
+            self.assertEqual(youdaonote_pull.synced_dir_ids, {"a", "b"})
+
+    def test_pull_dir_by_crawler_error_before_first_job(self):
+        """
+        测试取队列前就出错（处理断点中未处理完的文件时出错），队列已满时不会卡住
+        python test.py YoudaoNotePullTest.test_pull_dir_by_crawler_error_before_first_job
+        """
+        entries = [file_entry("n{}".format(i)) for i in range(150)]
+        youdaonote_api = Mock()
+        youdaonote_api.iter_dir_entries = Mock(return_value=iter(entries))
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            youdaonote_pull = YoudaoNotePull()
+            youdaonote_pull.youdaonote_api = youdaonote_api
+            youdaonote_pull.crawl_workers = 1
+            youdaonote_pull.max_workers = 1
+            youdaonote_pull._add_or_update_file = Mock(side_effect=ZeroDivisionError)
+            pending_files = [(entries[0]["fileEntry"], local_dir)]
+            errors = []
+
+            def pull():
+                try:
+                    youdaonote_pull.pull_dir_by_crawler(
+                        [("root", local_dir, None)], pending_files
+                    )
+                except Exception as error:
+                    errors.append(error)
+
+            pull_thread = threading.Thread(target=pull, daemon=True)
+            pull_thread.start()
+            pull_thread.join(10)
+            # 期待：抛出错误，不会卡住
+            self.assertFalse(pull_thread.is_alive())
+            self.assertEqual(len(errors), 1)
+            self.assertIsInstance(errors[0], ZeroDivisionError)
+
+    def test_pull_from_fake_server(self):
+        """
+        测试从有道云笔记 API 本地替身完整导出
+        python test.py YoudaoNotePullTest.test_pull_from_fake_server
+        """
+        from argparse import Namespace
+
+        from benchmark.fake_server import FakeNoteTree, FakeYoudaoServer
+        from benchmark.pull_throughput import CONFIG_KEYS, run_pull, write_files
+
+        tree = FakeNoteTree(depth=1, dirs_per_dir=2, notes_per_dir=3, note_blocks=5)
+        server = FakeYoudaoServer(tree, throttle_rate=0.1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        args = Namespace(**dict.fromkeys(CONFIG_KEYS))
+        args.max_workers, args.max_retries = 2, 10
+        # 在子进程中转换，转换完成后在回调线程中迁移图片、写入
+        args.convert_workers = 2
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_path, cookies_path = write_files(work_dir, args)
+            # 期待：被限流时重试，9 篇笔记全部导出，图片全部迁移到本地
+            result = run_pull(server.base_url, config_path, cookies_path)
+            self.assertEqual(result["notes"], 9)
+            note_path = os.path.join(work_dir, "youdaonote", "目录 0", "posts", "笔记_0.md")
+            with open(note_path, encoding="utf-8") as f:
+                content = f.read()
+            self.assertNotIn("note.youdao.com", content)
+            self.assertEqual(content.count("assets_ori"), 2)
+            # 客户端统计的请求数与替身收到的一致
+            metrics = result["metrics"]
+            for endpoint in ("download", "listPageByParentId"):
+                for key in ("requests", "throttled"):
+                    self.assertEqual(
+                        metrics["endpoints"][endpoint][key],
+                        result["endpoints"][endpoint][key],
+                    )
+            self.assertEqual(metrics["stages"]["download_note"]["count"], 9)
+            self.assertEqual(metrics["counters"]["files"], 9)
+            self.assertEqual(
+                sum(
+                    stage["count"]
+                    for name, stage in metrics["stages"].items()
+                    if name.startswith("convert_")
+                ),
+                6,  # XML、Json 笔记各 3 篇，另 3 篇为 Markdown，不转换
+            )
+
+            # 再次导出。期待：云端未更新，不再下载笔记和图片
+            result = run_pull(server.base_url, config_path, cookies_path)
+            self.assertEqual(result["notes"], 0)
+            self.assertEqual(result["endpoints"]["res"]["requests"], 0)
+
+    def test_pull_with_progress(self):
+        """
+        测试输出进度：先遍历目录树统计文件总数，再下载
+        python test.py YoudaoNotePullTest.test_pull_with_progress
+        """
+        from argparse import Namespace
+
+        from benchmark.fake_server import FakeNoteTree, FakeYoudaoServer
+        from benchmark.pull_throughput import CONFIG_KEYS, run_pull, write_files
+
+        metrics = PullMetrics()
+        metrics.set_total_files(4)
+        self.assertIn("进度 0/4（0.0%", metrics.progress_line())
+        self.assertIn("预计剩余 未知", metrics.progress_line())
+        metrics.incr("files", 2)
+        self.assertIn("进度 2/4（50.0%", metrics.progress_line())
+
+        tree = FakeNoteTree(depth=1, dirs_per_dir=2, notes_per_dir=3, note_blocks=5)
+        server = FakeYoudaoServer(tree)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        args = Namespace(**dict.fromkeys(CONFIG_KEYS))
+        args.max_workers = 2
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_path, cookies_path = write_files(work_dir, args)
+            with self.assertLogs(level="INFO") as logs:
+                result = run_pull(server.base_url, config_path, cookies_path, 0.01)
+            # 期待：3 个目录各只请求一次目录信息，9 个文件全部处理，并输出带总数的进度
+            self.assertEqual(result["endpoints"]["listPageByParentId"]["requests"], 3)
+            self.assertEqual(result["metrics"]["total_files"], 9)
+            self.assertEqual(result["metrics"]["counters"]["files"], 9)
+            self.assertEqual(result["notes"], 9)
+            self.assertTrue(any("/9（" in line for line in logs.output))
+
+
+class OrderedTaskPoolTest(unittest.TestCase):
+    """
+    python test.py OrderedTaskPoolTest
+    """
+
+    def test_logs_in_submit_order(self):
+        """
+        测试并发任务日志按提交顺序输出
+        python test.py OrderedTaskPoolTest.test_logs_in_submit_order
+        """
+
+        def task(index):
+            # 先提交的任务后完成
+            time.sleep(0.01 * (5 - index))
+            logging.info("task %s", index)
+
+        with self.assertLogs(level="INFO") as captured:
+            with OrderedTaskPool(max_workers=5) as pool:
+                for index in range(5):
+                    pool.submit(task, index)
+        self.assertEqual(
+            captured.output, ["INFO:root:task {}".format(i) for i in range(5)]
+        )
+
+    def test_map_in_submit_order(self):
+        """
+        测试并发执行并按提交顺序返回结果
+        python test.py OrderedTaskPoolTest.test_map_in_submit_order
+        """
+
+        def task(index):
+            time.sleep(0.01 * (5 - index))
+            return index * 2
+
+        with OrderedTaskPool(max_workers=5) as pool:
+            self.assertEqual(pool.map(task, range(5)), [0, 2, 4, 6, 8])
+
+    def test_raise_task_error(self):
+        """
+        测试任务出错时抛出异常
+        python test.py OrderedTaskPoolTest.test_raise_task_error
+        """
+
+        def task():
+            raise ValueError("task error")
+
+        with self.assertRaises(ValueError):
+            with OrderedTaskPool(max_workers=2) as pool:
+                pool.submit(task)
+
+
+class ProcessTaskPoolTest(unittest.TestCase):
+    """
+    python test.py ProcessTaskPoolTest
+    """
+
+    def test_covert(self):
+        """
+        测试在子进程中转换笔记
+        python test.py ProcessTaskPoolTest.test_covert
+        """
+        with open("test/test.note", "rb") as f:
+            content = f.read()
+        with ProcessTaskPool(max_workers=2) as pool:
+            markdown, is_html = pool.run(covert_note_to_markdown, content, "xml")
+            _, is_legacy_html = pool.run(covert_note_to_markdown, b"<div>text<br></div>", "xml")
+        self.assertEqual(markdown, YoudaoNoteConvert.xml_to_markdown(content))
+        self.assertFalse(is_html)
+        self.assertTrue(is_legacy_html)
+
+    def test_recovers_from_broken_pool(self):
+        """
+        测试子进程异常退出后重建进程池重试一次，仍失败时任务失败，不在当前进程执行
+        python test.py ProcessTaskPoolTest.test_recovers_from_broken_pool
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir, ProcessTaskPool(
+            max_workers=1
+        ) as pool:
+            broken_executor = pool.executor
+            # 期待：第一次子进程退出，重建进程池后重试成功
+            marker_path = os.path.join(tmp_dir, "marker")
+            self.assertEqual(pool.run(exit_in_child_process, marker_path), marker_path)
+            self.assertIsNot(pool.executor, broken_executor)
+            # 每次都退出。期待：重试一次后任务失败
+            with self.assertRaises(BrokenProcessPool):
+                pool.run(exit_in_child_process)
+            # 重建后的进程池可以继续使用
+            self.assertEqual(pool.run(abs, -1), 1)
+
+    def test_submit_without_waiting(self):
+        """
+        测试提交任务不等待结果，回调在回调线程中执行，未完成的任务数达到 max_pending 时提交等待
+        python test.py ProcessTaskPoolTest.test_submit_without_waiting
+        """
+        with ProcessTaskPool(max_workers=2, max_pending=2) as pool:
+            start = time.perf_counter()
+            futures = [
+                pool.submit(
+                    time.sleep, 0.5, callback=lambda task: threading.current_thread().name
+                )
+                for _ in range(2)
+            ]
+            self.assertLess(time.perf_counter() - start, 0.4)
+            # 第 3 个任务需等前面的任务及其回调完成
+            futures.append(pool.submit(abs, -1))
+            self.assertGreaterEqual(time.perf_counter() - start, 0.5)
+            self.assertTrue(futures[0].done() or futures[1].done())
+            self.assertEqual(futures[2].result(), 1)
+            for future in futures[:2]:
+                self.assertTrue(future.result().startswith("convert-done"))
+
+
+class ImagePullTest(unittest.TestCase):
+    """
+    python test.py ImagePullTest
+    """
+
+    def test_dedup_images_across_notes(self):
+        """
+        测试多篇笔记中的相同图片只下载、保存一次
+        python test.py ImagePullTest.test_dedup_images_across_notes
+        """
+        png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+        image_url = "https://note.youdao.com/yws/res/1/WEBRESOURCEabc"
+
+        def http_get(url, stream=False, headers=None):
+            response = Mock(status_code=200, headers={"Content-Type": "image/png"}, url=url)
+            response.iter_content = Mock(return_value=iter([png]))
+            return response
+
+        youdaonote_api = Mock()
+        youdaonote_api.http_get = Mock(side_effect=http_get)
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            asset_store = AssetStore(os.path.join(local_dir, "assets_ori"))
+            image_pull = ImagePull(youdaonote_api, "", True, asset_store)
+            image_paths = []
+            for note_name in ("a", "b"):
+                note_path = os.path.join(local_dir, note_name + ".md").replace("\\", "/")
+                with open(note_path, "w", encoding="utf-8") as f:
+                    f.write("![]({})".format(image_url))
+                image_pull.migration_ydnote_url(note_path, local_dir)
+                image_paths.append(
+                    os.path.join(
+                        local_dir, "assets_ori", note_name, hashlib.md5(png).hexdigest() + ".png"
+                    )
+                )
+            asset_store.save()
+
+            # 第二篇笔记直接复用，不再下载
+            youdaonote_api.http_get.assert_called_once()
+            self.assertTrue(os.path.samefile(image_paths[0], image_paths[1]))
+
+            # 重新读取索引后也不再下载
+            asset_store = AssetStore(os.path.join(local_dir, "assets_ori"))
+            asset_store.load()
+            self.assertEqual(asset_store.get(image_url)["name"], os.path.basename(image_paths[0]))
+
+    def test_migrate_images_concurrently(self):
+        """
+        测试同一笔记中的图片并发下载，下载失败的图片保留原链接
+        python test.py ImagePullTest.test_migrate_images_concurrently
+        """
+        image_urls = [
+            "https://note.youdao.com/yws/res/1/WEBRESOURCE{}".format(i) for i in range(8)
+        ]
+        lock = threading.Lock()
+        running = [0, 0]  # [当前并发数, 最大并发数]
+
+        def http_get(url, stream=False, headers=None):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            if url == image_urls[0]:
+                return Mock(status_code=404, headers={})
+            response = Mock(status_code=200, headers={"Content-Type": "image/png"}, url=url)
+            response.iter_content = Mock(return_value=iter([url.encode()]))
+            return response
+
+        youdaonote_api = Mock()
+        youdaonote_api.http_get = Mock(side_effect=http_get)
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            image_pull = ImagePull(youdaonote_api, "", True, max_workers=4)
+            note_path = os.path.join(local_dir, "a.md").replace("\\", "/")
+            with open(note_path, "w", encoding="utf-8") as f:
+                f.write("\n".join("![]({})".format(url) for url in image_urls))
+            migrated_urls = image_pull.migration_ydnote_url(note_path, local_dir)
+
+            self.assertGreater(running[1], 1)
+            self.assertEqual(list(migrated_urls), image_urls[1:])
+            with open(note_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+            self.assertEqual(lines[0], "![]({})".format(image_urls[0]))
+            for url, line in zip(image_urls[1:], lines[1:]):
+                self.assertEqual(line, "![]({})".format(migrated_urls[url]))
+
+    def test_migrate_images_and_attachments_together(self):
+        """
+        测试图片、附件一起并发下载，附件下载时网络错误保留原链接
+        python test.py ImagePullTest.test_migrate_images_and_attachments_together
+        """
+        image_url = "https://note.youdao.com/yws/res/1/WEBRESOURCE1"
+        attach_url = "https://note.youdao.com/yws/res/2/WEBRESOURCE2"
+        broken_url = "https://note.youdao.com/yws/res/3/WEBRESOURCE3"
+        lock = threading.Lock()
+        running = [0, 0]  # [当前并发数, 最大并发数]
+
+        def http_get(url, stream=False, headers=None):
+            if url == broken_url:
+                raise requests.exceptions.ConnectionError("Connection reset")
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            content_type = "image/png" if url == image_url else "application/pdf"
+            response = Mock(status_code=200, headers={"Content-Type": content_type}, url=url)
+            response.iter_content = Mock(return_value=iter([url.encode()]))
+            return response
+
+        youdaonote_api = Mock()
+        youdaonote_api.http_get = Mock(side_effect=http_get)
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            image_pull = ImagePull(youdaonote_api, "", True, max_workers=4)
+            note_path = os.path.join(local_dir, "a.md").replace("\\", "/")
+            content = "![]({})\n[a.pdf]({})\n[b.pdf]({})".format(
+                image_url, attach_url, broken_url
+            )
+            content, migrated_urls = image_pull.migrate_content(content, note_path, local_dir)
+
+            # 期待：图片和附件同时下载；网络错误的附件保留原链接
+            self.assertEqual(running[1], 2)
+            self.assertEqual(list(migrated_urls), [image_url, attach_url])
+            self.assertEqual(content.split("\n")[2], "[b.pdf]({})".format(broken_url))
+
+    def test_rewrite_links(self):
+        """
+        测试一次遍历替换链接，正文中相同的文字不替换
+        python test.py ImagePullTest.test_rewrite_links
+        """
+        image_url = "https://note.youdao.com/yws/res/1/WEBRESOURCE1"
+        attach_url = "https://note.youdao.com/yws/res/2/WEBRESOURCE2"
+        content = (
+            "![]({image}) 见 {image}\n[a.pdf]({attach})\n![]({image})\n"
+            "![](https://note.youdao.com/yws/res/3/WEBRESOURCE3)"
+        ).format(image=image_url, attach=attach_url)
+        migrated_urls = {image_url: "<../assets_ori/a/1.png>", attach_url: "a.pdf"}
+        self.assertEqual(
+            ImagePull._rewrite_links(content, migrated_urls),
+            "![](<../assets_ori/a/1.png>) 见 {image}\n[a.pdf](a.pdf)\n"
+            "![](<../assets_ori/a/1.png>)\n"
+            "![](https://note.youdao.com/yws/res/3/WEBRESOURCE3)".format(image=image_url),
+        )
+
+    def test_update_note_reuses_cached_assets(self):
+        """
+        测试笔记更新时只下载新增的图片，删除不再引用的图片
+        python test.py ImagePullTest.test_update_note_reuses_cached_assets
+        """
+        images = {
+            "https://note.youdao.com/yws/res/1/WEBRESOURCE1": b"\x89PNG\r\n\x1a\n1",
+            "https://note.youdao.com/yws/res/1/WEBRESOURCE2": b"\x89PNG\r\n\x1a\n2",
+        }
+
+        def http_get(url, stream=False, headers=None):
+            response = Mock(
+                status_code=200,
+                headers={"Content-Type": "image/png", "ETag": '"v1"'},
+                url=url,
+            )
+            response.iter_content = Mock(return_value=iter([images[url]]))
+            return response
+
+        youdaonote_api = Mock()
+        youdaonote_api.http_get = Mock(side_effect=http_get)
+        url_1, url_2 = images
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            asset_store = AssetStore(os.path.join(local_dir, "assets_ori"))
+            image_pull = ImagePull(youdaonote_api, "", True, asset_store)
+            note_path = os.path.join(local_dir, "a.md").replace("\\", "/")
+            note_assets_dir = os.path.join(local_dir, "assets_ori", "a")
+            with open(note_path, "w", encoding="utf-8") as f:
+                f.write("![]({})".format(url_1))
+            image_pull.migration_ydnote_url(note_path, local_dir)
+            self.assertEqual(asset_store.get(url_1)["etag"], '"v1"')
+
+            # 更新后：图片 1 换为图片 2。期待：只下载图片 2，删除图片 1
+            with open(note_path, "w", encoding="utf-8") as f:
+                f.write("![]({})".format(url_2))
+            image_pull.migration_ydnote_url(note_path, local_dir)
+            self.assertEqual(youdaonote_api.http_get.call_count, 2)
+            self.assertEqual(
+                os.listdir(note_assets_dir), [hashlib.md5(images[url_2]).hexdigest() + ".png"]
+            )
+
+            # 再换回图片 1。期待：使用缓存，不再下载
+            with open(note_path, "w", encoding="utf-8") as f:
+                f.write("![]({})".format(url_1))
+            image_pull.migration_ydnote_url(note_path, local_dir)
+            self.assertEqual(youdaonote_api.http_get.call_count, 2)
+            self.assertEqual(
+                os.listdir(note_assets_dir), [hashlib.md5(images[url_1]).hexdigest() + ".png"]
+            )
+
+            # 缓存较旧时带 ETag 确认，服务端返回 304。期待：不重新下载内容
+            asset_store.urls[url_2]["checked_at"] = 0
+            youdaonote_api.http_get = Mock(return_value=Mock(status_code=304))
+            with open(note_path, "w", encoding="utf-8") as f:
+                f.write("![]({})".format(url_2))
+            image_pull.migration_ydnote_url(note_path, local_dir)
+            youdaonote_api.http_get.assert_called_once_with(
+                url_2, stream=True, headers={"If-None-Match": '"v1"'}
+            )
+            self.assertGreater(asset_store.urls[url_2]["checked_at"], 0)
+            asset_store.close()
+
+    def test_evict_least_recently_used(self):
+        """
+        测试缓存超过上限时淘汰最久未使用的文件
+        python test.py ImagePullTest.test_evict_least_recently_used
+        """
+        with tempfile.TemporaryDirectory() as local_dir:
+            asset_store = AssetStore(os.path.join(local_dir, "assets_ori"), max_size=10)
+            for index in range(3):
+                tmp_path = os.path.join(asset_store.get_temp_dir(), "tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(str(index).encode() * 6)
+                object_path = asset_store.add(tmp_path, "{:032d}".format(index), ".png")
+                asset_store.put("url_{}".format(index), object_path, "{}.png".format(index))
+                asset_store.urls["url_{}".format(index)]["used_at"] = index
+            asset_store.set_uploaded("url_0", "https://sm.ms/0.png")
+            asset_store.save()
+
+            # 每个文件 6 字节，上限 10 字节。期待：只保留最近使用的 url_2
+            self.assertIsNone(asset_store.get("url_0"))
+            self.assertIsNone(asset_store.get("url_1"))
+            self.assertTrue(asset_store.get("url_2"))
+            # 已上传到 SM.MS 的链接保留
+            self.assertEqual(asset_store.get_uploaded("url_0"), "https://sm.ms/0.png")
+
+    def test_asset_walks_skip_objects_dir(self):
+        """
+        测试遍历、清理资源目录时跳过全局资源存储 _objects
+        python test.py ImagePullTest.test_asset_walks_skip_objects_dir
+        """
+        from rename_images_by_md5 import rename_images_by_md5
+
+        with tempfile.TemporaryDirectory() as local_dir:
+            assets_dir = os.path.join(local_dir, "assets_ori")
+            for rel_path in ("a/1.png", "_objects/ab/ab12.png"):
+                path = os.path.join(assets_dir, rel_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(b"png")
+
+            output_dir = os.path.join(local_dir, "assets_md5")
+            with patch("builtins.print"):
+                rename_images_by_md5(assets_dir, output_dir)
+            # 期待：只处理笔记资源目录中的图片
+            self.assertEqual(os.listdir(output_dir), ["a"])
+
+            # 笔记名与 _objects 相同时，资源目录加上后缀
+            note_path = os.path.join(local_dir, "posts", "_objects.md").replace("\\", "/")
+            self.assertEqual(
+                ImagePull._get_local_file_dir(note_path, local_dir),
+                local_dir.replace("\\", "/") + "/assets_ori/_objects_",
+            )
+
 
 if __name__ == "__main__":
     unittest.main()